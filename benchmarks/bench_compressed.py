@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the throughput of reading gzip and zstd compressed traces
+compared to the uncompressed trace, parsing the whole trace with polars as
+when building the trace cache, and decoding the lines as the viewer does,
+reading text and reading chunks of bytes ahead in a thread.
+
+Throughput is in MB/s of uncompressed csv.
+"""
+
+import argparse
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+import pyarrow
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from trace_cache import scan_csv_typed
+from trace_follow import prefetch, read_batches, read_chunks, split_lines
+import trace_schema
+
+
+TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, 'testdata',
+                        'nso5.8-devices-sync-from-677.csv')
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--rows', type=int, default=1000000,
+            help='Number of rows of the trace.')
+    parser.add_argument('--trace', type=str, default=TESTDATA,
+            help='Trace to repeat.')
+    return parser.parse_args(args)
+
+
+def write_traces(directory, trace, rows):
+    with open(trace) as f:
+        header = f.readline()
+        lines = f.readlines()
+    repeat = max(1, rows//len(lines))
+    data = (header + ''.join(lines)*repeat).encode()
+    plain = os.path.join(directory, 'trace.csv')
+    with open(plain, 'wb') as f:
+        f.write(data)
+    with gzip.open(plain+'.gz', 'wb', compresslevel=6) as f:
+        f.write(data)
+    with pyarrow.output_stream(plain+'.zst', compression='zstd') as f:
+        f.write(data)
+    return len(data), [plain, plain+'.gz', plain+'.zst']
+
+
+def parse(filename):
+    return len(scan_csv_typed(filename).collect())
+
+
+def decode(filename, ahead):
+    if ahead:
+        batches = split_lines(prefetch(read_chunks(
+            trace_schema.open_binary(filename))))
+    else:
+        batches = read_batches(trace_schema.open_trace(filename,
+                                                       newline=None))
+    n = 0
+    decoder = trace_schema.Decoder()
+    for batch in batches:
+        for row in decoder.rows(batch):
+            n += 1
+    return n
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter()-start
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        size, files = write_traces(directory, args.trace, args.rows)
+        print(f"{size/1e6:.0f} MB uncompressed")
+        print(f"{'file':<12} {'size MB':>8} {'polars':>10} {'lines':>10} "+
+              f"{'prefetch':>10}")
+        for f in files:
+            polars = size/1e6/measure(parse, f)
+            lines = size/1e6/measure(decode, f, False)
+            ahead = size/1e6/measure(decode, f, True)
+            print(f"{os.path.basename(f):<12} "+
+                  f"{os.path.getsize(f)/1e6:8.1f} {polars:7.0f} MB/s "+
+                  f"{lines:5.0f} MB/s {ahead:5.0f} MB/s")
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
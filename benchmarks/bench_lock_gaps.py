@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the vectorized lock gap analysis of summarize_events against the
+previous row by row implementation, checking that the results match.
+
+A trace with lock events is synthesized, where a share of the transactions
+overlap the previous lock or release without holding it.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+import summarize_events
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--locks', type=int, default=100000,
+            help='Number of locks.')
+    parser.add_argument('--overlap', type=float, default=0.01,
+            help='Share of locks overlapping the previous lock.')
+    return parser.parse_args(args)
+
+
+def sum_duration_between_locks_5(htl_events):
+    bt_ts = []
+    bt_dur = []
+    start = None
+    end = None
+    overlap_tids = []
+    for i, ev in htl_events.sort_values('TIMESTAMP').iterrows():
+        ts = ev['TIMESTAMP']
+        tid = ev['TRANSACTION ID']
+        if ev['EVENT TYPE'] == 'stop':
+            start = ts
+            overlap_tids.append(tid)
+            if len(overlap_tids) == 1:
+                if end:
+                    bt_ts.append(ts)
+                    bt_dur.append((ts-end).total_seconds())
+                    end = None
+            else:
+                print("Overlapping events, count as 0 sec gap.", overlap_tids)
+        elif ev['EVENT TYPE'] == 'info' and start is not None:
+            if tid in overlap_tids:
+                overlap_tids.remove(tid)
+                if len(overlap_tids) == 0:
+                    end = ts
+            htl_events.at[i, 'DURATION'] = (ts-start).total_seconds()
+    return pandas.DataFrame(index=bt_ts, data={'DURATION': bt_dur})
+
+
+def sum_duration_between_locks_6(htl_events):
+    bt_ts = []
+    bt_dur = []
+    end = None
+    overlap_tids = []
+    for _, ev in htl_events.sort_values('TIMESTAMP').iterrows():
+        ts = ev['TIMESTAMP']
+        tid = ev['TRANSACTION ID']
+        if ev['EVENT TYPE'] == 'start':
+            overlap_tids.append(tid)
+            if len(overlap_tids) == 1:
+                if end:
+                    bt_ts.append(ts)
+                    bt_dur.append((ts-end).total_seconds())
+                    end = None
+            else:
+                print("Overlapping events, count as 0 sec gap.", overlap_tids)
+        elif ev['EVENT TYPE'] == 'stop':
+            if tid in overlap_tids:
+                overlap_tids.remove(tid)
+                if len(overlap_tids) == 0:
+                    end = ts
+    return pandas.DataFrame(index=bt_ts, data={'DURATION': bt_dur})
+
+
+def lock_events(n, overlap, acquire, release):
+    rng = numpy.random.default_rng(1)
+    begin = numpy.cumsum(rng.integers(1000, 50000, n))
+    hold = rng.integers(500, 5000, n)
+    overlapping = rng.random(n) < overlap
+    begin[1:][overlapping[1:]] -= hold[:-1][overlapping[1:]]
+    tids = numpy.arange(n)
+    # Releases of transactions not holding the lock
+    stray = rng.choice(n, max(1, n//100))
+    ts = numpy.concatenate([begin, begin+hold, begin[stray]+1])
+    types = [acquire]*n + [release]*n + [release]*len(stray)
+    tid = numpy.concatenate([tids, tids, (tids[stray]+1) % n])
+    return pandas.DataFrame({
+        'EVENT TYPE': types,
+        'TIMESTAMP': pandas.to_datetime(ts+1.7e15, unit='us'),
+        'DURATION': numpy.nan,
+        'TRANSACTION ID': tid,
+    })
+
+
+def run(func, events):
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        result = func(events)
+    return time.perf_counter()-start, result, out.getvalue()
+
+
+def compare(name, old_func, new_func, events):
+    old_events = events.copy()
+    new_events = events.copy()
+    old_time, old, old_out = run(old_func, old_events)
+    new_time, new, new_out = run(new_func, new_events)
+    same = (old.index.equals(new.index) and
+            numpy.allclose(old['DURATION'], new['DURATION']) and
+            old_out == new_out and
+            old_events['DURATION'].equals(new_events['DURATION']))
+    print(f"{name:<8} {len(events):>10} events  row by row {old_time:8.2f} s"+
+          f"  vectorized {new_time:8.3f} s  {old_time/new_time:8.1f}x  "+
+          f"{'same' if same else 'DIFFERENT'}")
+
+
+def main(args):
+    compare('nso 5', sum_duration_between_locks_5,
+            summarize_events.sum_duration_between_locks_5,
+            lock_events(args.locks, args.overlap, 'stop', 'info'))
+    compare('nso 6', sum_duration_between_locks_6,
+            summarize_events.sum_duration_between_locks_6,
+            lock_events(args.locks, args.overlap, 'start', 'stop'))
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
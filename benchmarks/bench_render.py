@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the per event cost of updating the viewer spans as the number of
+spans grows, comparing span_view.SpanView with the previous approach of
+updating the size of every bar and the end of every running bar on each
+event.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from rich.bar import Bar
+from rich.text import Text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from span_view import SpanView
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--spans', type=int, nargs='+',
+            default=[1000, 10000, 100000],
+            help='Number of spans to measure the event cost at.')
+    parser.add_argument('-n', '--events', type=int, default=1000,
+            help='Number of events measured at each number of spans.')
+    parser.add_argument('--old-max', type=int, default=4000,
+            help='Largest number of spans to measure the previous '+
+                 'approach at, its cost grows quadratically.')
+    return parser.parse_args(args)
+
+
+class OldView():
+    # Colors picked as by SpanView
+    new_color = SpanView.new_color
+
+    def __init__(self):
+        self.begin = 0.0
+        self.spans = {}
+        self.spans_running = {}
+        self.color_numbers = []
+
+    def event(self, tag, ts, duration, tid, text, key):
+        if self.begin == 0.0:
+            self.begin = ts
+        size = ts-self.begin
+        if tag == 'start':
+            span = Bar(begin=size, end=size, size=size, color=self.new_color())
+            self.spans_running[key] = span
+            self.spans[key] = span, Text('')
+        elif tag == 'stop' and key in self.spans:
+            s, d = self.spans[key]
+            d.append(f'{duration*1000:0.3f}')
+            s.end = size
+            self.spans_running.pop(key, None)
+        for s, d in self.spans.values():
+            s.size = size
+        for s in self.spans_running.values():
+            s.end = size
+
+
+def events(start, count):
+    '''Start a span in a new transaction and stop every other one.'''
+    for i in range(start, start+count):
+        tid = str(i)
+        key = f'{tid}-sync-from'
+        ts = 1.0+i*0.001
+        yield 'start', ts, 0.0, tid, 'sync-from', key
+        if i % 2:
+            yield 'stop', ts, 0.001, tid, 'sync-from', key
+
+
+def measure(view, spans, n):
+    results = []
+    done = 0
+    for target in spans:
+        for e in events(done, target-done):
+            view.event(*e)
+        done = target
+        start = time.perf_counter()
+        for e in events(done, n):
+            view.event(*e)
+        elapsed = time.perf_counter() - start
+        done += n
+        results.append(elapsed/n*1e6)
+    return results
+
+
+def main(args):
+    spans = sorted(args.spans)
+    new = measure(SpanView(), spans, args.events)
+    old = measure(OldView(), [n for n in spans if n <= args.old_max],
+                  args.events)
+    print(f"{'spans':>10} {'incremental':>14} {'previous':>14}")
+    for i, n in enumerate(spans):
+        prev = f'{old[i]:10.1f} us' if i < len(old) else ''
+        print(f"{n:>10} {new[i]:10.1f} us {prev:>14}")
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
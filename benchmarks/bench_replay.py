@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark seeking in a replay of the viewer, comparing restoring the
+checkpoints of trace_replay.Replay with applying all events from the start
+of the trace up to the timestamp seeked to.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from span_view import SpanView
+from trace_replay import CHECKPOINT_EVENTS, Replay
+
+
+MESSAGES = ['applying transaction', 'connect',
+            'run validation over the changeset', 'sync-from']
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--events', type=int, default=1000000,
+            help='Number of events of the replayed trace.')
+    parser.add_argument('-i', '--interval', type=int,
+            default=CHECKPOINT_EVENTS,
+            help='Number of events between checkpoints.')
+    parser.add_argument('-s', '--seeks', type=float, nargs='+',
+            default=[0.1, 0.33, 0.66, 0.99],
+            help='Positions to seek to, as fractions of the trace.')
+    return parser.parse_args(args)
+
+
+def events(count):
+    '''Spans of transactions of one span per message, starting a
+    transaction every millisecond.
+    '''
+    for i in range(count//2):
+        tid = str(1000 + i//len(MESSAGES))
+        text = MESSAGES[i % len(MESSAGES)]
+        key = f'{tid}-{text}'
+        ts = 1.0+i*0.001
+        yield 'start', ts, 0.0, tid, text, key
+        yield 'stop', ts+0.0005, 0.0005, tid, text, key
+
+
+def main(args):
+    start = time.perf_counter()
+    replay = Replay(SpanView(), interval=args.interval)
+    for e in events(args.events):
+        replay.add(e)
+    load = time.perf_counter()-start
+    print(f"Loaded {len(replay.events)} events with "+
+          f"{len(replay.checkpoints)} checkpoints in {load:0.2f} s")
+
+    first, last = replay.times[0], replay.times[-1]
+    print(f"{'seek':>6} {'checkpoint':>12} {'from start':>12}")
+    for seek in args.seeks:
+        ts = first+(last-first)*seek
+        replay.seek(first)
+        start = time.perf_counter()
+        replay.seek(ts)
+        restored = time.perf_counter()-start
+
+        view = SpanView()
+        start = time.perf_counter()
+        for e, t in zip(replay.events, replay.times):
+            if t > ts:
+                break
+            view.event(*e)
+        scratch = time.perf_counter()-start
+        print(f"{seek:>6.0%} {restored*1000:9.1f} ms {scratch*1000:9.1f} ms")
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
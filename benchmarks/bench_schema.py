@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark decoding progress trace rows with trace_schema against the per
+line csv parsing and column count switch previously done by the viewer.
+
+The rows of the test data files are repeated to the requested number of rows.
+"""
+
+import argparse
+import csv
+import glob
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+import trace_schema
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', type=str, nargs='*',
+            help='Files to scale up, default all test data.')
+    parser.add_argument('-n', '--rows', type=int, default=10_000_000,
+            help='Number of rows to decode.')
+    return parser.parse_args(args)
+
+
+def scaled_lines(files, rows):
+    header = None
+    data = []
+    for filename in files:
+        with open(filename, 'r') as f:
+            lines = f.readlines()
+        header = lines[0]
+        data.extend(lines[1:])
+    return itertools.chain([header], itertools.islice(itertools.cycle(data),
+                                                      rows))
+
+
+def decode_per_line(lines):
+    header = None
+    for line in lines:
+        l = list(csv.reader([line]))[0]
+        if len(l) == 17:
+            have_trace_id = -6
+            have_span_id = 3
+        elif len(l) == 18:
+            have_trace_id = -1
+            have_span_id = 0
+        elif len(l) == 19:
+            have_trace_id = 0
+            have_span_id = 0
+        elif len(l) == 21:
+            have_trace_id = 2
+            have_span_id = 3
+        if header is None:
+            if l[0] == 'EVENT TYPE':
+                header = l
+                continue
+            else:
+                header = 'No header.'
+        tid = l[4+have_span_id]
+        yield (l[0], l[1], l[2], tid, l[5+have_span_id], l[17+have_trace_id],
+               '-'.join([tid]+l[11+have_trace_id:18+have_trace_id]))
+
+
+def run(name, decoder, files, rows):
+    start = time.perf_counter()
+    n = 0
+    for _ in decoder(scaled_lines(files, rows)):
+        n += 1
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {n:>12} rows {elapsed:10.2f} s "+
+          f"{n/elapsed/1e6:8.2f} Mrows/s")
+    return elapsed
+
+
+def main(args):
+    files = args.files or sorted(glob.glob(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), os.pardir, 'testdata',
+        '*.csv')))
+    old = run('per line', decode_per_line, files, args.rows)
+    new = run('schema', trace_schema.decode_rows, files, args.rows)
+    print(f"speedup      {old/new:.2f}x")
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
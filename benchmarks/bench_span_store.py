@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the memory per span of the viewer spans, comparing the
+span_view.SpanStore arrays with the previous approach of a Span object per
+span and a dict of span keys to Span objects. All spans are kept, as with a
+history larger than the trace, and the memory is measured with tracemalloc.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from span_view import SpanView
+
+
+MESSAGES = ['applying transaction', 'grabbing transaction lock',
+            'run validation over the changeset', 'sync-from',
+            'connect', 'show', 'creating rollback file']
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--spans', type=int, nargs='+',
+            default=[1000000],
+            help='Number of spans to measure the memory of.')
+    return parser.parse_args(args)
+
+
+class Span():
+    __slots__ = ['text', 'tid', 'key', 'begin', 'stop', 'duration', 'color']
+
+    def __init__(self, text, tid, key, begin, color):
+        self.text = text
+        self.tid = tid
+        self.key = key
+        self.begin = begin
+        self.stop = None
+        self.duration = ''
+        self.color = color
+
+
+class OldView():
+    # Colors picked as by SpanView
+    new_color = SpanView.new_color
+
+    def __init__(self):
+        self.begin = 0.0
+        self.size = 0.0
+        self.rows = []
+        self.spans = {}
+        self.tids_color = {}
+        self.color_numbers = []
+
+    def event(self, tag, ts, duration, tid, text, key):
+        if self.begin == 0.0:
+            self.begin = ts
+        self.size = ts-self.begin
+        if tag == 'start':
+            if tid not in self.tids_color:
+                self.tids_color[tid] = self.new_color()
+            span = Span(text, tid, key, self.size, self.tids_color[tid])
+            self.spans[key] = span
+            self.rows.append(span)
+        elif tag == 'stop' and key in self.spans:
+            s = self.spans[key]
+            s.duration += f'{duration*1000:0.3f}'
+            s.stop = self.size
+
+
+def events(count):
+    '''Spans of transactions of one span per message, with new strings for
+    each event as split from the lines of a trace.
+    '''
+    for i in range(count):
+        tid = 100000 + i//len(MESSAGES)
+        text = MESSAGES[i % len(MESSAGES)]
+        ts = 1.0+i*0.001
+        line = f'{tid},{text},{tid}-running----{text}'
+        for tag, duration in [('start', 0.0), ('stop', 0.0005)]:
+            tid, text, key = line.split(',')
+            yield tag, ts+duration, duration, tid, text, key
+
+
+def measure(new_view, n):
+    tracemalloc.start()
+    start = time.perf_counter()
+    view = new_view()
+    for e in events(n):
+        view.event(*e)
+    elapsed = time.perf_counter()-start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size/n, elapsed
+
+
+def main(args):
+    print(f"{'spans':>10} {'store':>15} {'previous':>15} "+
+          f"{'store time':>12} {'previous time':>14}")
+    for n in args.spans:
+        new, new_time = measure(lambda: SpanView(history=n), n)
+        old, old_time = measure(OldView, n)
+        print(f"{n:>10} {new:8.1f} B/span {old:8.1f} B/span "+
+              f"{new_time:10.2f} s {old_time:12.2f} s")
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the startup time of ptrace.py commands, the best wall time of a
+number of runs, and list the modules taking the most time to import with
+python -X importtime.
+
+Commands are run without a server, and sent to a ptrace.py server started
+on a temporary socket.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+PTRACE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, 'ptrace_script')
+TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, 'testdata',
+                        'nso5.8-devices-sync-from-677.csv')
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=10,
+            help='Number of runs of each command.')
+    parser.add_argument('-i', '--imports', type=int, default=10,
+            help='Number of slowest imports to list.')
+    parser.add_argument('--trace', type=str, default=TESTDATA,
+            help='Trace to run the commands on.')
+    return parser.parse_args(args)
+
+
+def commands(trace):
+    return [['-h'],
+            ['-f', trace, 'filter_trans_id', '-t', '44211'],
+            ['-f', trace, 'calc_event_stats']]
+
+
+def ptrace(argv, env, options=[]):
+    return subprocess.run([sys.executable, *options, 'ptrace.py', *argv],
+                          cwd=PTRACE_DIR, env=env, capture_output=True,
+                          text=True, check=True)
+
+
+def best_time(func, *args, runs=1):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter()-start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def slowest_imports(argv, env, n):
+    '''Return the cumulative import time in seconds of the modules imported
+    by ptrace.py and by the modules it imports, the slowest first.
+    '''
+    imports = []
+    for line in ptrace(argv, env, ['-X', 'importtime']).stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Two spaces of indent per level of nested imports
+        depth = (len(name)-len(name.lstrip()))//2
+        if depth <= 1:
+            imports.append((int(cumulative)/1e6, name.rstrip()[1:]))
+    return sorted(imports, reverse=True)[:n]
+
+
+def wait_for(path, server):
+    while not os.path.exists(path):
+        if server.poll() is not None:
+            sys.exit("The ptrace.py server exited")
+        time.sleep(0.05)
+
+
+def main(args):
+    python = best_time(subprocess.run, [sys.executable, '-c', 'pass'],
+                       runs=args.runs)
+    print(f"{'python -c pass':<32} {python*1e3:6.0f} ms")
+
+    local = dict(os.environ, PTRACE_SOCKET='')
+    for argv in commands(args.trace):
+        name = ' '.join(a for a in argv if a != args.trace)
+        elapsed = best_time(ptrace, argv, local, runs=args.runs)
+        print(f"{name:<32} {elapsed*1e3:6.0f} ms")
+        for seconds, module in slowest_imports(argv, local, args.imports):
+            print(f"    {module:<28} {seconds*1e3:6.0f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ptrace.sock')
+        served = dict(os.environ, PTRACE_SOCKET=path)
+        server = subprocess.Popen([sys.executable, 'ptrace.py', 'serve',
+                                   args.trace], cwd=PTRACE_DIR, env=served,
+                                  stdout=subprocess.DEVNULL)
+        try:
+            wait_for(path, server)
+            print("served")
+            for argv in commands(args.trace)[1:]:
+                name = ' '.join(a for a in argv if a != args.trace)
+                elapsed = best_time(ptrace, argv, served, runs=args.runs)
+                print(f"{name:<32} {elapsed*1e3:6.0f} ms")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark reading a window of time of a trace, using the sparse time index
+of the csv file and the row groups of the trace cache, compared to parsing
+the whole csv file and filtering it, checking that the results match.
+
+The trace is made by repeating a trace shifted in time.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import polars as pl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+import trace_cache
+
+
+TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, 'testdata',
+                        'nso5.8-devices-sync-from-677.csv')
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--rows', type=int, default=1000000,
+            help='Number of rows of the trace.')
+    parser.add_argument('-w', '--window', type=float, default=0.01,
+            help='Share of the time of the trace to read.')
+    parser.add_argument('--trace', type=str, default=TESTDATA,
+            help='Trace to repeat.')
+    return parser.parse_args(args)
+
+
+def write_trace(filename, trace, rows):
+    pt = pl.read_csv(trace, infer_schema=False)
+    ts = pl.col('TIMESTAMP').str.to_datetime(time_unit='us')
+    period = pt.select(ts.max()-ts.min()).item()
+    repeat = max(1, rows//len(pt))
+    pl.concat([pt.with_columns((ts+period*i).dt.strftime(
+        '%Y-%m-%dT%H:%M:%S%.6f').alias('TIMESTAMP'))
+               for i in range(repeat)]).write_csv(filename)
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter()-start, result
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'trace.csv')
+        write_trace(filename, args.trace, args.rows)
+        ts = trace_cache.scan_csv_typed(filename).select(
+            pl.col('TIMESTAMP').min().alias('BEGIN'),
+            pl.col('TIMESTAMP').max().alias('END')).collect()
+        first, last = ts['BEGIN'][0], ts['END'][0]
+        begin = first+(last-first)*0.5
+        end = begin+(last-first)*args.window
+        print(f"{os.path.getsize(filename)/1e6:.0f} MB, "+
+              f"window {begin} to {end}")
+
+        full, expected = measure(lambda: trace_cache.scan_csv_typed(
+            filename).filter(trace_cache.in_range(begin, end)).collect())
+        index, _ = measure(trace_cache.load_time_index, filename)
+        indexed, rows = measure(lambda: trace_cache.scan_trace(
+            filename, begin, end).collect())
+        trace_cache.build_cache(filename)
+        cached, cache_rows = measure(lambda: trace_cache.scan_trace(
+            filename, begin, end).collect())
+        same = rows.equals(expected) and cache_rows.equals(expected)
+        print(f"{len(expected)} rows  csv scan {full:.3f} s  "+
+              f"time index {indexed:.3f} s (built in {index:.3f} s)  "+
+              f"cache {cached:.3f} s  {'same' if same else 'DIFFERENT'}")
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
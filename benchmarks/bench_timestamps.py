@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark decoding NSO timestamps to microseconds since the epoch, with
+datetime.fromisoformat per timestamp as the viewer did, with pandas and
+polars parsing the format, and with the vectorized decoder of trace_time
+from a numpy array and from a list of strings, checking that the results
+match.
+"""
+
+import argparse
+from datetime import datetime, timezone
+import os
+import sys
+import time
+
+import numpy
+import pandas
+import polars as pl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from trace_time import decode_timestamps
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--timestamps', type=int, default=10000000,
+            help='Number of timestamps.')
+    return parser.parse_args(args)
+
+
+def timestamps(n):
+    rng = numpy.random.default_rng(1)
+    us = 1683056740000000 + numpy.cumsum(rng.integers(0, 2000, n))
+    return us, numpy.datetime_as_string(us.view('datetime64[us]'),
+                                        unit='us')
+
+
+def fromisoformat(values):
+    return numpy.array([
+        round(datetime.fromisoformat(v).replace(
+            tzinfo=timezone.utc).timestamp()*1e6) for v in values],
+        dtype=numpy.int64)
+
+
+def pandas_format(values):
+    return pandas.to_datetime(pandas.Series(values),
+                              format='%Y-%m-%dT%H:%M:%S.%f').to_numpy(
+        dtype='datetime64[us]').view(numpy.int64)
+
+
+def polars_format(values):
+    return values.str.to_datetime('%Y-%m-%dT%H:%M:%S%.f',
+                                  time_unit='us').dt.epoch('us').to_numpy()
+
+
+def measure(func, values):
+    start = time.perf_counter()
+    result = func(values)
+    return time.perf_counter()-start, result
+
+
+def main(args):
+    expected, values = timestamps(args.timestamps)
+    strings = values.tolist()
+    series = pl.Series(values)
+    print(f"{len(values)} timestamps")
+    for name, func, data in [
+            ('fromisoformat', fromisoformat, strings),
+            ('pandas', pandas_format, strings),
+            ('polars', polars_format, series),
+            ('decode array', decode_timestamps, values),
+            ('decode list', decode_timestamps, strings)]:
+        elapsed, result = measure(func, data)
+        same = numpy.array_equal(result, expected)
+        print(f"{name:<14} {elapsed:8.2f} s {len(values)/elapsed/1e6:8.1f} "+
+              f"M/s  {'same' if same else 'DIFFERENT'}")
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
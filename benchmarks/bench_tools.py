@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark every tool on synthetic traces of a number of sizes, timing the
+viewer, the pandas scripts and the ptrace.py commands and measuring their
+peak memory.
+
+Traces are generated with gen_trace.py into a data directory and reused by
+later runs. The generator and each tool run in a process of their own, as a
+forked process counts the memory of its parent in its peak. Tools are run
+without a ptrace.py server and by default with the trace cache as a user
+would run them, so the first tool of a size also builds the cache. Tools
+needing columns that the layout doesn't have are skipped.
+
+Results are appended to a JSON lines file, one line per tool and size, and
+compared to the previous result of the same tool, size and layout, marking
+changes slower or larger than a threshold.
+"""
+
+import argparse
+import csv
+from datetime import datetime, timezone
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from trace_schema import LAYOUTS
+
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir)
+PTRACE_DIR = os.path.join(ROOT_DIR, 'ptrace_script')
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+GENERATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'gen_trace.py')
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                       'results.jsonl')
+
+# Tools as (name, directory, arguments, columns the trace must have).
+# {trace}, {tid}, {span} and {nso5} are replaced by the trace, a
+# transaction id and a span id of the trace, and -5 for NSO 5 layouts.
+TOOLS = [
+    ('viewer', ROOT_DIR,
+     ['ncs_progress_trace_viewer.py', '--rows', '50', '{trace}'], []),
+    ('viewer --batch', ROOT_DIR,
+     ['ncs_progress_trace_viewer.py', '--batch', '--rows', '50', '{trace}'],
+     []),
+    ('calc_events_stats', ROOT_DIR,
+     ['calc_events_stats.py', '{trace}'], []),
+    ('list_events', ROOT_DIR, ['list_events.py', '{trace}'], []),
+    ('list_tids', ROOT_DIR, ['list_tids.py', '{trace}'], []),
+    ('list_events_duration', ROOT_DIR,
+     ['list_events_duration.py', '{trace}'], ['DEVICE']),
+    ('show_overlap', ROOT_DIR,
+     ['show_overlap.py', '{trace}', 'sync-from'], []),
+    ('summarize_events', ROOT_DIR,
+     ['summarize_events.py', '{nso5}', '{trace}'], []),
+    ('summarize_events --stream', ROOT_DIR,
+     ['summarize_events.py', '--stream', '{nso5}', '{trace}'], []),
+    ('ptrace calc_event_stats', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'calc_event_stats'], []),
+    ('ptrace filter_trans_id', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'filter_trans_id', '-t', '{tid}'], []),
+    ('ptrace list_events', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'list_events'], []),
+    ('ptrace list_longest_spans', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'list_longest_spans', '-e',
+      'sync-from'], []),
+    ('ptrace list_root_traces', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'list_root_traces'],
+     ['PARENT SPAN ID', 'ATTRIBUTE NAME']),
+    ('ptrace show_overlap', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'show_overlap', '-e', 'sync-from'], []),
+    ('ptrace overlap_index', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'overlap_index', '-e', 'sync-from'],
+     []),
+    ('ptrace timeseries', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'timeseries', '--every', '10s'], []),
+    ('ptrace show_span', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'show_span', '-s', '{span}'],
+     ['SPAN ID']),
+    ('ptrace critical_path', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'critical_path', '-s'], ['SPAN ID']),
+    ('ptrace list_tids', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'list_tids'], []),
+    ('ptrace list_events_duration', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'list_events_duration'], ['DEVICE']),
+    ('ptrace summarize_locks', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'summarize_locks', '{nso5}'], []),
+    ('ptrace report', PTRACE_DIR,
+     ['ptrace.py', '-f', '{trace}', 'report'], []),
+]
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--rows', type=int, nargs='+',
+            default=[1000000, 10000000, 100000000],
+            help='Numbers of rows of the traces.')
+    parser.add_argument('-l', '--layout', type=int, default=21,
+            choices=sorted(LAYOUTS),
+            help='Number of columns of the trace layout.')
+    parser.add_argument('-t', '--tools', type=str, nargs='+',
+            help='Only the tools with these names.')
+    parser.add_argument('--data', type=str, default=DATA_DIR,
+            help='Directory of the generated traces.')
+    parser.add_argument('--results', type=str, default=RESULTS,
+            help='File to append the results to.')
+    parser.add_argument('--no-cache', action='store_true', default=False,
+            help='Run the tools without the trace cache.')
+    parser.add_argument('--timeout', type=float, default=3600,
+            help='Seconds before a tool is stopped.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+            help='Relative change marked as a regression.')
+    parser.add_argument('--seed', type=int, default=1,
+            help='Seed of the generated traces.')
+    return parser.parse_args(args)
+
+
+def trace_path(directory, rows, layout, seed):
+    '''Return the generated trace of a size, generating it if missing.'''
+    path = os.path.join(directory, f'trace-{rows}-{layout}-{seed}.csv')
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        print(f"Generating {path}", flush=True)
+        tmp = path + '.tmp'
+        subprocess.run([sys.executable, GENERATOR, tmp, '-n', str(rows),
+                        '-l', str(layout), '--seed', str(seed)], check=True)
+        os.replace(tmp, path)
+    return path
+
+
+def sample_ids(trace):
+    '''Return a transaction id and a span id from the start of a trace.'''
+    tid = span = None
+    with open(trace, newline='') as f:
+        for row in csv.DictReader(f):
+            tid = tid or row['TRANSACTION ID']
+            span = span or row.get('SPAN ID')
+            if tid and (span or 'SPAN ID' not in row):
+                break
+    return tid, span
+
+
+def measure(argv, cwd, env, timeout):
+    '''Run a tool and return its status, wall time in seconds and peak
+    resident memory in MB.
+    '''
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, *argv], cwd=cwd, env=env,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    finally:
+        timer.cancel()
+    elapsed = time.perf_counter()-start
+    # The Popen doesn't see the exit of a process reaped by wait4
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if elapsed >= timeout:
+        result = 'timeout'
+    elif process.returncode:
+        result = f'exit {process.returncode}'
+    else:
+        result = 'ok'
+    # ru_maxrss is in kilobytes on Linux
+    return result, elapsed, usage.ru_maxrss/1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=ROOT_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results(path):
+    '''Return the last ok result of each tool, size and layout.'''
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                r = json.loads(line)
+                if r['status'] == 'ok':
+                    previous[(r['tool'], r['rows'], r['layout'],
+                              r['cache'])] = r
+    return previous
+
+
+def change(value, before, threshold):
+    if not before:
+        return ''
+    delta = value/before-1
+    mark = ' !' if delta > threshold else ''
+    return f"{delta:+6.0%}{mark}"
+
+
+def main(args):
+    env = dict(os.environ, PTRACE_SOCKET='')
+    if args.no_cache:
+        env['PTRACE_NO_CACHE'] = '1'
+    previous = previous_results(args.results)
+    base = {'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(), 'host': platform.node(),
+            'python': platform.python_version(), 'layout': args.layout,
+            'cache': not args.no_cache}
+    columns = set(LAYOUTS[args.layout])
+    print(f"{'tool':<28} {'rows':>10} {'seconds':>9} {'change':>8} "+
+          f"{'MB':>7} {'change':>8}")
+    for rows in args.rows:
+        trace = os.path.abspath(trace_path(args.data, rows, args.layout,
+                                           args.seed))
+        tid, span = sample_ids(trace)
+        values = {'trace': trace, 'tid': tid, 'span': span,
+                  'nso5': '-5' if 'SPAN ID' not in columns else ''}
+        for name, cwd, argv, required in TOOLS:
+            if args.tools and name not in args.tools:
+                continue
+            if not columns.issuperset(required):
+                continue
+            argv = [a.format(**values) for a in argv]
+            status, seconds, rss = measure([a for a in argv if a], cwd, env,
+                                           args.timeout)
+            result = dict(base, tool=name, rows=rows, seconds=seconds,
+                          max_rss_mb=rss, status=status)
+            with open(args.results, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+            before = previous.get((name, rows, args.layout,
+                                   not args.no_cache), {})
+            if status == 'ok':
+                print(f"{name:<28} {rows:10} {seconds:9.2f} "+
+                      f"{change(seconds, before.get('seconds'), args.threshold):>8} "+
+                      f"{rss:7.0f} "+
+                      f"{change(rss, before.get('max_rss_mb'), args.threshold):>8}",
+                      flush=True)
+            else:
+                print(f"{name:<28} {rows:10} {status:>9}", flush=True)
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+
+"""
+Generate synthetic progress traces of any size, for the benchmarks.
+
+Each transaction is a devices sync-from action, with the nested spans of
+connecting to the device, reading its config and applying the transaction,
+as in the traces of testdata. The transactions run concurrently and take
+the transaction lock one at a time, so later transactions wait for the lock
+as in a real system. Durations are drawn from log-normal distributions
+around typical durations of each event.
+
+The traces are in any of the csv layouts of trace_schema, by number of
+columns: 19 (NSO 5.x), 18 (NSO 5.x without TRACE ID), 21 (NSO 6.0) and 17
+(NSO 6.1). NSO 6 layouts have span ids and a 'holding transaction lock'
+span, NSO 5 layouts 'grabbing transaction lock' and 'releasing transaction
+lock' events. Files ending in .gz or .zst are compressed.
+
+Transactions are generated in batches with numpy, and the rows of each
+batch written in timestamp order, so memory is bounded by the batch size.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy
+import polars as pl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from trace_schema import LAYOUTS, compression
+
+
+# Nested spans of a transaction: (message, typical duration in seconds of
+# the span itself, fields, children). Spans with children last as long as
+# their children, info events have no duration. LOCK marks where the
+# transaction lock is taken and RELEASE where it is released.
+LOCK = 'grabbing transaction lock'
+RELEASE = 'releasing transaction lock'
+HOLD = 'holding transaction lock'
+DEVICE = {'DEVICE': True}
+NED = {'DEVICE': True, 'PACKAGE': True}
+CDB = {'SUBSYSTEM': 'cdb'}
+
+def span(message, duration=0.001, fields={}, children=[]):
+    return ('span', message, duration, fields, children)
+
+def info(message, fields={}):
+    return ('info', message, 0, fields, [])
+
+def phase(name, children):
+    return span(name, fields={'PHASE': name}, children=children)
+
+TEMPLATE = span('sync-from', fields=DEVICE, children=[
+    span('taking device lock', 0.0005, DEVICE),
+    span('connect', fields=DEVICE, children=[
+        info('send NED connect', DEVICE),
+        span('connecting', 0.15, NED),
+        info('send NED is-alive', DEVICE)]),
+    span('show', fields=DEVICE, children=[
+        info('send NED show', DEVICE),
+        span('reading config', 1.8, NED),
+        span('transforming input', 0.007, NED),
+        span('extended parsing', 2.3, NED),
+        span('populating cdb', 4.0, NED)]),
+    span('applying transaction', children=[
+        phase('validate', [
+            span(LOCK, 0.0015),
+            span('check and resolve conflicts', 0.0025),
+            span('creating rollback file', 0.03),
+            span('run transforms and transaction hooks', 0.008),
+            span('mark inactive', 0.003),
+            span('pre validate', 0.0018),
+            span('run validation over the changeset', 0.005),
+            span('run dependency-triggered validation', 0.0015),
+            span('check configuration policies', 0.0012)]),
+        span(HOLD, children=[
+            phase('write-start', [
+                info('write-start', CDB),
+                span('match subscribers', 0.0006, CDB),
+                span('create pre commit running', 0.0012, CDB),
+                span('write changeset', 0.0013, CDB),
+                span('check data kickers', 0.0006)]),
+            phase('prepare', [
+                info('prepare', CDB),
+                span('prepare', 0.03, CDB)]),
+            phase('commit', [
+                info('commit', CDB),
+                span('switch to new running', 0.01, CDB),
+                info(RELEASE),
+                info('delivering commit subscription notifications '+
+                     'at prio 1', CDB),
+                info('all commit subscription notifications acknowledged',
+                     CDB)])])]),
+    info('releasing device lock', DEVICE)])
+
+# Time between events, in seconds
+GAP = 0.0003
+# Spread of the log-normal durations
+SIGMA = 0.5
+BATCH_SIZE = 20000
+START = numpy.datetime64('2024-01-01T00:00:00', 'us').astype(numpy.int64)
+PACKAGE_NAME = 'cisco-ios-cli-6.92'
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=str,
+            help='File to write, compressed if ending in .gz or .zst.')
+    parser.add_argument('-n', '--rows', type=int, default=1000000,
+            help='Number of rows, rounded to whole transactions.')
+    parser.add_argument('-l', '--layout', type=int, default=21,
+            choices=sorted(LAYOUTS),
+            help='Number of columns of the csv layout.')
+    parser.add_argument('-c', '--concurrency', type=int, default=20,
+            help='Mean number of transactions running at once.')
+    parser.add_argument('-d', '--devices', type=int, default=1000,
+            help='Number of devices.')
+    parser.add_argument('--no-header', action='store_true', default=False,
+            help='Write no header row.')
+    parser.add_argument('--seed', type=int, default=1,
+            help='Random seed.')
+    return parser.parse_args(args)
+
+
+class Walk():
+    '''Events of the template for a batch of transactions. Event times are
+    offsets in microseconds from the start of the transaction (segment 0),
+    from taking the lock (1) or from releasing it (2).
+    '''
+    def __init__(self, template, n, rng, nso6):
+        self.n = n
+        self.rng = rng
+        self.nso6 = nso6
+        self.events = []
+        self.segment = 0
+        self.clock = numpy.zeros(n, dtype=numpy.int64)
+        self.visit(template, None)
+
+    def gap(self):
+        return self.rng.exponential(GAP*1e6, self.n).astype(numpy.int64)+1
+
+    def emit(self, kind, message, fields, parent, start=None):
+        self.events.append({'EVENT TYPE': kind, 'MESSAGE': message,
+                            'fields': fields, 'segment': self.segment,
+                            'offset': self.clock.copy(), 'parent': parent,
+                            'start': start})
+        return len(self.events)-1
+
+    def take(self):
+        # Waiting for the lock, from the time the lock is asked for
+        self.ready = self.clock.copy()
+        self.segment = 1
+        self.clock = numpy.zeros(self.n, dtype=numpy.int64)
+
+    def release(self):
+        self.hold = self.clock.copy()
+        self.segment = 2
+        self.clock = numpy.zeros(self.n, dtype=numpy.int64)
+
+    def visit(self, node, parent):
+        kind, message, duration, fields, children = node
+        if message == HOLD and not self.nso6:
+            # NSO 5 has no span for holding the lock
+            for child in children:
+                self.visit(child, parent)
+            return
+        if kind == 'info':
+            if message == RELEASE and not self.nso6:
+                self.release()
+            self.emit('info', message, fields, parent)
+            self.clock += self.gap()
+            return
+        # The lock is held from the end of grabbing it in NSO 5, and for
+        # the holding span in NSO 6
+        if message == HOLD:
+            self.take()
+        start = self.emit('start', message, fields, parent)
+        self.clock += self.gap()
+        if message == LOCK and not self.nso6:
+            self.take()
+        for child in children:
+            self.visit(child, start)
+        if not children:
+            self.clock += (self.rng.lognormal(numpy.log(duration*1e6), SIGMA,
+                                              self.n)).astype(numpy.int64)
+        if message == HOLD:
+            self.release()
+        self.emit('stop', message, fields, parent, start)
+        self.clock += self.gap()
+
+
+def take_locks(ready, hold, free):
+    '''Return the time each transaction takes the lock, taking it in the
+    order asked for, and when the lock is free after the last one.
+    '''
+    order = numpy.argsort(ready, kind='stable')
+    acquire = numpy.empty(len(ready), dtype=numpy.int64)
+    for i, r, h in zip(order.tolist(), ready[order].tolist(),
+                       hold[order].tolist()):
+        free = max(free, r)
+        acquire[i] = free
+        # The next transaction takes the lock a microsecond after
+        free += h+1
+    return acquire, free
+
+
+def formatted_duration(us):
+    return pl.concat_str([(us // 1000000).cast(pl.String), pl.lit('.'),
+                          (us % 1000000).cast(pl.String).str.zfill(6)])
+
+
+class Generator():
+    def __init__(self, layout, concurrency, devices, seed):
+        self.columns = LAYOUTS[layout]
+        self.nso6 = 'SPAN ID' in self.columns
+        self.devices = devices
+        self.rng = numpy.random.default_rng(seed)
+        self.rows_per_transaction = len(Walk(TEMPLATE, 1, self.rng,
+                                             self.nso6).events)
+        # Mean time between transactions starting, from the mean duration
+        # of transactions not waiting for the lock
+        walk = Walk(TEMPLATE, 1000, self.rng, self.nso6)
+        length = (walk.ready + walk.hold +
+                  walk.events[-1]['offset']).mean()
+        self.interval = length/concurrency
+        self.free = 0
+        self.tid = 1000
+        self.span = 1
+        self.next_start = START
+
+    def starts(self, n):
+        starts = self.next_start + numpy.cumsum(
+            self.rng.exponential(self.interval, n)).astype(numpy.int64)
+        self.next_start = starts[-1]
+        return starts
+
+    def batch(self, n):
+        '''Return a DataFrame of the rows of n transactions sorted by
+        timestamp, and the first timestamp of the next batch.
+        '''
+        walk = Walk(TEMPLATE, n, self.rng, self.nso6)
+        starts = self.starts(n)
+        acquire, self.free = take_locks(starts+walk.ready, walk.hold,
+                                        self.free)
+        base = [starts, acquire, acquire+walk.hold]
+        times = [base[e['segment']]+e['offset'] for e in walk.events]
+        tids = numpy.arange(self.tid, self.tid+n)
+        self.tid += n
+        spans = self.span + numpy.arange(len(walk.events))[:, None]*n + \
+            numpy.arange(n)[None, :]
+        self.span += len(walk.events)*n
+
+        e = len(walk.events)
+        columns = {
+            'EVENT TYPE': numpy.repeat([ev['EVENT TYPE']
+                                        for ev in walk.events], n),
+            'MESSAGE': numpy.repeat([ev['MESSAGE'] for ev in walk.events], n),
+            'TIMESTAMP': numpy.concatenate(times),
+            'TRANSACTION ID': numpy.tile(tids, e),
+            'DURATION': numpy.concatenate([
+                times[i]-times[ev['start']] if ev['start'] is not None
+                else numpy.full(n, -1) for i, ev in enumerate(walk.events)]),
+        }
+        for name, value in [('SUBSYSTEM', ''), ('PHASE', '')]:
+            columns[name] = numpy.repeat([ev['fields'].get(name, value)
+                                          for ev in walk.events], n)
+        for name in ['DEVICE', 'PACKAGE']:
+            columns[name] = numpy.repeat([bool(ev['fields'].get(name))
+                                          for ev in walk.events], n)
+        if self.nso6:
+            # Span ids of the start event of each span
+            own = [i if ev['EVENT TYPE'] == 'start' else ev['start']
+                   for i, ev in enumerate(walk.events)]
+            columns['SPAN'] = numpy.concatenate([
+                spans[i] if i is not None else numpy.full(n, -1)
+                for i in own])
+            columns['PARENT'] = numpy.concatenate([
+                spans[ev['parent']] if ev['parent'] is not None
+                else numpy.full(n, -1) for ev in walk.events])
+        return pl.DataFrame(columns).sort('TIMESTAMP', maintain_order=True)
+
+    def format(self, rows):
+        '''Return the rows as strings in the columns of the layout.'''
+        ts = pl.col('TIMESTAMP')
+        tid = pl.col('TRANSACTION ID')
+        values = {
+            'EVENT TYPE': pl.col('EVENT TYPE'),
+            'TIMESTAMP': ts.cast(pl.Datetime('us')).dt.strftime(
+                '%Y-%m-%dT%H:%M:%S%.6f'),
+            'DURATION': pl.when(pl.col('DURATION') >= 0).then(
+                formatted_duration(pl.col('DURATION'))),
+            'SESSION ID': (tid // 100 + 40).cast(pl.String),
+            'TRANSACTION ID': tid.cast(pl.String),
+            'DATASTORE': pl.lit('running'),
+            'CONTEXT': pl.lit('cli'),
+            'SUBSYSTEM': pl.when(pl.col('SUBSYSTEM') != '').then(
+                pl.col('SUBSYSTEM')),
+            'PHASE': pl.when(pl.col('PHASE') != '').then(pl.col('PHASE')),
+            'DEVICE': pl.when(pl.col('DEVICE')).then(
+                pl.format('ios{}', tid % self.devices)),
+            'PACKAGE': pl.when(pl.col('PACKAGE')).then(
+                pl.lit(PACKAGE_NAME)),
+            'MESSAGE': pl.col('MESSAGE'),
+        }
+        if self.nso6:
+            values['TRACE ID'] = tid.cast(pl.String).str.zfill(32)
+            values['SPAN ID'] = pl.col('SPAN').map_batches(
+                lambda s: s.cast(pl.String).str.zfill(16),
+                return_dtype=pl.String)
+            values['PARENT SPAN ID'] = pl.when(pl.col('PARENT') >= 0).then(
+                pl.col('PARENT').cast(pl.String).str.zfill(16))
+        return rows.select([
+            values.get(name, pl.lit(None, dtype=pl.String)).alias(name)
+            for name in self.columns])
+
+
+def open_output(filename):
+    codec = compression(filename)
+    if codec is None:
+        return open(filename, 'wb')
+    import pyarrow
+    return pyarrow.output_stream(filename, compression=codec)
+
+
+def generate(filename, rows, layout=21, concurrency=20, devices=1000,
+             header=True, seed=1):
+    '''Write a trace of about rows rows, returning the number of rows.'''
+    generator = Generator(layout, concurrency, devices, seed)
+    transactions = max(1, rows//generator.rows_per_transaction)
+    written = 0
+    pending = None
+    with open_output(filename) as f:
+        for first in range(0, transactions, BATCH_SIZE):
+            n = min(BATCH_SIZE, transactions-first)
+            batch = generator.batch(n)
+            if pending is not None:
+                batch = pl.concat([pending, batch]).sort(
+                    'TIMESTAMP', maintain_order=True)
+            # Later transactions start after the next start, so rows
+            # before it are final.
+            if first+n < transactions:
+                done = batch.filter(pl.col('TIMESTAMP') <
+                                    generator.next_start)
+                pending = batch.filter(pl.col('TIMESTAMP') >=
+                                       generator.next_start)
+            else:
+                done, pending = batch, None
+            generator.format(done).write_csv(
+                f, include_header=header and written == 0)
+            written += len(done)
+    return written
+
+
+def main(args):
+    rows = generate(args.file, args.rows, args.layout, args.concurrency,
+                    args.devices, not args.no_header, args.seed)
+    print(f"{rows} rows written to {args.file}")
+
+
+if __name__ == '__main__':
+    main(parseArgs(sys.argv[1:]))
@@ -6,6 +6,9 @@ import sys
 
 import pandas
 
+from duration_sketch import PERCENTILES, percentile_name
+from trace_cache import read_trace
+
 
 def parseArgs(args):
     parser = argparse.ArgumentParser()
@@ -24,7 +27,7 @@ def get_statistics(progress_trace, datastore='running'):
                     (progress_trace.EVENTTYPE == 'stop') &
                     ~(progress_trace.MESSAGE.str.startswith('check conflict')) ]
 
-    duration_grouped_by_message = d.groupby('MESSAGE').DURATION
+    duration_grouped_by_message = d.groupby('MESSAGE', observed=True).DURATION
     v_cnt = duration_grouped_by_message.count()
     v_cnt.name = "COUNT"
     v_sum = duration_grouped_by_message.sum()
@@ -37,13 +40,19 @@ def get_statistics(progress_trace, datastore='running'):
     v_min.name = "MIN"
     v_max = duration_grouped_by_message.max()
     v_max.name = "MAX"
+    v_percentiles = []
+    for p in PERCENTILES:
+        v_p = duration_grouped_by_message.quantile(p/100,
+                                                   interpolation='lower')
+        v_p.name = percentile_name(p)
+        v_percentiles.append(v_p)
 
-    return pandas.concat([v_cnt, v_sum, v_sd, v_mean, v_min, v_max], axis=1)
+    return pandas.concat([v_cnt, v_sum, v_sd, v_mean, v_min, v_max] +
+                         v_percentiles, axis=1)
 
 
 def main(args):
-    progress_trace = pandas.read_csv(args.file, index_col='TIMESTAMP',
-                                     dtype={'DATASTORE': 'string'})
+    progress_trace = read_trace(args.file).set_index('TIMESTAMP')
     progress_trace.rename(columns={'EVENT TYPE': 'EVENTTYPE'}, inplace=True)
 
     print("=== RUNNING ===")
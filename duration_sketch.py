@@ -0,0 +1,114 @@
+"""
+Mergeable sketches of event durations, for percentiles and histograms of
+several traces or windows of time without reading the traces again.
+
+Durations are counted in logarithmic buckets as in DDSketch, bucket i
+holding the durations in (2**((i-1)/BUCKETS_PER_DOUBLING),
+2**(i/BUCKETS_PER_DOUBLING)], and durations of 0 or less in ZERO_BUCKET.
+Each bucket also keeps the sum, the sum of squared differences from its
+mean, the minimum and the maximum of its durations. The count, sum, mean,
+standard deviation, minimum and maximum of a merged sketch are exact, and
+percentiles are estimated within RELATIVE_ACCURACY. Sketches are merged by
+adding up the buckets of the same group, and histograms are made of the
+buckets of each doubling of the duration.
+"""
+
+import polars as pl
+
+
+BUCKETS_PER_DOUBLING = 64
+GAMMA = 2**(1/BUCKETS_PER_DOUBLING)
+RELATIVE_ACCURACY = (GAMMA-1)/(GAMMA+1)
+ZERO_BUCKET = -2**31
+PERCENTILES = [50, 90, 99, 99.9]
+
+
+def percentile_name(percentile):
+    return f'P{percentile:g}'
+
+
+def bucket(duration):
+    return pl.when(duration > 0).then(
+        (duration.log(2)*BUCKETS_PER_DOUBLING).ceil()).otherwise(
+        ZERO_BUCKET).cast(pl.Int32)
+
+
+def sketch(progress_trace, by):
+    '''Return a LazyFrame of the sketch of the DURATION of the rows of each
+    group of the columns in by.
+    '''
+    duration = pl.col('DURATION')
+    return progress_trace.filter(duration.is_not_null()).with_columns(
+        [pl.col(c).cast(pl.String) for c in by]).group_by(
+        by + [bucket(duration).alias('BUCKET')]).agg(
+        pl.len().cast(pl.Int64).alias('COUNT'),
+        duration.sum().alias('SUM'),
+        ((duration-duration.mean())**2).sum().alias('M2'),
+        duration.min().alias('MIN'),
+        duration.max().alias('MAX'))
+
+
+def combined():
+    '''Aggregations combining the buckets of a group, the M2 of the buckets
+    combined with the differences of their means from the mean of all.
+    '''
+    count, total = pl.col('COUNT'), pl.col('SUM')
+    mean = total.sum()/count.sum()
+    return [count.sum().alias('COUNT'), total.sum().alias('SUM'),
+            (pl.col('M2')+count*(total/count-mean)**2).sum().alias('M2'),
+            pl.col('MIN').min().alias('MIN'),
+            pl.col('MAX').max().alias('MAX')]
+
+
+def merge(sketches, by):
+    '''Return a LazyFrame of the sketch of several sketches.'''
+    return pl.concat(sketches).group_by(by + ['BUCKET']).agg(combined())
+
+
+def read_sketches(paths):
+    return [pl.scan_parquet(path) for path in paths]
+
+
+def percentile(q):
+    '''Aggregation estimating a percentile from the buckets of a group,
+    sorted by bucket, clamped to the durations of the bucket.
+    '''
+    count, b = pl.col('COUNT'), pl.col('BUCKET')
+    value = pl.when(b == ZERO_BUCKET).then(0.0).otherwise(
+        2*pl.lit(GAMMA).pow(b)/(GAMMA+1)).clip(pl.col('MIN'), pl.col('MAX'))
+    rank = (count.sum()-1)*q/100
+    return value.filter(count.cum_sum() > rank).first()
+
+
+def summary(sketch, by, percentiles=PERCENTILES):
+    '''Return a LazyFrame of the COUNT, SUM, STD, MEAN, MIN, MAX and
+    percentiles of each group of a sketch.
+    '''
+    aggregations = combined()
+    aggregations += [percentile(p).alias(percentile_name(p))
+                     for p in percentiles]
+    count = pl.col('COUNT')
+    return sketch.sort('BUCKET').group_by(by).agg(aggregations).select(
+        by + ['COUNT', 'SUM',
+              pl.when(count > 1).then((pl.col('M2')/(count-1)).sqrt()
+                                      ).alias('STD'),
+              (pl.col('SUM')/count).alias('MEAN'), 'MIN', 'MAX'] +
+        [percentile_name(p) for p in percentiles])
+
+
+def histogram(sketch, by):
+    '''Return a LazyFrame of the COUNT of durations of each group from
+    LOWER to UPPER, for each doubling of the duration.
+    '''
+    b = pl.col('BUCKET')
+    doubling = pl.when(b == ZERO_BUCKET).then(None).otherwise(
+        (b+BUCKETS_PER_DOUBLING-1)//BUCKETS_PER_DOUBLING)
+    upper = pl.lit(2.0).pow(pl.col('DOUBLING'))
+    return sketch.with_columns(doubling.alias('DOUBLING')).group_by(
+        by + ['DOUBLING']).agg(pl.col('COUNT').sum()).sort(
+        by + ['DOUBLING'], nulls_last=False).select(
+        by + [pl.when(pl.col('DOUBLING').is_null()).then(None).otherwise(
+                  upper/2).alias('LOWER'),
+              pl.when(pl.col('DOUBLING').is_null()).then(0.0).otherwise(
+                  upper).alias('UPPER'),
+              'COUNT'])
@@ -4,7 +4,7 @@ import argparse
 from datetime import datetime
 import sys
 
-import pandas
+from trace_cache import read_trace
 
 
 def parseArgs(args):
@@ -19,13 +19,12 @@ def parseArgs(args):
 def main(args):
     prefix = '-' if args.negate else ''
 
-    progress_trace = pandas.read_csv(args.file, index_col='TIMESTAMP',
-                                     low_memory=False)
+    progress_trace = read_trace(args.file).set_index('TIMESTAMP')
 
     d = progress_trace[(progress_trace['DATASTORE'] == 'running') &
                 (progress_trace['EVENT TYPE'] == 'stop')]
 
-    duration_grouped_by_message = d.groupby('MESSAGE')['MESSAGE']
+    duration_grouped_by_message = d.groupby('MESSAGE', observed=True)['MESSAGE']
     for name, ev in duration_grouped_by_message:
         print(f'{prefix}{name}')
 
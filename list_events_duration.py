@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 
 import argparse
-from datetime import datetime
 import sys
-import pandas
+
+from trace_cache import read_trace
 
 
 def parseArgs(args):
@@ -20,9 +20,7 @@ def parseArgs(args):
 
 
 def main(args):
-    progress_trace = pandas.read_csv(args.file,
-                              converters={'TIMESTAMP': datetime.fromisoformat}
-                                     )
+    progress_trace = read_trace(args.file, begin=args.begin, end=args.end)
 
     have_trace_id = 'TRACE ID' in progress_trace.keys()
 
@@ -35,16 +33,6 @@ def main(args):
         events = events[
             events['MESSAGE'] == args.event
         ]
-    if args.begin:
-        begin = datetime.fromisoformat(args.begin)
-        events = events[
-            events['TIMESTAMP'] >= begin
-        ]
-    if args.end:
-        end = datetime.fromisoformat(args.end)
-        events = events[
-            events['TIMESTAMP'] <= end
-        ]
     events = events.sort_values('DURATION', ascending=False)
 
     for i, fields in events.iterrows():
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 
 import argparse
-from datetime import datetime
 import sys
-import pandas
+
+from trace_cache import read_trace
+
+
+# Columns read from the trace
+COLUMNS = ['ROW', 'EVENT TYPE', 'TRANSACTION ID', 'DATASTORE', 'MESSAGE',
+           'ANNOTATION']
 
 
 def parseArgs(args):
@@ -20,9 +25,9 @@ def parseArgs(args):
 
 
 def main(args):
-    progress_trace = pandas.read_csv(args.file,
-                              converters={'TIMESTAMP': datetime.fromisoformat}
-                                     )
+    # Rows are numbered from the start of the file, also for a time range
+    progress_trace = read_trace(args.file, begin=args.begin, end=args.end,
+                                columns=COLUMNS).set_index('ROW')
 
     have_trace_id = 'TRACE ID' in progress_trace.keys()
 
@@ -35,16 +40,6 @@ def main(args):
         sync_from_events = sync_from_events[
             sync_from_events['MESSAGE'] == args.event
         ]
-    if args.begin:
-        begin = datetime.fromisoformat(args.begin)
-        sync_from_events = sync_from_events[
-            sync_from_events['TIMESTAMP'] >= begin
-        ]
-    if args.end:
-        end = datetime.fromisoformat(args.end)
-        sync_from_events = sync_from_events[
-            sync_from_events['TIMESTAMP'] <= end
-        ]
 
     tids = []
     tids_msgs = []
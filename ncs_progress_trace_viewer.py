@@ -1,18 +1,18 @@
 #!/usr/bin/env python3
 
 import argparse
-import csv
-from datetime import datetime
 import os
 import sys
-import time
 
+from rich.console import Console
 from rich.live import Live
-from rich.bar import Bar
-from rich.console import Group
-from rich.table import Table
-from rich.text import Text
-from rich.color import Color
+
+from span_view import FRAMES_PER_SECOND, HISTORY, SpanView
+from trace_follow import follow, prefetch, read_batches, read_chunks, \
+    split_lines
+from trace_replay import Replay, read_keys
+import trace_schema
+from trace_time import NAT, decode_timestamp, decode_timestamps
 
 
 """
@@ -26,6 +26,11 @@ progress trace debug
 !
 """
 
+# Number of spans and width of the timeline exported in batch mode
+EXPORT_ROWS = 100
+EXPORT_WIDTH = 200
+
+
 def parseArgs(args):
     parser = argparse.ArgumentParser()
     parser.add_argument('-f', '--follow', action='store_true', default=False,
@@ -43,7 +48,31 @@ def parseArgs(args):
     parser.add_argument('--write', type=str,
             help='Write the progress trace events to file.')
     parser.add_argument('--interactive', action='store_true', default=False,
-            help='Skip view updates and sleeps during parsing.')
+            help='Replay the trace at the pace of the traced events. '+
+                 'Keys: space pause, +/- speed, >/< seek, q quit.')
+    parser.add_argument('--speed', type=float, default=1.0,
+            help='Replay speed relative to the traced time.')
+    parser.add_argument('--seek', type=str,
+            help='Start the replay at a timestamp.')
+    parser.add_argument('--batch', action='store_true', default=False,
+            help='Read the whole trace and show the final timeline once.')
+    parser.add_argument('--export', type=str,
+            help='Write the timeline of batch mode to an svg, html or '+
+                 'text file.')
+    parser.add_argument('--fps', type=float, default=FRAMES_PER_SECOND,
+            help='Maximum number of view updates per second.')
+    parser.add_argument('--rows', type=int,
+            help='Number of spans shown, default fits the terminal.')
+    parser.add_argument('--offset', type=int,
+            help='Show spans from this row, default follows the latest.')
+    parser.add_argument('--jump-tid', type=str,
+            help='Show spans from the first span of a transaction id.')
+    parser.add_argument('-b', '--begin', type=str,
+            help='Show spans from start timestamp.')
+    parser.add_argument('-e', '--end', type=str,
+            help='Show spans until end timestamp.')
+    parser.add_argument('--history', type=int, default=HISTORY,
+            help='Number of finished spans kept before collapsing them.')
     return parser.parse_args(args)
 
 
@@ -66,33 +95,6 @@ def setup_progress_trace(args):
         sys.exit(1)
 
 
-def mk_color_numbers():
-    return list(filter(lambda i: not i in [4, 16, 17, 18], [i for i in range(1, 232)]))
-
-
-color_numbers = []
-def get_color():
-    global color_numbers
-    if not color_numbers:
-        color_numbers = mk_color_numbers()
-    return Color.from_ansi(color_numbers.pop(0))
-
-
-def follow(thefile):
-    '''generator function that yields new lines in a file
-    '''
-    thefile.seek(0, os.SEEK_END)
-
-    # start infinite loop
-    while True:
-        line = thefile.readline()
-        if not line:
-            time.sleep(0.1)
-            continue
-
-        yield line
-
-
 def read_events(filename):
     events = []
     for l in open(filename, 'r'):
@@ -102,140 +104,161 @@ def read_events(filename):
     return events
 
 
-def get_table(tids = None, span_header="Span"):
-    table = Table(title="NSO Traces")
-    table.add_column("Event", min_width=20, no_wrap=True)
-    table.add_column("TId", min_width=3, no_wrap=True)
-    table.add_column("Duration", min_width=10, no_wrap=True)
-    table.add_column(span_header, width=120, no_wrap=True)
-    if tids is not None:
-        for tid, spans in tids.items():
-            for text, d, span in spans:
-                table.add_row(f'{text} {tid}', d, span)
-    return table
-
-
-def graph_progress_trace(args, f, events):
-    begin = 0.0
-    size = 0.0
-    last = 0.0
-
-    bars = Group()
-    spans = {}
-    tids = {}
-    tids_color = {}
-    spans_running = {}
-    held_locks = {}
-    span_duration = Text(" Span 0.0 ms")
-    table = get_table(span_header=span_duration)
+def timestamp_seconds(timestamp):
+    us = decode_timestamp(timestamp)
+    if us == NAT:
+        print(f"Invalid timestamp {timestamp}")
+        sys.exit(1)
+    return us/1e6
 
-    writer = None
-    if args.write:
-        writer = open(args.write, 'w')
-    if args.tid:
-        if ',' in args.tid:
-            args.tid = args.tid.split(',')
-        else:
-            args.tid = [ args.tid ]
 
-    def new_span(text, key, tid):
-        if tid not in tids_color:
-            color=get_color()
-            tids_color[tid] = color
-        else:
-            color=tids_color[tid]
-        span = Bar(begin=size, end=size, size=size, color=color)
-        spans_running[key] = span
-        d = Text('')
-        spans[key] = span, d
-        if tid not in tids:
-            tids[tid] = [(text, d, span)]
-        else:
-            tids[tid].append((text, d, span))
-        table.add_row(text, tid, d, span)
-
-    def end_span(key, duration):
-        s, d = spans[key]
-        d.append(f'{duration*1000:0.3f}')
-        s.end = size
-        if key in spans_running:
-            del spans_running[key]
-
-    with Live(table) as live:
-        header = None
-        for line in f:
-            if writer:
-                writer.write(line)
-            l = list(csv.reader([line]))[0]
-            if len(l) == 17:
-                have_trace_id = -6
-                have_span_id = 3
-            elif len(l) == 18:
-                have_trace_id = -1
-                have_span_id = 0
-            elif len(l) == 19:
-                have_trace_id = 0
-                have_span_id = 0
-            elif len(l) == 21:
-                have_trace_id = 2
-                have_span_id = 3
-            else:
-                print("ERROR: Unsupported number of columns in progress trace"+
-                     f"{len(l)}")
-            if header is None:
-                if l[0] == 'EVENT TYPE':
-                    header = l
-                    continue
-                else:
-                    header = 'No header.'
-            if not args.o and l[5+have_span_id] == 'operational':
+def new_view(args):
+    view = SpanView(args.fps, history=args.history)
+    if args.offset is not None:
+        view.offset = args.offset
+    if args.begin or args.end:
+        begin = timestamp_seconds(args.begin) if args.begin else None
+        end = timestamp_seconds(args.end) if args.end else None
+        view.jump_to_time(begin, end)
+    return view
+
+
+def decode_events(args, batches, events, writer):
+    '''Generator of the events of each batch of lines shown by the
+    viewer, as lists of the arguments of SpanView.event.
+    '''
+    def unsupported_row(row):
+        print("ERROR: Unsupported number of columns in progress trace"+
+             f"{len(row)}")
+
+    decoder = trace_schema.Decoder(unsupported_row)
+    for lines in batches:
+        if writer:
+            writer.writelines(lines)
+        rows = list(decoder.rows(lines))
+        # Decode the timestamps of the batch at once
+        stamps = decode_timestamps([row[1] for row in rows]).tolist()
+        batch = []
+        for row, us in zip(rows, stamps):
+            tag, timestamp, duration, tid, datastore, text, key = row
+            if not args.o and datastore == 'operational':
+                continue
+            if events is not None and text not in events:
                 continue
-            if events is not None and l[17+have_trace_id] not in events:
+            if us == NAT:
                 continue
-            tag = l[0]
-            ts = datetime.fromisoformat(l[1]).timestamp()
-            duration = float(l[2]) if l[2] else 0.0
-            tid = l[4+have_span_id]
-            key = '-'.join([tid]+l[11+have_trace_id:18+have_trace_id])
-            text = l[17+have_trace_id]
+            ts = us/1e6
+            duration = float(duration) if duration else 0.0
 
             if args.tid and tid not in args.tid:
                 continue
 
-            if begin == 0.0:
-                begin = ts
-                last = ts
-            size = ts-begin
-            if tag == 'start':
-                new_span(text, key, tid)
-            elif tag == 'stop' and key in spans:
-                end_span(key, duration)
-                if text == 'grabbing transaction lock':
-                    ftext = 'holding transaction lock'
-                    fkey = tid+'-'+ftext
-                    new_span(ftext, fkey, tid)
-                    held_locks[tid] = ts
-            elif tag == 'info' and text == 'releasing transaction lock':
-                ftext = 'holding transaction lock'
-                fkey = tid+'-'+ftext
-                if fkey in spans:
-                    sts = held_locks.pop(tid)
-                    fduration = ts-sts
-                    end_span(fkey, fduration)
-            for s, d in spans.values():
-                s.size = size
-            for s in spans_running.values():
-                s.end = size
-            span_duration.plain = f'Span {size*1000:0.3f} ms'
-            if (args.follow or last-ts>0.1) and args.interactive:
-                live.refresh()
-            if not args.follow and args.interactive and last:
-                delay = ts-last
-                if delay > 0:
-                    time.sleep(delay)
-            last = ts
+            batch.append((tag, ts, duration, tid, text, key))
+        yield batch
+
+
+def fit_height(view, args, console):
+    view.height = args.rows
+    if view.height is None and console.is_terminal:
+        view.height = max(1, console.height-7)
+
+
+def graph_progress_trace(args, batches, events):
+    view = new_view(args)
+
+    writer = None
+    if args.write:
+        writer = open(args.write, 'w')
+    batches = decode_events(args, batches, events, writer)
+
+    def refresh(live):
+        if args.jump_tid:
+            view.jump_to_tid(args.jump_tid)
         live.refresh()
 
+    if args.interactive and not args.follow:
+        replay_trace(args, view, batches, refresh)
+        return
+
+    with Live(view, auto_refresh=False) as live:
+        fit_height(view, args, live.console)
+        for batch in batches:
+            for event in batch:
+                view.event(*event)
+                if view.frame_due():
+                    refresh(live)
+            if args.follow:
+                refresh(live)
+        refresh(live)
+
+
+def replay_trace(args, view, batches, refresh):
+    '''Load the whole trace and replay it at the speed of --speed, from
+    the timestamp of --seek or the start.
+    '''
+    replay = Replay(view, args.speed)
+    for batch in batches:
+        for event in batch:
+            replay.add(event)
+    start = replay.start_time()
+    if args.seek:
+        start = timestamp_seconds(args.seek)
+    with Live(view, auto_refresh=False) as live:
+        fit_height(view, args, live.console)
+        read_keys(replay.commands)
+        replay.seek(start)
+        replay.run(lambda: refresh(live))
+
+
+def graph_batch(args, events):
+    '''Compute the spans of the whole trace at once and show the final
+    timeline, all spans kept. Without --rows the latest spans that fit the
+    terminal are shown, or EXPORT_ROWS when exported, or the history limit
+    otherwise.
+    '''
+    # polars is only needed in batch mode
+    import trace_spans
+
+    rows = trace_spans.scan_events(args.file, args.o, events,
+                                   args.tid).collect()
+    spans = trace_spans.spans(rows)
+    view = new_view(args)
+    for tid in spans['TRANSACTION ID'].unique(maintain_order=True):
+        view.tids_color[tid] = view.new_color()
+    view.store.extend(spans['MESSAGE'].to_list(),
+                      spans['TRANSACTION ID'].to_list(),
+                      spans['BEGIN'].to_list(),
+                      spans['STOP'].fill_null(float('nan')).to_list(),
+                      spans['DURATIONS'].to_list())
+    if not rows.is_empty():
+        view.begin = rows['TS'][0]
+    view.timeline.size = trace_spans.size(rows)
+
+    if args.export:
+        console = Console(record=True, file=open(os.devnull, 'w'),
+                          width=EXPORT_WIDTH)
+    else:
+        console = Console()
+    view.height = args.rows
+    if view.height is None:
+        if args.export:
+            view.height = EXPORT_ROWS
+        elif console.is_terminal:
+            view.height = max(1, console.height-7)
+        else:
+            view.height = args.history
+    if args.jump_tid:
+        view.jump_to_tid(args.jump_tid)
+    console.print(view)
+    if args.export:
+        ext = os.path.splitext(args.export)[1]
+        if ext == '.svg':
+            console.save_svg(args.export, title=os.path.basename(args.file))
+        elif ext in ('.html', '.htm'):
+            console.save_html(args.export)
+        else:
+            console.save_text(args.export)
+
 
 def main(args):
     if args.setup:
@@ -247,11 +270,33 @@ def main(args):
     events = None
     if args.filter is not None:
         events = read_events(args.filter)
-    f = open(args.file, 'r')
+    if args.tid:
+        args.tid = args.tid.split(',')
+    if args.export and not args.batch:
+        print("Export is only supported in batch mode.")
+        sys.exit(1)
+    if args.batch:
+        if args.follow or args.write:
+            print("Can not follow or write the trace in batch mode.")
+            sys.exit(1)
+        graph_batch(args, events)
+        return
+    compressed = trace_schema.compression(args.file) is not None
+    if args.follow and compressed:
+        print("Can not follow a compressed file.")
+        sys.exit(1)
     if args.follow:
-        f = follow(f)
+        # Resolve the column layout from the header before skipping to the
+        # end of the file.
+        batches = follow(args.file, header=trace_schema.HEADER_START)
+    elif compressed:
+        # Decompress in a thread while decoding the previous chunk
+        batches = split_lines(prefetch(read_chunks(
+            trace_schema.open_binary(args.file))))
+    else:
+        batches = read_batches(open(args.file, 'r'))
     try:
-        graph_progress_trace(args, f, events)
+        graph_progress_trace(args, batches, events)
     except KeyboardInterrupt:
         print()
         print("Stopped")
@@ -6,22 +6,44 @@ import sys
 
 import polars as pl
 
+import rootpath
+from trace_cache import scan_trace
+import duration_sketch
+from duration_sketch import PERCENTILES, percentile_name
+
+
+# Columns read from the trace
+COLUMNS = ['EVENT TYPE', 'TIMESTAMP', 'DURATION', 'DATASTORE', 'MESSAGE']
+
 
 def parseArgs(args):
     parser = argparse.ArgumentParser()
-    parser.add_argument('file', type=str,
+    parser.add_argument('file', type=str, nargs='?',
             help='File to process.')
+    parser.add_argument('-s', '--save-sketch', type=str,
+            help='Write the sketch of the durations to a Parquet file.')
+    parser.add_argument('-m', '--merge', type=str, nargs='+', default=[],
+            help='Sketch files to merge with the trace, statistics of '+
+                 'merged sketches have estimated percentiles.')
+    parser.add_argument('--histogram', action='store_true', default=False,
+            help='Show a histogram of the durations of each event.')
     return parser.parse_args(args)
 
 
-def get_statistics(progress_trace, datastore='running'):
-    progress_trace = progress_trace.filter(pl.col('TIMESTAMP') != '')
+def stop_events(progress_trace, datastore='running'):
+    progress_trace = progress_trace.filter(pl.col('TIMESTAMP').is_not_null())
 
-    d = progress_trace.filter((pl.col('DATASTORE') == datastore) &
+    return progress_trace.filter((pl.col('DATASTORE') == datastore) &
                 (pl.col('EVENT TYPE') == 'stop') &
-                ~(pl.col('MESSAGE').str.starts_with('check conflict'))
+                ~(pl.col('MESSAGE').cast(pl.String)
+                  .str.starts_with('check conflict'))
     )
 
+
+def statistics(progress_trace, datastore='running'):
+    '''Return a LazyFrame of the duration statistics of each event.'''
+    d = stop_events(progress_trace, datastore)
+
     duration_grouped_by_message = d.group_by('MESSAGE').agg([
                     pl.col('MESSAGE').len().alias('COUNT'),
                     pl.col('DURATION').sum().alias('SUM'),
@@ -29,18 +51,72 @@ def get_statistics(progress_trace, datastore='running'):
                     pl.col('DURATION').mean().alias('MEAN'),
                     pl.col('DURATION').min().alias('MIN'),
                     pl.col('DURATION').max().alias('MAX')
+                    ] + [
+                    pl.col('DURATION').quantile(p/100, 'lower').alias(
+                        percentile_name(p)) for p in PERCENTILES
                     ])
 
-    return duration_grouped_by_message.collect().sort('MAX')
+    return duration_grouped_by_message.sort('MAX')
 
 
-def main(args):
-    progress_trace = pl.scan_csv(args.file)
+def sketch(progress_trace, datastore='running'):
+    '''Return a LazyFrame of the duration sketch of each event, see
+    duration_sketch.
+    '''
+    return duration_sketch.sketch(stop_events(progress_trace, datastore),
+                                  ['MESSAGE'])
+
+
+def get_statistics(progress_trace, datastore='running'):
+    return statistics(progress_trace, datastore).collect()
+
+
+def main(progress_trace, save_sketch=None, merge=None, histogram=False):
+    '''Return the duration statistics of each event of a trace, or None,
+    merged with the sketches in the files of merge, and the histograms of
+    the durations if histogram is True, else None. The sketch of the trace
+    is written to save_sketch if given.
+    '''
+    merge = merge or []
+    if not (save_sketch or merge or histogram):
+        return get_statistics(progress_trace), None
+    sketches = duration_sketch.read_sketches(merge)
+    if progress_trace is not None:
+        # Read the trace once for the statistics and the sketch
+        progress_trace = progress_trace.cache()
+        sketches.append(sketch(progress_trace))
+    merged = duration_sketch.merge(sketches, ['MESSAGE']).cache()
+    if merge:
+        stats = duration_sketch.summary(merged, ['MESSAGE']).sort('MAX')
+    else:
+        stats = statistics(progress_trace)
+    queries = [stats, duration_sketch.histogram(merged, ['MESSAGE'])]
+    if save_sketch:
+        queries.append(sketches[-1])
+    results = pl.collect_all(queries)
+    if save_sketch:
+        results[2].write_parquet(save_sketch)
+    return results[0], results[1] if histogram else None
 
-    pl.Config().set_tbl_rows(1000)
 
+def print_statistics(stats, histograms, print_result=print):
     print("=== RUNNING ===")
-    print(get_statistics(progress_trace))
+    print_result(stats)
+    if histograms is not None:
+        print("\n=== HISTOGRAMS ===")
+        print_result(histograms)
+
 
 if __name__ == '__main__':
-    main(parseArgs(sys.argv[1:]))
+    args = parseArgs(sys.argv[1:])
+    if args.file is None and not args.merge:
+        print("You must specify a file or sketches to merge.")
+        sys.exit(1)
+    progress_trace = None
+    if args.file is not None:
+        progress_trace = scan_trace(args.file, columns=COLUMNS)
+
+    pl.Config().set_tbl_rows(1000)
+
+    print_statistics(*main(progress_trace, args.save_sketch, args.merge,
+                           args.histogram))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+"""
+Critical path of the span trees of an NSO 6 progress trace.
+
+The critical child of a span is the child that ends last, i.e. the one the
+span waited for before it could end, and the critical path of a root span
+is the chain of critical children from it. The child time of a span is the
+time covered by any of its children, within the span, and the self time is
+the rest of its duration.
+
+All spans are handled with vectorized passes over the span tree index, one
+per depth of the tree.
+"""
+
+import argparse
+import sys
+
+import numpy
+import polars as pl
+
+import rootpath
+from trace_cache import scan_trace
+from span_tree import load_tree
+
+
+# Columns read from the trace
+COLUMNS = ['TIMESTAMP', 'SPAN ID', 'PARENT SPAN ID', 'TRANSACTION ID',
+           'MESSAGE']
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=str,
+            help='File to process.')
+    parser.add_argument('-e', '--event', type=str,
+            help='Only the critical path of root spans of an event.')
+    parser.add_argument('-t', '--tid', type=int,
+            help='Only the critical path of a transaction.')
+    parser.add_argument('-s', '--summary', action='store_true',
+            default=False,
+            help='Aggregate the critical path spans by event.')
+    return parser.parse_args(args)
+
+
+def span_times(pt):
+    return pt.filter(pl.col('SPAN ID').is_not_null()).group_by('SPAN ID').agg(
+        pl.col('TRANSACTION ID').first(),
+        pl.col('MESSAGE').cast(pl.String).first(),
+        pl.col('TIMESTAMP').min().alias('BEGIN'),
+        pl.col('TIMESTAMP').max().alias('END')).collect()
+
+
+def child_time(spans, parent, begin, end):
+    '''Return the time covered by the children of each span, within it.'''
+    children = numpy.flatnonzero(parent >= 0)
+    p = parent[children]
+    covered = pl.DataFrame({
+        'PARENT': p,
+        'BEGIN': numpy.clip(begin[children], begin[p], end[p]),
+        'END': numpy.clip(end[children], begin[p], end[p])}).sort(
+        'PARENT', 'BEGIN').with_columns(
+        pl.col('END').cum_max().shift(1).over('PARENT').alias('COVERED'))
+    covered = covered.select(
+        pl.col('PARENT'),
+        (pl.col('END') - pl.max_horizontal('BEGIN', 'COVERED')).clip(
+            lower_bound=0).alias('TIME')).group_by('PARENT').agg(
+        pl.col('TIME').sum())
+    time = numpy.zeros(len(spans), dtype=numpy.int64)
+    time[covered['PARENT'].to_numpy()] = covered['TIME'].to_numpy()
+    return time
+
+
+def critical_path(pt, tree):
+    '''Return the spans of the trace in depth first order with their ROOT
+    SPAN ID, DURATION, CHILD TIME and SELF TIME in seconds, and whether they
+    are on the CRITICAL path of their root span.
+    '''
+    spans = tree.index.select('SPAN ID', 'DEPTH').join(
+        span_times(pt), on='SPAN ID', how='left', maintain_order='left')
+    n = len(spans)
+    parent = tree.parent
+    begin = spans['BEGIN'].dt.epoch('us').to_numpy()
+    end = spans['END'].dt.epoch('us').to_numpy()
+
+    # The child of each span that ends last, the latest started on ties
+    children = numpy.flatnonzero(parent >= 0)
+    children = children[numpy.lexsort((begin[children], end[children],
+                                       parent[children]))]
+    last = numpy.ones(len(children), dtype=bool)
+    last[:-1] = parent[children][1:] != parent[children][:-1]
+    critical_child = numpy.full(n, -1)
+    critical_child[parent[children[last]]] = children[last]
+
+    depth = spans['DEPTH'].to_numpy()
+    critical = parent < 0
+    for d in range(1, depth.max()+1 if n else 0):
+        nodes = numpy.flatnonzero(depth == d)
+        critical[nodes] = (critical[parent[nodes]] &
+                           (critical_child[parent[nodes]] == nodes))
+
+    roots = numpy.flatnonzero(parent < 0)
+    root = roots[numpy.searchsorted(roots, numpy.arange(n), side='right')-1]
+    duration = end-begin
+    children_time = child_time(spans, parent, begin, end)
+    return spans.with_columns(
+        spans['SPAN ID'].gather(root).alias('ROOT SPAN ID'),
+        pl.Series('DURATION', duration/1e6),
+        pl.Series('CHILD TIME', children_time/1e6),
+        pl.Series('SELF TIME', (duration-children_time)/1e6),
+        pl.Series('CRITICAL', critical))
+
+
+def main(pt, tree, event=None, tid=None, summary=False):
+    spans = critical_path(pt, tree)
+    if event is not None:
+        roots = spans.filter((pl.col('DEPTH') == 0) &
+                             (pl.col('MESSAGE') == event))['SPAN ID']
+        spans = spans.filter(pl.col('ROOT SPAN ID').is_in(roots))
+    if tid is not None:
+        spans = spans.filter(pl.col('TRANSACTION ID') == tid)
+    path = spans.filter(pl.col('CRITICAL'))
+    if summary:
+        return path.group_by('MESSAGE').agg(
+            pl.len().alias('COUNT'),
+            pl.col('SELF TIME').sum(),
+            pl.col('DURATION').sum(),
+            pl.col('DURATION').mean().alias('MEAN DURATION')).sort(
+            'SELF TIME', descending=True)
+    return path.select('ROOT SPAN ID', 'TRANSACTION ID', 'DEPTH', 'MESSAGE',
+                       'BEGIN', 'DURATION', 'CHILD TIME', 'SELF TIME')
+
+
+if __name__ == '__main__':
+    args = parseArgs(sys.argv[1:])
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
+    tree = load_tree(args.file, progress_trace)
+    result = main(progress_trace, tree, args.event, args.tid, args.summary)
+    with pl.Config(tbl_rows=1000, tbl_cols=-1):
+        print(result)
@@ -5,6 +5,14 @@ import sys
 
 import polars as pl
 
+import rootpath
+from trace_cache import scan_trace
+
+
+# All columns are shown
+COLUMNS = None
+
+
 def parseArgs(args):
     parser = argparse.ArgumentParser()
     parser.add_argument('file', type=str,
@@ -18,7 +26,7 @@ def parseArgs(args):
 
 def main_polars(pt, trans_id):
     progress_trace = pt.filter(
-                        (pl.col('TIMESTAMP') != '') &
+                        (pl.col('TIMESTAMP').is_not_null()) &
                         (pl.col('TRANSACTION ID') == trans_id)
                         )
     
@@ -27,7 +35,7 @@ def main_polars(pt, trans_id):
 
 if __name__ == '__main__':
     args = parseArgs(sys.argv[1:])
-    progress_trace = pl.scan_csv(args.file)
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
     result = main_polars(progress_trace, args.transid)
         
     pl.Config().set_tbl_rows(1000)
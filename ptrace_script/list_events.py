@@ -7,6 +7,14 @@ import time
 
 import polars as pl
 
+import rootpath
+from trace_cache import scan_trace
+
+
+# Columns read from the trace
+COLUMNS = ['EVENT TYPE', 'TIMESTAMP', 'DATASTORE', 'MESSAGE']
+
+
 def parseArgs(args):
     parser = argparse.ArgumentParser()
     parser.add_argument('file', type=str,
@@ -16,19 +24,26 @@ def parseArgs(args):
     return parser.parse_args(args)
 
 
-def main_polars(pt, negate=False):
-    prefix = '-' if negate else '' # TODO?
-
-    progress_trace = pt.filter(
-                        (pl.col('TIMESTAMP') != '') &
+def event_counts(pt):
+    '''Return a LazyFrame of the number of stop events of each event.'''
+    return pt.filter(
+                        (pl.col('TIMESTAMP').is_not_null()) &
                         (pl.col('DATASTORE') == 'running') &
                         (pl.col('EVENT TYPE') ==
                         'stop')).group_by('MESSAGE').len()
 
-    for message, count in progress_trace.collect().iter_rows():
+
+def print_counts(counts):
+    for message, count in counts.iter_rows():
        print(f'{message: <50} {count: >7}')
 
+
+def main_polars(pt, negate=False):
+    prefix = '-' if negate else '' # TODO?
+
+    print_counts(event_counts(pt).collect())
+
 if __name__ == '__main__':
     args = parseArgs(sys.argv[1:])
-    progress_trace = pl.scan_csv(args.file)
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
     main_polars(progress_trace, args.negate)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+"""
+List the stop events of an event in the running datastore, the longest
+first, as list_events_duration.py in the repository root. Events of the
+same duration are listed in the order of the trace, where the pandas
+version sorts them in no particular order.
+"""
+
+import argparse
+import sys
+
+import polars as pl
+
+import rootpath
+from trace_cache import require_columns, scan_trace
+
+
+# Columns read from the trace
+COLUMNS = ['EVENT TYPE', 'TIMESTAMP', 'DURATION', 'TRANSACTION ID',
+           'DATASTORE', 'DEVICE', 'MESSAGE', 'ANNOTATION']
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=str,
+            help='File to process.')
+    parser.add_argument('-e', '--event', type=str, default='sync-from',
+            help='Event name')
+    return parser.parse_args(args)
+
+
+def nan_if_null(value):
+    # Printed as the pandas version prints missing values
+    return float('nan') if value is None else value
+
+
+def main(pt, event='sync-from'):
+    '''Return the TIMESTAMP, MESSAGE, DURATION, DEVICE, TRANSACTION ID and
+    ANNOTATION of the stop events of an event, by descending DURATION.
+    Exits with an error if the trace doesn't have the columns, e.g. DEVICE
+    in NSO 6.1 traces.
+    '''
+    require_columns(pt, COLUMNS)
+    return pt.filter(
+        (pl.col('DATASTORE') == 'running') &
+        (pl.col('EVENT TYPE') == 'stop') &
+        (pl.col('MESSAGE') == event)).select(
+        'TIMESTAMP', pl.col('MESSAGE').cast(pl.String), 'DURATION', 'DEVICE',
+        'TRANSACTION ID', 'ANNOTATION').sort(
+        'DURATION', descending=True, nulls_last=True,
+        maintain_order=True).collect()
+
+
+def print_durations(result):
+    for ts, msg, dur, dev, tid, ann in result.iter_rows():
+        print(f"{ts}  {msg}  {nan_if_null(dur):10.1f}  "+
+              f"{nan_if_null(dev):20} {tid:10} {nan_if_null(ann)}")
+
+
+if __name__ == '__main__':
+    args = parseArgs(sys.argv[1:])
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
+    print_durations(main(progress_trace, args.event))
@@ -5,9 +5,16 @@ from datetime import datetime
 import sys
 
 import polars as pl
+
+import rootpath
+from trace_cache import scan_trace
 import polars.selectors as cs
 
 
+# Columns read from the trace
+COLUMNS = ['TIMESTAMP', 'DURATION', 'TRANSACTION ID', 'MESSAGE']
+
+
 def parseArgs(args):
     parser = argparse.ArgumentParser()
     parser.add_argument('file', type=str,
@@ -23,26 +30,33 @@ def parseArgs(args):
     return parser.parse_args(args)
 
 
-def main(pt, event):
-    progress_trace = pt.filter((pl.col('TIMESTAMP') != '') &
+def longest_spans(pt, event):
+    '''Return a LazyFrame of the events with a duration, the longest
+    first.
+    '''
+    progress_trace = pt.filter((pl.col('TIMESTAMP').is_not_null()) &
                         (pl.col('DURATION').is_not_null())
     )
     if event:
         progress_trace = progress_trace.filter(pl.col('MESSAGE') == event)
 
-    pl.Config().set_tbl_rows(1000)
-
-    data = progress_trace.select([
+    return progress_trace.select([
         'MESSAGE',
         'DURATION',
         'TRANSACTION ID',
         #'ATTRIBUTE VALUE'
-        ]).sort('DURATION', descending=True).collect()
+        ]).sort('DURATION', descending=True)
+
+
+def main(pt, event):
+    pl.Config().set_tbl_rows(1000)
+
+    data = longest_spans(pt, event).collect()
     
     return data
  
 if __name__ == '__main__':
     args = parseArgs(sys.argv[1:])
-    progress_trace = pl.scan_csv(args.file)
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
     data = main(progress_trace, args.event)
     print(data)
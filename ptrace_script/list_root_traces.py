@@ -5,9 +5,17 @@ from datetime import datetime
 import sys
 
 import polars as pl
+
+import rootpath
+from trace_cache import scan_trace
 import polars.selectors as cs
 
 
+# Columns read from the trace
+COLUMNS = ['EVENT TYPE', 'TIMESTAMP', 'DURATION', 'PARENT SPAN ID',
+           'TRANSACTION ID', 'MESSAGE', 'ATTRIBUTE NAME', 'ATTRIBUTE VALUE']
+
+
 def parseArgs(args):
     parser = argparse.ArgumentParser()
     parser.add_argument('file', type=str,
@@ -23,8 +31,11 @@ def parseArgs(args):
     return parser.parse_args(args)
 
 
-def main(pt, event):
-    progress_trace = pt.filter((pl.col('TIMESTAMP') != '') &
+def root_traces(pt, event):
+    '''Return a LazyFrame of the stop events of root spans, the longest
+    first.
+    '''
+    progress_trace = pt.filter((pl.col('TIMESTAMP').is_not_null()) &
                                 (pl.col('PARENT SPAN ID').is_null()) &
                                 (pl.col('EVENT TYPE') == 'stop'))
     
@@ -35,11 +46,15 @@ def main(pt, event):
     return progress_trace.select(['MESSAGE', 'EVENT TYPE', 'DURATION',
                                   'TRANSACTION ID', 'ATTRIBUTE NAME',
                                   'ATTRIBUTE VALUE']).sort('DURATION',
-                                 descending=True).collect()
+                                 descending=True)
+
+
+def main(pt, event):
+    return root_traces(pt, event).collect()
 
 if __name__ == '__main__':
     args = parseArgs(sys.argv[1:])
-    progress_trace = pl.scan_csv(args.file)
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
     result = main(progress_trace, args.event)
     pl.Config().set_tbl_rows(1000)
     print(result)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""
+List the transactions of the running datastore with the row of the stop
+event ending them, as list_tids.py in the repository root.
+
+A transaction is started by a start event when it isn't already started,
+and ended by the next stop event of the same transaction and message as the
+start. Other events of a started transaction are skipped. The stop matching
+each start, and the start following each stop, are found with as-of joins,
+so only the chain of starts and stops of each transaction is followed
+instead of every event.
+"""
+
+import argparse
+import sys
+
+import numpy
+import polars as pl
+
+import rootpath
+from trace_cache import scan_trace
+
+
+# Columns read from the trace
+COLUMNS = ['ROW', 'EVENT TYPE', 'TRANSACTION ID', 'DATASTORE', 'MESSAGE',
+           'ANNOTATION']
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=str,
+            help='File to process.')
+    parser.add_argument('-e', '--event', type=str,
+            help='Event name')
+    return parser.parse_args(args)
+
+
+def nan_if_null(value):
+    # Printed as the pandas version prints missing values
+    return float('nan') if value is None else value
+
+
+def main(pt, event=None):
+    '''Return the ROW, MESSAGE, TRANSACTION ID and ANNOTATION of the stop
+    events ending transactions, in the order of the trace.
+    '''
+    events = pt.filter(
+        (pl.col('DATASTORE') == 'running') &
+        pl.col('EVENT TYPE').is_in(['start', 'stop']) &
+        pl.col('TRANSACTION ID').is_not_null())
+    if event:
+        events = events.filter(pl.col('MESSAGE') == event)
+    events = events.select(
+        'ROW', pl.col('EVENT TYPE').cast(pl.String),
+        pl.col('MESSAGE').cast(pl.String), 'TRANSACTION ID',
+        'ANNOTATION').collect()
+    # Events are ordered by ORDER, the ROW of a row in its file is not
+    # ordered in traces of several files
+    events = events.with_row_index('ORDER')
+
+    starts = events.filter(pl.col('EVENT TYPE') == 'start').select(
+        'ORDER', 'TRANSACTION ID', 'MESSAGE').with_row_index('START')
+    stops = events.filter(pl.col('EVENT TYPE') == 'stop').select(
+        pl.col('ORDER').alias('STOP'), 'TRANSACTION ID', 'MESSAGE')
+    # The stop ending each start, if the start starts the transaction
+    starts = starts.join_asof(stops, left_on='ORDER', right_on='STOP',
+                              by=['TRANSACTION ID', 'MESSAGE'],
+                              strategy='forward', allow_exact_matches=False,
+                              check_sortedness=False)
+    # The start after each stop, starting the transaction again
+    ended = starts.filter(pl.col('STOP').is_not_null()).sort('STOP')
+    after = ended.join_asof(
+        starts.select(pl.col('ORDER').alias('NEXT ORDER'), 'TRANSACTION ID',
+                      pl.col('START').alias('NEXT')),
+        left_on='STOP', right_on='NEXT ORDER', by='TRANSACTION ID',
+        strategy='forward', allow_exact_matches=False,
+        check_sortedness=False)
+
+    stop = starts['STOP'].fill_null(-1).to_numpy()
+    following = numpy.full(len(starts), -1, dtype=numpy.int64)
+    following[after['START'].to_numpy()] = \
+        after['NEXT'].fill_null(-1).to_numpy()
+
+    # Follow the starts of each transaction from its first start
+    current = starts.group_by('TRANSACTION ID').agg(
+        pl.col('START').first())['START'].to_numpy()
+    ending = []
+    while len(current):
+        current = current[stop[current] >= 0]
+        ending.append(stop[current])
+        current = following[current]
+        current = current[current >= 0]
+    ending = numpy.sort(numpy.concatenate(ending)) if ending else []
+
+    return events.filter(pl.col('ORDER').is_in(ending)).select(
+        'ROW', 'MESSAGE', 'TRANSACTION ID', 'ANNOTATION')
+
+
+def print_tids(result):
+    for row, msg, tid, ann in result.iter_rows():
+        print(f"{row}  {nan_if_null(msg):15} {tid} {nan_if_null(ann)}")
+
+
+if __name__ == '__main__':
+    args = parseArgs(sys.argv[1:])
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
+    print_tids(main(progress_trace, args.event))
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+"""
+Interval index over the spans of an event, answering which spans overlap a
+time or another span without rescanning the trace.
+
+The spans are made from the stop events, beginning DURATION before them,
+and from start events without a stop, which run until the end of the
+trace. Each span covers [begin, end) in microseconds, a span of zero
+duration covers the microsecond it begins at.
+
+The sorted begin and end times give the concurrency at any time, and the
+spans are stored in a centered interval tree laid out in arrays: the nodes
+are the sorted distinct endpoints, numbered in order, and a span belongs to
+the highest node it contains. Finding the spans containing a time visits
+one node per level of the tree, so queries take O(log n + k) for k spans
+found.
+"""
+
+import argparse
+import sys
+
+import numpy
+import polars as pl
+
+import rootpath
+from trace_cache import scan_trace
+
+
+# Columns read from the trace
+COLUMNS = ['EVENT TYPE', 'TIMESTAMP', 'DURATION', 'TRANSACTION ID',
+           'DATASTORE', 'MESSAGE']
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=str,
+            help='File to process.')
+    parser.add_argument('-e', '--event', type=str, required=True,
+            help='Event name')
+    parser.add_argument('-t', '--tid', type=int,
+            help='Show the spans overlapping the spans of a transaction.')
+    parser.add_argument('--at', type=str,
+            help='Show the spans running at a timestamp.')
+    parser.add_argument('--every', type=float,
+            help='Sample the concurrency every number of seconds.')
+    return parser.parse_args(args)
+
+
+def event_spans(pt, event):
+    '''Return a DataFrame of the TRANSACTION ID, BEGIN and END of the spans
+    of an event in the running datastore, with a null END for spans not
+    stopped.
+    '''
+    events = pt.filter((pl.col('TIMESTAMP').is_not_null()) &
+                       (pl.col('DATASTORE') == 'running') &
+                       (pl.col('MESSAGE') == event))
+    stops = events.filter((pl.col('EVENT TYPE') == 'stop') &
+                          (pl.col('DURATION').is_not_null())).select(
+        pl.col('TRANSACTION ID'),
+        (pl.col('TIMESTAMP') - pl.duration(microseconds=(
+            pl.col('DURATION')*1e6).round().cast(pl.Int64))).alias('BEGIN'),
+        pl.col('TIMESTAMP').alias('END'))
+    starts = events.filter(pl.col('EVENT TYPE') == 'start').select(
+        pl.col('TRANSACTION ID'),
+        pl.col('TIMESTAMP').alias('BEGIN'))
+    running = starts.join(stops, on=['TRANSACTION ID', 'BEGIN'],
+                          how='anti').with_columns(
+        pl.lit(None, dtype=stops.collect_schema()['END']).alias('END'))
+    return pl.concat([stops, running]).sort('BEGIN').collect()
+
+
+def microseconds(s):
+    return s.dt.epoch('us').to_numpy()
+
+
+class OverlapIndex():
+    def __init__(self, tids, begin, end):
+        self.tids = numpy.asarray(tids)
+        self.begin = numpy.asarray(begin, dtype=numpy.int64)
+        # Inclusive last microsecond of each span
+        self.last = numpy.maximum(numpy.asarray(end, dtype=numpy.int64)-1,
+                                  self.begin)
+        self.sorted_begin = numpy.sort(self.begin)
+        self.sorted_end = numpy.sort(self.last+1)
+        self.by_begin = numpy.argsort(self.begin, kind='stable')
+        self.build_tree()
+
+    @classmethod
+    def from_spans(cls, spans, end=None):
+        '''Index the spans of event_spans, with spans not stopped running
+        until end, or the latest time of the spans.
+        '''
+        begin = microseconds(spans['BEGIN'])
+        stop = spans['END']
+        if end is None:
+            end = max(spans['BEGIN'].max(), stop.max())
+        return cls(spans['TRANSACTION ID'].to_numpy(), begin,
+                   microseconds(stop.fill_null(end)))
+
+    def __len__(self):
+        return len(self.begin)
+
+    def build_tree(self):
+        self.coords = numpy.unique(numpy.concatenate([self.begin, self.last]))
+        # Nodes are numbered 1..len(coords) in order, the root has the
+        # largest power of two and the children of node v with lowest set
+        # bit b are v-b/2 and v+b/2.
+        lo = numpy.searchsorted(self.coords, self.begin)+1
+        hi = numpy.searchsorted(self.coords, self.last)+1
+        diff = lo ^ hi
+        # The node in [lo, hi] with the most trailing zero bits
+        high = numpy.zeros(len(diff), dtype=numpy.int64)
+        nonzero = diff > 0
+        high[nonzero] = numpy.floor(numpy.log2(diff[nonzero])).astype(
+            numpy.int64)
+        # lo and hi share the bits above high, where lo has a 0 and hi a 1,
+        # so it is lo if its lower bits are all 0, or else hi with the bits
+        # below high cleared.
+        node = numpy.where(lo & ((2 << high)-1) == 0, lo,
+                           (hi >> high) << high)
+        node = numpy.where(nonzero, node, hi)
+        self.root = 1 << (len(self.coords).bit_length()-1) \
+            if len(self.coords) else 0
+        # Spans of each node by begin, and by end descending
+        self.node_begin = numpy.lexsort((self.begin, node))
+        self.node_end = numpy.lexsort((-self.last, node))
+        self.node_start = numpy.searchsorted(node[self.node_begin],
+                                             numpy.arange(len(self.coords)+2))
+
+    def stab(self, t):
+        '''Return the indices of the spans running at time t.'''
+        found = []
+        n = len(self.coords)
+        v = self.root
+        step = self.root//2
+        while v:
+            if v <= n:
+                c = self.coords[v-1]
+                a, b = self.node_start[v], self.node_start[v+1]
+                if t == c:
+                    found.append(self.node_begin[a:b])
+                    break
+                if t < c:
+                    spans = self.node_begin[a:b]
+                    k = numpy.searchsorted(self.begin[spans], t, side='right')
+                else:
+                    spans = self.node_end[a:b]
+                    k = numpy.searchsorted(-self.last[spans], -t,
+                                           side='right')
+                found.append(spans[:k])
+            # Nodes after the last endpoint only have nodes to the left
+            if not step:
+                break
+            v += step if v <= n and t > c else -step
+            step //= 2
+        if not found:
+            return numpy.zeros(0, dtype=numpy.int64)
+        return numpy.concatenate(found)
+
+    def overlapping(self, i):
+        '''Return the indices of the spans overlapping span i.'''
+        begin, last = self.begin[i], self.last[i]
+        a = numpy.searchsorted(self.sorted_begin, begin, side='right')
+        b = numpy.searchsorted(self.sorted_begin, last, side='right')
+        found = numpy.concatenate([self.stab(begin), self.by_begin[a:b]])
+        return numpy.sort(found[found != i])
+
+    def concurrency_at(self, t):
+        '''Return the number of spans running at time t.'''
+        return int(numpy.searchsorted(self.sorted_begin, t, side='right') -
+                   numpy.searchsorted(self.sorted_end, t, side='right'))
+
+    def concurrency(self):
+        '''Return the times the number of running spans changes and the
+        number of spans running from each of them.
+        '''
+        times = numpy.concatenate([self.begin, self.last+1])
+        steps = numpy.concatenate([numpy.ones(len(self), numpy.int64),
+                                   -numpy.ones(len(self), numpy.int64)])
+        order = numpy.argsort(times, kind='stable')
+        times = times[order]
+        count = numpy.cumsum(steps[order])
+        keep = numpy.append(times[1:] != times[:-1], True)
+        return times[keep], count[keep]
+
+    def peak(self):
+        '''Return the largest number of spans running at the same time and
+        the first time it occurs.
+        '''
+        if not len(self):
+            return 0, None
+        times, count = self.concurrency()
+        i = numpy.argmax(count)
+        return int(count[i]), int(times[i])
+
+
+def to_datetime(us):
+    return pl.Series('TIMESTAMP', us, dtype=pl.Int64).cast(
+        pl.Datetime('us'))
+
+
+def span_frame(spans, indices):
+    return spans[indices.tolist()].with_columns(
+        ((pl.col('END')-pl.col('BEGIN')).dt.total_microseconds()/1e6
+         ).alias('DURATION'))
+
+
+def concurrency_frame(index, every=None):
+    if every is None:
+        times, count = index.concurrency()
+    else:
+        step = int(every*1e6)
+        times = numpy.arange(index.sorted_begin[0],
+                             index.sorted_end[-1]+step, step)
+        count = (numpy.searchsorted(index.sorted_begin, times, side='right') -
+                 numpy.searchsorted(index.sorted_end, times, side='right'))
+    return pl.DataFrame([to_datetime(times),
+                         pl.Series('CONCURRENCY', count, dtype=pl.Int64)])
+
+
+def overlap_frame(spans, index, tid):
+    '''Return the spans overlapping each span of a transaction.'''
+    frames = []
+    own = numpy.flatnonzero(index.tids == tid)
+    for i in own:
+        found = index.overlapping(i)
+        frames.append(span_frame(spans, found).select(
+            pl.lit(tid, dtype=pl.Int64).alias('OVERLAPPING TID'),
+            pl.lit(spans['BEGIN'][int(i)]).alias('OVERLAPPING BEGIN'),
+            pl.all()))
+    if not frames:
+        return pl.DataFrame()
+    return pl.concat(frames)
+
+
+def main(pt, event, tid=None, at=None, every=None):
+    spans = event_spans(pt, event)
+    end = pt.select(pl.col('TIMESTAMP').max()).collect().item()
+    index = OverlapIndex.from_spans(spans, end)
+    peak, peak_ts = index.peak()
+    print(f"Spans: {len(index)}  Peak concurrency: {peak}", end='')
+    if peak_ts is not None:
+        print(f" at {to_datetime([peak_ts])[0]}", end='')
+    print()
+    if tid is not None:
+        return overlap_frame(spans, index, tid)
+    if at is not None:
+        t = microseconds(pl.Series([at]).str.to_datetime(time_unit='us'))[0]
+        print(f"Concurrency at {at}: {index.concurrency_at(t)}")
+        return span_frame(spans, numpy.sort(index.stab(t)))
+    if not len(index):
+        return pl.DataFrame()
+    return concurrency_frame(index, every)
+
+
+if __name__ == '__main__':
+    args = parseArgs(sys.argv[1:])
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
+    result = main(progress_trace, args.event, args.tid, args.at, args.every)
+    with pl.Config(tbl_rows=1000, tbl_cols=-1):
+        print(result)
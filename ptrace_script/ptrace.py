@@ -1,27 +1,28 @@
-from calc_events_stats import get_statistics as polars_calc_event_stats
-from filter_trans_id import main_polars as polars_filter_trans_id
-from list_events import main_polars as polars_list_events
-from list_longest_spans import main as polars_list_longest_spans
-from list_root_traces import main as polars_list_root_traces
-from show_overlap import main as polars_show_overlap
-from show_span import main as polars_show_span
-import polars as pl
+import sys
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 
+import rootpath
+from trace_client import request, socket_path
 
-import sys
-from argparse import ArgumentParser, RawDescriptionHelpFormatter
+# The command modules, polars and the trace cache are imported by the
+# commands using them, so that only the dependencies of the command run are
+# loaded, and none by a command sent to the server.
 
 
 class PtraceParser():
-    parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
-    subparsers = parser.add_subparsers(dest="command")
-    subparsers.cmds = []
-    
+    commands = []
+
     def __init__(self):
+        self.parser = ArgumentParser(formatter_class=RawDescriptionHelpFormatter)
+        self.subparsers = self.parser.add_subparsers(dest="command")
+        self.subparsers.cmds = []
         
-        self.parser.add_argument('-f', '--file', type=str, help='File to process.')
+        self.parser.add_argument('-f', '--file', type=str, help='File, directory or glob pattern of files to process.')
         self.parser.add_argument('-r', '--rows', type=int, default=1000, help='Number of rows to display.')
+        self.parser.add_argument('-b', '--begin', type=str, help='Only the rows from a timestamp, e.g. 2023-05-02T19:45:40.')
+        self.parser.add_argument('--end', type=str, help='Only the rows until a timestamp.')
+        for func, arguments, help in self.commands:
+            self.add_parser(func, arguments, help)
         
         l = [(f"{n} {s}",h) for n,s,h in self.subparsers.cmds]
         maxl = max(len(s) for s,_ in l)
@@ -31,10 +32,9 @@ class PtraceParser():
             "\n".join([f"  {s:<{maxl}}   {h}" for s,h in l])
             )
         
-    @classmethod
-    def add_parser(cls, func, arguments=[], help=''):
+    def add_parser(self, func, arguments=[], help=''):
         name = func.__name__
-        parser = cls.subparsers.add_parser(name, description=func.__doc__)
+        parser = self.subparsers.add_parser(name, description=func.__doc__)
         for t, args, kwargs in arguments:
             if t == 'a':
                 parser.add_argument(*args, **kwargs)
@@ -45,7 +45,7 @@ class PtraceParser():
         parser.set_defaults(func=func)
         def strip_prefix(s):
             return s[len(parser.prog)+8:].rstrip()
-        cls.subparsers.cmds.append((name, strip_prefix(parser.format_usage()),
+        self.subparsers.cmds.append((name, strip_prefix(parser.format_usage()),
                            help))
 
 def argument(*name_or_flags, **kwargs):
@@ -55,16 +55,69 @@ def mutex(arguments, **kwargs):
 
 def command(arguments=[], help=''):
     def decorator(func):
-        PtraceParser.add_parser(func, arguments, help)
+        PtraceParser.commands.append((func, arguments, help))
     return decorator
 
-@command(arguments=[], help='Calculate event statistics.')
+# Commands run by report, in report.QUERIES
+REPORT_COMMANDS = ['calc_event_stats', 'list_events', 'list_longest_spans',
+                   'list_root_traces']
+
+# TraceStore of the traces in memory when serving
+store = None
+
+def import_script(name):
+    '''Import a module of ptrace_script by its path, for the modules with
+    the same name as a module of the repository root.
+    '''
+    import importlib.util
+    import os
+    module_name = f'ptrace_{name}'
+    module = sys.modules.get(module_name)
+    if module is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            f'{name}.py')
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return module
+
+def load_trace(args, columns=None):
+    if store is not None:
+        return store.scan(args.file, args.begin, args.end, columns)
+    from trace_cache import scan_trace
+    return scan_trace(args.file, args.begin, args.end, columns)
+
+@command(arguments=[argument('-s', '--save-sketch',
+                                type=str,
+                                help='Write the sketch of the durations to '+
+                                     'a Parquet file.'),
+                       argument('-m', '--merge',
+                                type=str,
+                                nargs='+',
+                                default=[],
+                                help='Sketch files to merge with the trace.'),
+                       argument('--histogram',
+                                action='store_true',
+                                default=False,
+                                help='Show a histogram of the durations.')],
+            help='Calculate event statistics.')
 def calc_event_stats(args):
     """
-    Calculating event stats
+    Calculating event stats, with percentiles of the durations. The sketch
+    of the durations saved with --save-sketch, e.g. of several files or
+    windows of time, are merged with --merge into the statistics of all of
+    them, with estimated percentiles, without reading the traces again.
     """
-    progress_trace = pl.scan_csv(args.file)
-    print_progress_trace(polars_calc_event_stats(progress_trace))
+    from calc_events_stats import COLUMNS, main as polars_calc_event_stats
+    progress_trace = None
+    if args.file or not args.merge:
+        progress_trace = load_trace(args, COLUMNS)
+    stats, histograms = polars_calc_event_stats(
+        progress_trace, args.save_sketch, args.merge, args.histogram)
+    print_progress_trace(stats)
+    if histograms is not None:
+        print_progress_trace(histograms)
 
 @command(arguments=[argument('-t', '--tid', 
                                 dest='transid',
@@ -78,7 +131,8 @@ def filter_trans_id(args):
     """
     View a specific transactions events, based on transaction ID.
     """
-    progress_trace = pl.scan_csv(args.file)
+    from filter_trans_id import COLUMNS, main_polars as polars_filter_trans_id
+    progress_trace = load_trace(args, COLUMNS)
     result = polars_filter_trans_id(progress_trace, args.transid)
     if args.output:
         result.write_csv(args.output, separator=',')
@@ -94,7 +148,8 @@ def list_events(args):
     """
     List all events in the trace, with the number of occurrences.
     """
-    progress_trace = pl.scan_csv(args.file)
+    from list_events import COLUMNS, main_polars as polars_list_events
+    progress_trace = load_trace(args, COLUMNS)
     polars_list_events(progress_trace, args.negate)
 
 #TODO: Support show-spans, find-spans and hide-rows ?
@@ -118,7 +173,8 @@ def list_longest_spans(args):
     """
     List event span durations, ordered by duration.
     """
-    progress_trace = pl.scan_csv(args.file)
+    from list_longest_spans import COLUMNS, main as polars_list_longest_spans
+    progress_trace = load_trace(args, COLUMNS)
     result = polars_list_longest_spans(progress_trace, args.event)
     print_progress_trace(result)
 
@@ -144,7 +200,8 @@ def list_root_traces(args):
     """
     List all root spans, i.e. spans without a parent.
     """
-    progress_trace = pl.scan_csv(args.file)
+    from list_root_traces import COLUMNS, main as polars_list_root_traces
+    progress_trace = load_trace(args, COLUMNS)
     result = polars_list_root_traces(progress_trace, args.event)
     print_progress_trace(result)
 
@@ -169,9 +226,69 @@ def show_overlap(args):
     """
     List overlapping events, with each timestamp the overlap occurs.
     """
-    progress_trace = pl.scan_csv(args.file)
+    from show_overlap import COLUMNS, main as polars_show_overlap
+    progress_trace = load_trace(args, COLUMNS)
     polars_show_overlap(progress_trace, args.hide_rows, args.show_spans, args.find_spans, args.event)
 
+@command(arguments=[argument('-e', '--event',
+                                required=True,
+                                type=str,
+                                help='Event name'),
+                       argument('-t', '--tid',
+                                type=int,
+                                help='Show the spans overlapping the spans '+
+                                     'of a transaction.'),
+                       argument('--at',
+                                type=str,
+                                help='Show the spans running at a timestamp.'),
+                       argument('--every',
+                                type=float,
+                                help='Sample the concurrency every number '+
+                                     'of seconds.')],
+            help='Index overlapping spans.')
+def overlap_index(args):
+    """
+    Index the spans of an event by time, showing the peak concurrency and
+    the concurrency over time, the spans running at a timestamp or the
+    spans overlapping the spans of a transaction.
+    """
+    from overlap_index import COLUMNS, main as polars_overlap_index
+    progress_trace = load_trace(args, COLUMNS)
+    result = polars_overlap_index(progress_trace, args.event, args.tid,
+                                  args.at, args.every)
+    print_progress_trace(result)
+
+@command(arguments=[argument('-e', '--event',
+                                type=str,
+                                help='Event name'),
+                       argument('--every',
+                                type=str,
+                                default='1m',
+                                help='Start a window every duration, e.g. '+
+                                     '10s, 1m or 1h.'),
+                       argument('--period',
+                                type=str,
+                                help='Length of the windows, longer than '+
+                                     '--every for rolling windows.'),
+                       argument('-o', '--output',
+                                type=str,
+                                help='File to write the result to, as '+
+                                     'Parquet if it ends with .parquet, '+
+                                     'else as csv.')],
+            help='Show event metrics over time.')
+def timeseries(args):
+    """
+    Show the count, rate, duration percentiles and peak concurrency of each
+    event in windows of time, fixed windows of --every or rolling windows
+    of --period starting every --every.
+    """
+    from timeseries import COLUMNS, main as polars_timeseries
+    progress_trace = load_trace(args, COLUMNS)
+    result = polars_timeseries(progress_trace, args.event, args.every,
+                               args.period, args.output)
+    if result is not None:
+        print_progress_trace(result)
+
 @command(arguments=[argument('-s', '--span',
                                 required=True,
                                 type=str,
@@ -179,26 +296,183 @@ def show_overlap(args):
             help='Show span.')
 def show_span(args):
     """
-    Show a span and all of its child events.
+    Show the ancestors of a span, the span and all of its descendants.
     """
-    progress_trace = pl.scan_csv(args.file)
-    result = polars_show_span(progress_trace, args.span)
+    from show_span import COLUMNS, main as polars_show_span
+    from span_tree import load_tree
+    progress_trace = load_trace(args, COLUMNS)
+    result = polars_show_span(progress_trace, args.span,
+                              load_tree(args.file, progress_trace,
+                                        store=not (args.begin or args.end)))
     print_progress_trace(result)
     
+@command(arguments=[argument('-e', '--event',
+                                type=str,
+                                help='Only the critical path of root spans '+
+                                     'of an event.'),
+                       argument('-t', '--tid',
+                                type=int,
+                                help='Only the critical path of a '+
+                                     'transaction.'),
+                       argument('-s', '--summary',
+                                action='store_true',
+                                default=False,
+                                help='Aggregate the critical path spans by '+
+                                     'event.')],
+            help='Show the critical path of root spans.')
+def critical_path(args):
+    """
+    Show the chain of child spans ending last, that determined the end of
+    each root span, with the self time and child time of each span.
+    """
+    from critical_path import COLUMNS, main as polars_critical_path
+    from span_tree import load_tree
+    progress_trace = load_trace(args, COLUMNS)
+    result = polars_critical_path(progress_trace,
+                                  load_tree(args.file, progress_trace,
+                                            store=not (args.begin or
+                                                       args.end)),
+                                  args.event, args.tid, args.summary)
+    print_progress_trace(result)
+
+@command(arguments=[argument('-e', '--event',
+                                type=str,
+                                help='Event name')],
+            help='List transactions.')
+def list_tids(args):
+    """
+    List the transactions of the running datastore, with the row of the
+    stop event ending each transaction.
+    """
+    list_tids = import_script('list_tids')
+    progress_trace = load_trace(args, list_tids.COLUMNS)
+    list_tids.print_tids(list_tids.main(progress_trace, args.event))
+
+@command(arguments=[argument('-e', '--event',
+                                type=str,
+                                default='sync-from',
+                                help='Event name')],
+            help='List event durations.')
+def list_events_duration(args):
+    """
+    List the stop events of an event in the running datastore, the longest
+    first.
+    """
+    list_events_duration = import_script('list_events_duration')
+    progress_trace = load_trace(args, list_events_duration.COLUMNS)
+    list_events_duration.print_durations(
+        list_events_duration.main(progress_trace, args.event))
+
+@command(arguments=[argument('-e', '--event',
+                                type=str,
+                                default='sync-from',
+                                help='Event name'),
+                       argument('-5',
+                                action='store_true',
+                                default=False,
+                                dest='nso5',
+                                help='Handle as NSO 5.x compatible '+
+                                     'progress trace.'),
+                       argument('--old',
+                                action='store_true',
+                                default=False,
+                                help='Use event \'apply transaction\' as '+
+                                     'lock event.')],
+            help='Summarize time inside and between locks.')
+def summarize_locks(args):
+    """
+    Summarize the time inside and between transaction locks, and the time
+    to the first lock, of the actions of an event.
+    """
+    from summarize_locks import COLUMNS, main as polars_summarize_locks
+    progress_trace = load_trace(args, COLUMNS)
+    print("=====", args.file, "=====")
+    polars_summarize_locks(progress_trace, args.event, args.nso5, args.old)
+
+@command(arguments=[argument('-c', '--commands',
+                                type=str,
+                                nargs='+',
+                                choices=REPORT_COMMANDS,
+                                default=REPORT_COMMANDS,
+                                metavar='COMMAND',
+                                help='Commands to run, of '+
+                                     ', '.join(REPORT_COMMANDS)+'.'),
+                       argument('-e', '--event',
+                                type=str,
+                                help='Event name of list_longest_spans and '+
+                                     'list_root_traces.'),
+                       argument('-o', '--output',
+                                type=str,
+                                help='Directory to write the result of '+
+                                     'each command to, as csv.')],
+            help='Run several commands in one pass.')
+def report(args):
+    """
+    Run calc_event_stats, list_events, list_longest_spans and
+    list_root_traces, or the given commands, reading the trace once for
+    all of them.
+    """
+    from report import columns, main as polars_report, print_results, \
+        write_results
+    progress_trace = load_trace(args, columns(args.commands))
+    results = polars_report(progress_trace, args.commands, args.event)
+    if args.output:
+        write_results(results, args.output)
+    else:
+        print_results(results, print_progress_trace)
+
+@command(arguments=[argument('files',
+                                nargs='*',
+                                help='Files, directories or glob patterns '+
+                                     'of traces to load at start.')],
+            help='Serve commands from traces in memory.')
+def serve(args):
+    """
+    Load traces into memory and serve the other commands on a Unix socket,
+    until interrupted. Commands run while the server is listening are sent
+    to it, and the output of a command is reused until its trace changes.
+    The socket is PTRACE_SOCKET, the same for the server and the commands.
+    """
+    from trace_server import TraceStore, serve as serve_traces
+    socket = socket_path()
+    if not socket:
+        raise SystemExit("PTRACE_SOCKET is empty, set it to the socket to "+
+                         "serve on.")
+    global store
+    store = TraceStore()
+    for path in args.files + ([args.file] if args.file else []):
+        store.trace(path)
+        print(f"Loaded {path}")
+    try:
+        serve_traces(socket, store, PtraceParser().parser.parse_args, run)
+    except KeyboardInterrupt:
+        print()
+
 def print_progress_trace(pt):
+    import polars as pl
+    from trace_cache import text_columns
     pl.Config().set_tbl_rows(n_rows)
     with pl.Config(tbl_cols=-1):
-        print(pt)
+        print(text_columns(pt))
+
+def run(args):
+    global n_rows
+    n_rows = args.rows
+    args.func(args)
 
 def main():
     my_parser = PtraceParser()
     args = my_parser.parser.parse_args()
-    global n_rows
-    n_rows = args.rows
     if args.command is None:
         my_parser.parser.print_help()
-    else:
-        args.func(args)
+        sys.exit()
+    if args.command != 'serve':
+        reply = request(socket_path(), sys.argv[1:])
+        if reply is not None:
+            status, output = reply
+            print(output, end='')
+            sys.exit(status)
+    run(args)
     sys.exit()
     
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+Overview of a progress trace from several queries run in one pass.
+
+The queries of calc_event_stats, list_events, list_longest_spans and
+list_root_traces are built as LazyFrames of the same cached scan of the
+trace and collected together with collect_all, which reads the trace once
+for all of them. Queries needing columns that the trace doesn't have are skipped.
+"""
+
+import argparse
+import os
+import sys
+
+import polars as pl
+
+import rootpath
+from trace_cache import scan_trace
+import calc_events_stats
+import list_events
+import list_longest_spans
+import list_root_traces
+
+
+# Query of each command, as the columns it reads and a function of the
+# trace and the event name returning the LazyFrame of its result.
+QUERIES = {
+    'calc_event_stats': (calc_events_stats.COLUMNS,
+                         lambda pt, event: calc_events_stats.statistics(pt)),
+    'list_events': (list_events.COLUMNS,
+                    lambda pt, event: list_events.event_counts(pt)),
+    'list_longest_spans': (list_longest_spans.COLUMNS,
+                           list_longest_spans.longest_spans),
+    'list_root_traces': (list_root_traces.COLUMNS,
+                         list_root_traces.root_traces),
+}
+COMMANDS = list(QUERIES)
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=str,
+            help='File to process.')
+    parser.add_argument('-c', '--commands', type=str, nargs='+',
+            choices=COMMANDS, default=COMMANDS,
+            help='Commands to run.')
+    parser.add_argument('-e', '--event', type=str,
+            help='Event name of list_longest_spans and list_root_traces.')
+    parser.add_argument('-o', '--output', type=str,
+            help='Directory to write the result of each command to.')
+    return parser.parse_args(args)
+
+
+def columns(commands):
+    '''Return the columns read by any of the commands.'''
+    names = []
+    for command in commands:
+        names.extend(c for c in QUERIES[command][0] if c not in names)
+    return names
+
+
+def main(pt, commands=COMMANDS, event=None):
+    '''Return the result of each command, or None for commands needing
+    columns that the trace doesn't have.
+    '''
+    schema = pt.collect_schema()
+    # Without the cache the filters of each query are pushed down into
+    # scans of their own.
+    pt = pt.cache()
+    queries = {}
+    for command in commands:
+        needed, query = QUERIES[command]
+        if all(c in schema for c in needed):
+            queries[command] = query(pt, event)
+    results = dict(zip(queries, pl.collect_all(list(queries.values()))))
+    return {command: results.get(command) for command in commands}
+
+
+def write_results(results, directory):
+    '''Write each result to <command>.csv in a directory.'''
+    os.makedirs(directory, exist_ok=True)
+    for command, result in results.items():
+        if result is not None:
+            result.write_csv(os.path.join(directory, command + '.csv'))
+
+
+def print_results(results, print_result=print):
+    for command, result in results.items():
+        print(f"=== {command} ===")
+        if result is None:
+            print("Skipped, the trace doesn't have the columns of the "+
+                  "command")
+        elif command == 'list_events':
+            list_events.print_counts(result)
+        else:
+            print_result(result)
+        print()
+
+
+if __name__ == '__main__':
+    args = parseArgs(sys.argv[1:])
+    progress_trace = scan_trace(args.file, columns=columns(args.commands))
+    results = main(progress_trace, args.commands, args.event)
+    if args.output:
+        write_results(results, args.output)
+    else:
+        with pl.Config(tbl_rows=1000, tbl_cols=-1):
+            print_results(results)
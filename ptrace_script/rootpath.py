@@ -0,0 +1,11 @@
+"""
+Make the modules shared with the tools in the repository root, e.g.
+trace_cache, importable from the ptrace scripts.
+"""
+
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root not in sys.path:
+    sys.path.append(root)
@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 
 import argparse
-from datetime import datetime
 import sys
 
 import polars as pl
 
+import rootpath
+from trace_cache import scan_trace, text_columns
+
+
+# Columns read from the trace
+COLUMNS = ['EVENT TYPE', 'TIMESTAMP', 'TRANSACTION ID', 'DATASTORE', 'MESSAGE']
+
 
 def parseArgs(args):
     parser = argparse.ArgumentParser()
@@ -24,7 +30,7 @@ def parseArgs(args):
 
 def main(pt, hide_rows, show_spans, find_spans, event):
     progress_trace = pt.filter(
-                        (pl.col('TIMESTAMP') != '') &
+                        (pl.col('TIMESTAMP').is_not_null()) &
                         (pl.col('DATASTORE') == 'running') &
                         (pl.col('MESSAGE') == event)
     )
@@ -34,7 +40,8 @@ def main(pt, hide_rows, show_spans, find_spans, event):
         
     spans = {}
 
-    for fields in progress_trace.collect().iter_rows(named=True):
+    for fields in text_columns(progress_trace.collect()).iter_rows(
+            named=True):
         et = fields['EVENT TYPE']
         m = fields['MESSAGE']
         ts = fields['TIMESTAMP']
@@ -54,5 +61,5 @@ def main(pt, hide_rows, show_spans, find_spans, event):
 
 if __name__ == '__main__':
     args = parseArgs(sys.argv[1:])
-    progress_trace = pl.scan_csv(args.file)
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
     main(progress_trace, args.hide_rows, args.show_spans, args.find_spans, args.event)
@@ -4,6 +4,14 @@ import sys
 
 import polars as pl
 
+import rootpath
+from trace_cache import scan_trace
+from span_tree import load_tree
+
+
+# All columns are shown
+COLUMNS = None
+
 
 def parseArgs(args):
     parser = argparse.ArgumentParser()
@@ -13,35 +21,25 @@ def parseArgs(args):
             help='Span ID')
     return parser.parse_args(args)
 
-def main(progress_trace, span):
-    # TODO: Add whatever's done below with with row index
-    #progress_trace = pl.scan_parquet(args.file).with_row_index(name="n", offset=1)
-    root_span = progress_trace.filter(pl.col('SPAN ID') == span).collect()
-    parent_span_id = root_span.item(0, 'PARENT SPAN ID')
-    parent_spans = progress_trace.filter(pl.col('SPAN ID') == parent_span_id).collect()
-
-    df = pl.concat([parent_spans, root_span])
-    return df
-
-def ancestors(pt, span_id):
-    span = pt.filter(pl.col('SPAN ID') == span_id).collect()
-    psi = span.item(0, 'PARENT SPAN ID')
-    n = span.item(0, 'n')
-    
-    upper_df = pt.slice(0, n + 1)
-    parents = upper_df.filter(pl.col('SPAN ID') == span_id)
-
-    df = pl.concat([parents, span])
-    for p in parents.iter_rows(named = True):
-        ancestors(upper_df, p['SPAN ID'])
+def main(progress_trace, span, tree):
+    '''Return the events of the ancestors of a span, the span and all of
+    its descendants, in depth first order.
+    '''
+    if span not in tree:
+        return progress_trace.head(0).collect()
+    spans = pl.concat([tree.ancestors(span), tree.subtree(span)]).select(
+        'SPAN ID', 'DEPTH', 'ENTER')
+    rows = progress_trace.filter(pl.col('SPAN ID').is_in(spans['SPAN ID']))
+    return rows.join(spans.lazy(), on='SPAN ID', maintain_order='left').sort(
+        'ENTER', maintain_order=True).select(
+        'DEPTH', pl.exclude('DEPTH', 'ENTER')).collect()
 
-def descendants():
-    pass
 
 if __name__ == '__main__':
     args = parseArgs(sys.argv[1:])
-    progress_trace = pl.scan_csv(args.file)
-    result = main(progress_trace, args.span)
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
+    result = main(progress_trace, args.span,
+                  load_tree(args.file, progress_trace))
     
     with pl.Config(tbl_cols=-1):
       print(result)
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Index of the span tree of a progress trace, from the SPAN ID and PARENT
+SPAN ID columns of NSO 6 traces.
+
+The index is built in one pass over the trace and numbers the spans in
+depth first order (nested sets): a span is entered at its position in the
+order and its subtree ends at exit, so the descendants of a span are the
+spans from enter to exit and a span is an ancestor of another if its range
+contains the range of the other. Children are ordered by their first row in
+the trace.
+
+The index is stored next to the trace (<file>.spans.parquet) and rebuilt
+when the trace changes, like the trace cache. The index of traces of several
+files is built each time.
+"""
+
+import numpy
+import polars as pl
+
+import rootpath
+from trace_cache import is_cache_valid, trace_files, use_cache, write_cache
+
+
+INDEX_SUFFIX = '.spans.parquet'
+
+
+def index_file(filename):
+    return filename + INDEX_SUFFIX
+
+
+def parent_positions(spans):
+    '''Return the position of the parent of each span, or -1 if the
+    parent is not in the trace.
+    '''
+    positions = spans.select('SPAN ID').with_row_index('PARENT')
+    parent = spans.join(positions, left_on='PARENT SPAN ID',
+                        right_on='SPAN ID', how='left',
+                        maintain_order='left')['PARENT']
+    return parent.cast(pl.Int64).fill_null(-1).to_numpy().copy()
+
+
+def build_index(pt):
+    '''Return a DataFrame of the spans of a trace in depth first order, with
+    SPAN ID, PARENT SPAN ID, ROW (first row of the span), DEPTH, ENTER and
+    EXIT.
+    '''
+    if 'SPAN ID' not in pt.collect_schema():
+        raise ValueError("Progress trace has no SPAN ID column, "+
+                         "span trees require NSO 6 progress traces")
+    spans = pt.with_row_index('ROW').filter(
+        pl.col('SPAN ID').is_not_null()).group_by('SPAN ID').agg(
+        pl.col('ROW').first(),
+        pl.col('PARENT SPAN ID').drop_nulls().first()).sort('ROW').collect()
+    n = len(spans)
+    parent = parent_positions(spans)
+    parent[parent == numpy.arange(n)] = -1
+
+    depth = numpy.zeros(n, dtype=numpy.int64)
+    up = parent.copy()
+    for _ in range(n):
+        above = up >= 0
+        if not above.any():
+            break
+        depth[above] += 1
+        up[above] = parent[up[above]]
+    else:
+        if n:
+            raise ValueError("Cycle in the parent spans of the trace")
+
+    levels = [numpy.flatnonzero(depth == d) for d in range(depth.max()+1)] \
+        if n else []
+    size = numpy.ones(n, dtype=numpy.int64)
+    for nodes in reversed(levels[1:]):
+        numpy.add.at(size, parent[nodes], size[nodes])
+
+    # Each span is entered after its parent and the subtrees of its earlier
+    # siblings.
+    enter = numpy.zeros(n, dtype=numpy.int64)
+    for d, nodes in enumerate(levels):
+        if d:
+            nodes = nodes[numpy.argsort(parent[nodes], kind='stable')]
+            group = parent[nodes]
+            base = enter[group]+1
+        else:
+            group = numpy.zeros(len(nodes), dtype=numpy.int64)
+            base = 0
+        before = numpy.cumsum(size[nodes])-size[nodes]
+        first = numpy.flatnonzero(numpy.diff(group, prepend=-2) != 0)
+        before -= numpy.repeat(before[first],
+                               numpy.diff(numpy.append(first, len(nodes))))
+        enter[nodes] = base+before
+
+    return spans.with_columns(
+        pl.Series('DEPTH', depth),
+        pl.Series('ENTER', enter),
+        pl.Series('EXIT', enter+size-1)).sort('ENTER')
+
+
+class SpanTree():
+    def __init__(self, index):
+        self.index = index
+        self.ids = dict(zip(index['SPAN ID'].to_list(), range(len(index))))
+        self.exit = index['EXIT'].to_numpy()
+        self.parent = parent_positions(index)
+        self.parent[self.parent == numpy.arange(len(index))] = -1
+
+    def __contains__(self, span_id):
+        return span_id in self.ids
+
+    def is_ancestor(self, a, b):
+        '''Return True if span a is an ancestor of span b.'''
+        a, b = self.ids[a], self.ids[b]
+        return a < b <= self.exit[a]
+
+    def ancestors(self, span_id):
+        '''Return the ancestors of a span, from the root.'''
+        chain = []
+        i = self.parent[self.ids[span_id]]
+        while i >= 0:
+            chain.append(i)
+            i = self.parent[i]
+        return self.index[chain[::-1]]
+
+    def subtree(self, span_id):
+        '''Return a span and all of its descendants in depth first order.'''
+        i = self.ids[span_id]
+        return self.index[i:self.exit[i]+1]
+
+
+def load_tree(filename, pt, store=True):
+    '''Return the SpanTree of a trace, reading the stored index if it is up
+    to date and otherwise building and storing it. With store False, e.g.
+    when pt is a part of the trace, the index is built and not stored.
+    '''
+    files = trace_files(filename)
+    if not store or len(files) > 1:
+        return SpanTree(build_index(pt))
+    filename = files[0]
+    path = index_file(filename)
+    if use_cache() and is_cache_valid(filename, path):
+        return SpanTree(pl.read_parquet(path))
+    index = build_index(pt)
+    if use_cache():
+        try:
+            write_cache(filename, path, lambda tmp, metadata:
+                        index.write_parquet(tmp, metadata=metadata))
+        except OSError:
+            pass
+    return SpanTree(index)
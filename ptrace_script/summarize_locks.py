@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+"""
+Summarize the time inside and between transaction locks of the running
+datastore, as summarize_events.py in the repository root.
+
+The lock events are sorted by timestamp and the number of locks held after
+each of them is a running sum: an acquire adds a lock and a release removes
+the lock of its transaction, if the transaction holds one. The time between
+locks is from the time the number of locks held drops to 0 until it is 1
+again. The counts, the first and last timestamps and the lock events are
+queried from one scan of the trace.
+"""
+
+import argparse
+import sys
+
+import numpy
+import polars as pl
+
+import rootpath
+from trace_cache import scan_trace
+
+
+# Columns read from the trace
+COLUMNS = ['EVENT TYPE', 'TIMESTAMP', 'DURATION', 'TRANSACTION ID',
+           'DATASTORE', 'MESSAGE']
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=str,
+            help='File to process.')
+    parser.add_argument('-e', '--event', type=str, default='sync-from',
+            help='Event name')
+    parser.add_argument('-5', action='store_true', default=False, dest='nso5',
+            help='Handle as NSO 5.x compatible progress trace.')
+    parser.add_argument('--old', action='store_true', default=False,
+            help='Use event \'apply transaction\' as lock event.')
+    return parser.parse_args(args)
+
+
+def lock_filter(nso5, old):
+    '''Return the filter of the lock events, the event types acquiring and
+    releasing a lock and the event type counted as a lock. old only
+    applies to NSO 5 traces.
+    '''
+    event_type, message = pl.col('EVENT TYPE'), pl.col('MESSAGE')
+    if nso5 and not old:
+        locks = (((event_type == 'stop') &
+                  (message == 'grabbing transaction lock')) |
+                 ((event_type == 'info') &
+                  (message == 'releasing transaction lock')))
+        return locks, 'stop', 'info', 'stop'
+    if nso5:
+        return message == 'applying transaction', 'start', 'stop', 'start'
+    return message == 'holding transaction lock', 'start', 'stop', 'start'
+
+
+def lock_sweep(locks, acquire, release):
+    '''Add the COUNT of locks held after each lock event and the CHANGE of
+    it by the event, to lock events sorted by timestamp.
+    '''
+    event_type, tid = pl.col('EVENT TYPE'), 'TRANSACTION ID'
+    step = pl.when(event_type == acquire).then(1).when(
+        event_type == release).then(-1).otherwise(0)
+    total = step.cum_sum().over(tid)
+    # Releases of a transaction not holding a lock don't count
+    held = total - total.cum_min().over(tid).clip(upper_bound=0)
+    change = held - held.shift(1, fill_value=0).over(tid)
+    return locks.with_columns(change.alias('CHANGE')).with_columns(
+        pl.col('CHANGE').cum_sum().alias('COUNT'))
+
+
+def print_overlapping(tids, count, change):
+    # Replay only the periods the lock is held that contain overlapping
+    # acquires, to list the transactions holding the lock.
+    overlapping = numpy.flatnonzero((change == 1) & (count > 1))
+    free = numpy.flatnonzero(count == 0)
+    end = -1
+    for i in overlapping:
+        if i <= end:
+            continue
+        n = numpy.searchsorted(free, i)
+        begin = free[n-1]+1 if n else 0
+        end = free[n] if n < len(free) else len(tids)-1
+        overlap_tids = []
+        for j in range(begin, end+1):
+            if change[j] == 1:
+                overlap_tids.append(tids[j])
+                if len(overlap_tids) > 1:
+                    print("Overlapping events, count as 0 sec gap.",
+                          overlap_tids)
+            elif change[j] == -1:
+                overlap_tids.remove(tids[j])
+
+
+def nan_if_null(value):
+    # Printed as the pandas version prints missing values
+    return float('nan') if value is None else value
+
+
+def seconds(begin, end):
+    if begin is None or end is None:
+        return float('nan')
+    return (end-begin).total_seconds()
+
+
+def main(pt, event='sync-from', nso5=False, old=False):
+    '''Print the number of actions, the time inside locks and statistics
+    of the time between locks.
+    '''
+    locks, acquire, release, counted = lock_filter(nso5, old)
+    event_type, timestamp = pl.col('EVENT TYPE'), pl.col('TIMESTAMP')
+    running = pt.filter(pl.col('DATASTORE') == 'running').select(
+        'EVENT TYPE', 'TIMESTAMP', 'DURATION', 'TRANSACTION ID', 'MESSAGE')
+
+    actions = running.filter(pl.col('MESSAGE') == event).select(
+        (event_type == 'start').sum().alias('ACTIONS'),
+        timestamp.filter(event_type == 'start').first().alias('FIRST'),
+        timestamp.filter(event_type == 'stop').last().alias('LAST'))
+    lock_events = running.filter(locks)
+    lock_counts = lock_events.select(
+        (event_type == counted).sum().alias('LOCKS'),
+        timestamp.filter(event_type == counted).first().alias('FIRST LOCK'))
+    sweep = lock_sweep(lock_events.sort('TIMESTAMP', nulls_last=True,
+                                        maintain_order=True),
+                       acquire, release)
+    if nso5 and not old:
+        # The duration of a release is the time since the latest acquire
+        acquired = pl.when(event_type == acquire).then(
+            timestamp).forward_fill()
+        sweep = sweep.with_columns(
+            pl.when((event_type == release) & acquired.is_not_null()).then(
+                (timestamp-acquired).dt.total_microseconds()/1e6).otherwise(
+                pl.col('DURATION')).alias('DURATION'))
+    actions, lock_counts, sweep = pl.collect_all(
+        [actions, lock_counts, sweep])
+
+    count = sweep['COUNT'].to_numpy()
+    change = sweep['CHANGE'].to_numpy()
+    print_overlapping(sweep['TRANSACTION ID'].to_list(), count, change)
+    ts = sweep['TIMESTAMP'].to_numpy()
+    starts = ts[numpy.flatnonzero((change == 1) & (count == 1))][1:]
+    ends = ts[numpy.flatnonzero((change == -1) & (count == 0))]
+    bt_locks = pl.Series((starts-ends[:len(starts)]) /
+                         numpy.timedelta64(1, 's')).drop_nans()
+    htl_sum = sweep.filter(pl.col('EVENT TYPE') == release)['DURATION'].sum()
+
+    t_cnt, first_ts, last_ts = actions.row(0)
+    htl_cnt, first_lock = lock_counts.row(0)
+    delta = seconds(first_ts, last_ts)
+    delta_lock = seconds(first_ts, first_lock)
+    mean, std, min_, max_ = (nan_if_null(v) for v in (
+        bt_locks.mean(), bt_locks.std(), bt_locks.min(), bt_locks.max()))
+
+    print()
+    print(f"Number of actions:              {t_cnt}")
+    print(f"Total time:                     {delta:.1f} s")
+    print(f"Total number of locks:          {htl_cnt}")
+    print(f"Total time inside locks:        {htl_sum:.1f} s")
+    print(f"Percent spent within lock:      "+
+          f"{(htl_sum/delta)*100:.0f} %")
+    print()
+    print(f"Time to first lock:             {delta_lock:.6f} s")
+    print()
+    print(f"Total time between locks:       {bt_locks.sum():.6f} s")
+    print(f"Mean time between locks:        {mean:.6f} s")
+    print(f"Stddev time between locks:      {std:.3f}")
+    print(f"Min time between locks:         {min_:.6f} s")
+    print(f"Max time between locks:         {max_:.6f} s")
+
+
+if __name__ == '__main__':
+    args = parseArgs(sys.argv[1:])
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
+    print("=====", args.file, "=====")
+    main(progress_trace, args.event, args.nso5, args.old)
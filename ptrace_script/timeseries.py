@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+"""
+Throughput and latency of each event over time, in windows of time.
+
+The stop events of each event are grouped into windows of --every, e.g.
+'10s' or '1m', or of --period starting every --every for rolling windows,
+with --period no shorter than --every.
+Each window of an event has the COUNT of stops in it, the RATE of stops
+per second, the percentiles of their durations and the peak CONCURRENCY,
+the most spans of the event running at once during the window. The spans
+are made from the stop events, beginning DURATION before them, as in
+overlap_index. Windows between the first and the last span of an event
+are all listed, with a COUNT of 0 for windows without stops.
+"""
+
+import argparse
+import sys
+
+import polars as pl
+
+import rootpath
+from trace_cache import scan_trace
+from calc_events_stats import stop_events
+from duration_sketch import PERCENTILES, percentile_name
+
+
+# Columns read from the trace
+COLUMNS = ['EVENT TYPE', 'TIMESTAMP', 'DURATION', 'DATASTORE', 'MESSAGE']
+
+
+def parseArgs(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('file', type=str,
+            help='File to process.')
+    parser.add_argument('-e', '--event', type=str,
+            help='Event name')
+    parser.add_argument('--every', type=str, default='1m',
+            help='Start a window every duration, e.g. 10s, 1m or 1h.')
+    parser.add_argument('--period', type=str,
+            help='Length of the windows, longer than --every for rolling '+
+                 'windows, by default --every.')
+    parser.add_argument('-o', '--output', type=str,
+            help='File to write the result to, as Parquet if it ends '+
+                 'with .parquet, else as csv.')
+    return parser.parse_args(args)
+
+
+def windows(events, every, period, aggregations):
+    # Windows start a period before the window of the first event, for the
+    # rolling windows beginning before it
+    return events.sort('TIMESTAMP').group_by_dynamic(
+        'TIMESTAMP', every=every, period=period, offset=f'-{period}',
+        closed='left', group_by='MESSAGE', start_by='window',
+        include_boundaries=True).agg(aggregations).rename(
+        {'TIMESTAMP': 'WINDOW'})
+
+
+def concurrency(stops):
+    '''Return a LazyFrame of the RUNNING count of spans of each event after
+    each beginning and end of a span, with the DELTA of the count.
+    '''
+    begin = pl.col('TIMESTAMP') - pl.duration(microseconds=(
+        pl.col('DURATION')*1e6).round().cast(pl.Int64))
+    changes = pl.concat([
+        stops.select('MESSAGE', begin.alias('TIMESTAMP'),
+                     pl.lit(1).alias('DELTA')),
+        stops.select('MESSAGE', 'TIMESTAMP', pl.lit(-1).alias('DELTA'))])
+    # A span ending when another begins is not running with it
+    return changes.sort('TIMESTAMP', 'DELTA').with_columns(
+        pl.col('DELTA').cum_sum().over('MESSAGE').alias('RUNNING'))
+
+
+def timeseries(progress_trace, event=None, every='1m', period=None):
+    '''Return a LazyFrame of the COUNT, RATE, duration percentiles and
+    CONCURRENCY of the stops of each event in each window.
+    '''
+    period = period or every
+    stops = stop_events(progress_trace).filter(
+        pl.col('DURATION').is_not_null()).select(
+        pl.col('MESSAGE').cast(pl.String), 'TIMESTAMP', 'DURATION')
+    if event is not None:
+        stops = stops.filter(pl.col('MESSAGE') == event)
+    # Read the trace once for the stops and the concurrency
+    stops = stops.cache()
+
+    seconds = (pl.col('_upper_boundary') -
+               pl.col('_lower_boundary')).dt.total_microseconds()/1e6
+    durations = windows(stops, every, period, [
+        pl.len().alias('COUNT')] + [
+        pl.col('DURATION').quantile(p/100, 'lower').alias(
+            percentile_name(p)) for p in PERCENTILES]).with_columns(
+        (pl.col('COUNT')/seconds).alias('RATE'))
+    # The peak in a window is the count running at its start, before its
+    # first change, or after one of its changes
+    peaks = windows(concurrency(stops), every, period, [
+        pl.max_horizontal(
+            (pl.col('RUNNING')-pl.col('DELTA')).first(),
+            pl.col('RUNNING').max()).alias('CONCURRENCY'),
+        pl.col('RUNNING').last()]).drop('_lower_boundary', '_upper_boundary')
+    # Windows without changes have the count running after the window
+    # before them, all spans begin and end in the windows of peaks
+    grid = peaks.group_by('MESSAGE').agg(pl.datetime_range(
+        pl.col('WINDOW').min(), pl.col('WINDOW').max(),
+        interval=every)).explode('WINDOW')
+    peaks = grid.join(peaks, on=['MESSAGE', 'WINDOW'], how='left').sort(
+        'WINDOW').with_columns(pl.coalesce(
+            'CONCURRENCY',
+            pl.col('RUNNING').forward_fill().over('MESSAGE')))
+
+    return peaks.join(durations, on=['MESSAGE', 'WINDOW'],
+                      how='left').with_columns(
+        pl.col('COUNT').fill_null(0), pl.col('RATE').fill_null(0.0)).select(
+        'WINDOW', 'MESSAGE', 'COUNT', 'RATE',
+        *[percentile_name(p) for p in PERCENTILES],
+        'CONCURRENCY').sort('WINDOW', 'MESSAGE')
+
+
+def main(progress_trace, event=None, every='1m', period=None, output=None):
+    '''Return the time series of a trace, or write it to output.'''
+    result = timeseries(progress_trace, event, every, period).collect()
+    if output is None:
+        return result
+    if output.endswith('.parquet'):
+        result.write_parquet(output)
+    else:
+        result.write_csv(output, separator=',')
+    return None
+
+
+if __name__ == '__main__':
+    args = parseArgs(sys.argv[1:])
+    progress_trace = scan_trace(args.file, columns=COLUMNS)
+    result = main(progress_trace, args.event, args.every, args.period,
+                  args.output)
+    if result is not None:
+        with pl.Config(tbl_rows=1000, tbl_cols=-1):
+            print(result)
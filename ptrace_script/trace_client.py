@@ -0,0 +1,56 @@
+"""
+Client of the ptrace.py server, see trace_server.
+
+Sending a command to the server only needs the standard library, so that
+commands sent to it start fast.
+"""
+
+import json
+import os
+import socket
+
+
+SOCKET_ENV = 'PTRACE_SOCKET'
+
+
+def socket_path():
+    path = os.environ.get(SOCKET_ENV)
+    if path is not None:
+        return path
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if not directory:
+        import tempfile
+        directory = tempfile.gettempdir()
+    return os.path.join(directory, f'ptrace-{os.getuid()}.sock')
+
+
+def connect(path):
+    if not path:
+        return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except OSError:
+        s.close()
+        return None
+    return s
+
+
+def request(path, argv):
+    '''Run a command line in the server listening on path, returning the
+    exit status and output, or None if no server is listening. A reply
+    that isn't a response, e.g. of a server failing the command, returns
+    status 1.
+    '''
+    s = connect(path)
+    if s is None:
+        return None
+    with s, s.makefile('rb') as reply:
+        s.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd()}).encode() +
+                  b'\n')
+        data = reply.read()
+    try:
+        response = json.loads(data)
+        return response['status'], response['output']
+    except (ValueError, TypeError, KeyError):
+        return 1, f"Invalid reply from the server on {path}\n"
@@ -0,0 +1,167 @@
+"""
+Server keeping progress traces in memory for ptrace.py.
+
+`ptrace.py serve` loads traces once and listens on a Unix socket. Other
+ptrace.py commands send their arguments to the server when it is running
+and print the output it returns, instead of reading the trace themselves.
+Traces are loaded the first time a command uses them and kept in memory.
+
+The output of each command is kept per trace and returned again for the
+same command. A trace is reloaded, and its outputs dropped, when the size
+or modification time of any of its files changes, e.g. when NSO writes more
+of the trace.
+
+The socket is PTRACE_SOCKET from the environment, by default ptrace-<uid>.sock
+in XDG_RUNTIME_DIR or the temporary directory. Set PTRACE_SOCKET to an empty
+string to never use a server.
+"""
+
+import contextlib
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+import traceback
+
+import rootpath
+from trace_cache import (ROW_COLUMN, in_range, parse_time, scan_trace,
+                         select_columns, trace_files)
+from trace_client import connect
+
+
+def file_key(path):
+    '''Return the files of a trace with their size and modification time.'''
+    key = []
+    for filename in trace_files(path):
+        st = os.stat(filename)
+        key.append((filename, st.st_size, st.st_mtime_ns))
+    return tuple(key)
+
+
+class TraceStore():
+    def __init__(self):
+        # Absolute path of each trace to its file key and DataFrame
+        self.traces = {}
+        # Absolute path of each trace to the outputs of its commands
+        self.results = {}
+
+    def trace(self, path):
+        '''Return the DataFrame of a trace, loading it if it isn't loaded or
+        its files changed.
+        '''
+        path = os.path.abspath(path)
+        key = file_key(path)
+        loaded = self.traces.get(path)
+        if loaded is None or loaded[0] != key:
+            self.traces.pop(path, None)
+            self.results.pop(path, None)
+            self.traces[path] = (key, scan_trace(path, rows=True).collect())
+        return self.traces[path][1]
+
+    def scan(self, path, begin=None, end=None, columns=None):
+        '''Return a LazyFrame of a trace in memory, as scan_trace.'''
+        progress_trace = self.trace(path).lazy()
+        begin, end = parse_time(begin), parse_time(end)
+        if begin is not None or end is not None:
+            progress_trace = progress_trace.filter(in_range(begin, end))
+        if columns is not None:
+            progress_trace = select_columns(progress_trace, columns)
+        else:
+            # The ROW numbers are loaded for the commands reading them
+            progress_trace = progress_trace.drop(ROW_COLUMN)
+        return progress_trace
+
+    def result(self, path, query, run):
+        '''Return the output of a query of a trace, running it if the output
+        isn't kept or the trace changed.
+        '''
+        self.trace(path)
+        results = self.results.setdefault(os.path.abspath(path), {})
+        if query not in results:
+            results[query] = run()
+        return results[query]
+
+
+def capture(func, *args):
+    '''Call func and return its exit status, output and result.'''
+    out = io.StringIO()
+    status = 0
+    result = None
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+            result = func(*args)
+    except SystemExit as e:
+        if isinstance(e.code, int):
+            status = e.code
+        elif e.code is not None:
+            print(e.code, file=out)
+            status = 1
+    except Exception:
+        traceback.print_exc(file=out)
+        status = 1
+    return status, out.getvalue(), result
+
+
+class TraceServer(socketserver.UnixStreamServer):
+    '''Unix socket server running ptrace.py commands. parse returns the
+    arguments of a command line and run runs the command of the arguments.
+    '''
+    def __init__(self, path, store, parse, run):
+        self.store = store
+        self.parse = parse
+        self.run = run
+        super().__init__(path, QueryHandler)
+
+    def query(self, argv, cwd):
+        # Requests are handled one at a time, so the working directory of
+        # the client can be used for its relative paths.
+        previous = os.getcwd()
+        try:
+            os.chdir(cwd)
+            status, output, args = capture(self.parse, argv)
+            if status or args.command is None:
+                return status, output
+            # Commands writing files are always run
+            if args.file is None or getattr(args, 'output', None):
+                return capture(self.run, args)[:2]
+            # Loading the trace fails e.g. when it has no files
+            status, output, result = capture(
+                self.store.result, args.file, (cwd, tuple(argv)),
+                lambda: capture(self.run, args)[:2])
+            if status:
+                return status, output
+            return result
+        finally:
+            os.chdir(previous)
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        status, output = self.server.query(request['argv'], request['cwd'])
+        self.wfile.write(json.dumps({'status': status,
+                                     'output': output}).encode())
+
+
+def serve(path, store, parse, run):
+    '''Serve ptrace.py commands on a Unix socket until interrupted.'''
+    if os.path.exists(path):
+        s = connect(path)
+        if s is not None:
+            s.close()
+            raise SystemExit(f"A server is already listening on {path}")
+        # Left by a server that didn't exit
+        os.unlink(path)
+    # Remove the socket also when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+    with TraceServer(path, store, parse, run) as server:
+        print(f"Serving on {path}", flush=True)
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
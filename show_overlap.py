@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 
 import argparse
-from datetime import datetime
 import sys
-import pandas
+
+from trace_cache import read_trace
 
 
 def parseArgs(args):
@@ -45,10 +45,8 @@ def process_overlap(args, progress_trace):
 
 
 def main(args):
-    progress_trace = pandas.read_csv(args.file,
-                              index_col='TIMESTAMP',
-                              converters={'TIMESTAMP': datetime.fromisoformat}
-                                     ).sort_values('TIMESTAMP')
+    progress_trace = read_trace(args.file).set_index('TIMESTAMP'
+                                                     ).sort_values('TIMESTAMP')
     running = progress_trace[progress_trace['DATASTORE'] == 'running']
     if args.find_spans:
         args.hide_rows = True
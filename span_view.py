@@ -0,0 +1,344 @@
+"""
+Windowed, incremental rendering of spans for the rich Live view of the
+viewer.
+
+Spans are kept in a SpanStore of arrays, with the messages and transaction
+ids interned, and an event only touches the span it starts or stops. Rich
+rows and bars are created when the view is rendered, and only for the rows
+visible in the window, with all bars scaled by one shared Timeline. Spans
+above and below the window are summarized in a row each, and finished spans
+older than the history limit are collapsed into a count, so memory is
+bounded regardless of the size of the trace. The view is redrawn at most a
+bounded number of frames per second.
+"""
+
+from array import array
+from math import isnan, nan
+import time
+
+from rich.bar import Bar
+from rich.color import Color
+from rich.table import Table
+from rich.text import Text
+
+
+FRAMES_PER_SECOND = 10
+HISTORY = 10000
+
+
+def mk_color_numbers():
+    return list(filter(lambda i: not i in [4, 16, 17, 18], [i for i in range(1, 232)]))
+
+
+class Timeline():
+    def __init__(self, fps=FRAMES_PER_SECOND):
+        self.size = 0.0
+        self.frame_interval = 1.0/fps
+        self.last_frame = 0.0
+
+    def frame_due(self):
+        now = time.monotonic()
+        if now-self.last_frame < self.frame_interval:
+            return False
+        self.last_frame = now
+        return True
+
+
+class SpanStore():
+    '''Spans stored as columns, without an object per span. The begin and
+    stop offsets and the durations are arrays of doubles, NaN while a span
+    is running, and the message and transaction id are indexes into a table
+    of interned strings. A span is its row number, and the key of a span maps
+    to the row of the latest span started with it.
+    '''
+    def __init__(self):
+        self.begin = array('d')
+        self.stop = array('d')
+        self.duration = array('d')
+        self.text = array('i')
+        self.tid = array('i')
+        self.names = []
+        self.ids = {}
+        self.keys = {}
+        # Durations of spans stopped more than once, shown concatenated
+        self.durations = {}
+
+    def __len__(self):
+        return len(self.begin)
+
+    def intern(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def add(self, text, tid, key, begin):
+        row = len(self.begin)
+        self.begin.append(begin)
+        self.stop.append(nan)
+        self.duration.append(nan)
+        self.text.append(self.intern(text))
+        self.tid.append(self.intern(tid))
+        self.keys[key] = row
+        return row
+
+    def extend(self, texts, tids, begin, stop, durations):
+        '''Add finished and running spans given as columns, with a NaN stop
+        for running spans and the durations of the stops ending each span.
+        The keys of the spans are not added.
+        '''
+        row = len(self.begin)
+        self.begin.extend(begin)
+        self.stop.extend(stop)
+        self.text.extend(map(self.intern, texts))
+        self.tid.extend(map(self.intern, tids))
+        for i, duration in enumerate(durations, row):
+            self.duration.append(duration[0] if duration else nan)
+            if duration and len(duration) > 1:
+                self.durations[i] = ''.join(f'{d*1000:0.3f}'
+                                            for d in duration)
+
+    def copy(self):
+        store = SpanStore()
+        store.begin = array('d', self.begin)
+        store.stop = array('d', self.stop)
+        store.duration = array('d', self.duration)
+        store.text = array('i', self.text)
+        store.tid = array('i', self.tid)
+        store.names = list(self.names)
+        store.ids = dict(self.ids)
+        store.keys = dict(self.keys)
+        store.durations = dict(self.durations)
+        return store
+
+    def running(self, row):
+        return isnan(self.stop[row])
+
+    def end(self, row, duration, stop):
+        if isnan(self.duration[row]):
+            self.duration[row] = duration
+        else:
+            self.durations[row] = self.duration_text(row) + \
+                f'{duration*1000:0.3f}'
+        self.stop[row] = stop
+
+    def duration_text(self, row):
+        if row in self.durations:
+            return self.durations[row]
+        duration = self.duration[row]
+        return '' if isnan(duration) else f'{duration*1000:0.3f}'
+
+    def span_text(self, row):
+        return self.names[self.text[row]]
+
+    def span_tid(self, row):
+        return self.names[self.tid[row]]
+
+    def compact(self, keep):
+        '''Keep only the rows in keep, in increasing order, renumbering the
+        rows and the interned strings.
+        '''
+        names = self.names
+        new = {row: i for i, row in enumerate(keep)}
+        self.begin = array('d', (self.begin[row] for row in keep))
+        self.stop = array('d', (self.stop[row] for row in keep))
+        self.duration = array('d', (self.duration[row] for row in keep))
+        self.names = []
+        self.ids = {}
+        self.text = array('i', (self.intern(names[self.text[row]])
+                                for row in keep))
+        self.tid = array('i', (self.intern(names[self.tid[row]])
+                               for row in keep))
+        self.keys = {key: new[row] for key, row in self.keys.items()
+                     if row in new}
+        self.durations = {new[row]: text
+                          for row, text in self.durations.items()
+                          if row in new}
+
+
+def get_table(span_header="Span"):
+    table = Table(title="NSO Traces")
+    table.add_column("Event", min_width=20, no_wrap=True)
+    table.add_column("TId", min_width=3, no_wrap=True)
+    table.add_column("Duration", min_width=10, no_wrap=True)
+    table.add_column(span_header, width=120, no_wrap=True)
+    return table
+
+
+class SpanView():
+    '''The spans of a trace shown in a window of a rich Table. Each event is
+    handled in constant time regardless of the number of spans.
+
+    height is the number of span rows shown, or None for all. The window
+    follows the latest spans unless offset is set to the first row shown.
+    '''
+    def __init__(self, fps=FRAMES_PER_SECOND, height=None, history=HISTORY):
+        self.timeline = Timeline(fps)
+        self.begin = 0.0
+        self.store = SpanStore()
+        self.tids_color = {}
+        self.held_locks = {}
+        self.height = height
+        self.history = history
+        self.offset = None
+        self.time_range = None
+        self.collapsed = 0
+        self.limit = 2*history
+        self.color_numbers = []
+        # Shown below the table, e.g. the state of a replay
+        self.status = None
+
+    def new_color(self):
+        if not self.color_numbers:
+            self.color_numbers = mk_color_numbers()
+        return Color.from_ansi(self.color_numbers.pop(0))
+
+    def new_span(self, text, key, tid):
+        if tid not in self.tids_color:
+            self.tids_color[tid] = self.new_color()
+        store = self.store
+        row = store.keys.get(key)
+        if row is not None and store.running(row):
+            store.stop[row] = self.timeline.size
+        store.add(text, tid, key, self.timeline.size)
+        if len(store) > self.limit:
+            self.collapse()
+
+    def end_span(self, key, duration):
+        self.store.end(self.store.keys[key], duration, self.timeline.size)
+
+    def collapse(self):
+        '''Collapse finished spans older than the history limit into a
+        count.
+        '''
+        store = self.store
+        keep_from = len(store)-self.history
+        keep = []
+        for row in range(len(store)):
+            if row >= keep_from or store.running(row):
+                keep.append(row)
+                continue
+            self.collapsed += 1
+            if self.offset is not None and len(keep) < self.offset:
+                self.offset -= 1
+        store.compact(keep)
+        # Running spans are never collapsed, collapse again when the number
+        # of spans has doubled to keep the cost per event constant.
+        self.limit = max(2*self.history, 2*len(keep))
+        tids = set(store.span_tid(row) for row in range(len(store)))
+        self.tids_color = {tid: color for tid, color in self.tids_color.items()
+                           if tid in tids}
+
+    def event(self, tag, ts, duration, tid, text, key):
+        if self.begin == 0.0:
+            self.begin = ts
+        self.timeline.size = ts-self.begin
+        if tag == 'start':
+            self.new_span(text, key, tid)
+        elif tag == 'stop' and key in self.store.keys:
+            self.end_span(key, duration)
+            if text == 'grabbing transaction lock':
+                ftext = 'holding transaction lock'
+                fkey = tid+'-'+ftext
+                self.new_span(ftext, fkey, tid)
+                self.held_locks[tid] = ts
+        elif tag == 'info' and text == 'releasing transaction lock':
+            ftext = 'holding transaction lock'
+            fkey = tid+'-'+ftext
+            if fkey in self.store.keys:
+                sts = self.held_locks.pop(tid)
+                fduration = ts-sts
+                self.end_span(fkey, fduration)
+
+    def checkpoint(self):
+        '''Return a copy of the state built from the events so far.'''
+        return (self.store.copy(), dict(self.tids_color),
+                dict(self.held_locks), list(self.color_numbers), self.begin,
+                self.timeline.size, self.collapsed, self.limit)
+
+    def restore(self, checkpoint):
+        '''Restore the state of a checkpoint, keeping the window.'''
+        (store, tids_color, held_locks, color_numbers, self.begin,
+         self.timeline.size, self.collapsed, self.limit) = checkpoint
+        self.store = store.copy()
+        self.tids_color = dict(tids_color)
+        self.held_locks = dict(held_locks)
+        self.color_numbers = list(color_numbers)
+
+    def frame_due(self):
+        return self.timeline.frame_due()
+
+    def jump_to_tid(self, tid):
+        '''Scroll the window to the first span of a transaction.'''
+        tid = self.store.ids.get(tid)
+        if tid is None:
+            return False
+        for i, row in enumerate(self.visible_rows()):
+            if self.store.tid[row] == tid:
+                self.offset = i
+                return True
+        return False
+
+    def jump_to_time(self, begin, end=None):
+        '''Show the spans between two timestamps, or from a timestamp to the
+        end of the trace if end is None.
+        '''
+        self.time_range = begin, end
+        self.offset = 0
+
+    def visible_rows(self):
+        '''Return the rows of the spans in the time range.'''
+        store = self.store
+        if self.time_range is None:
+            return range(len(store))
+        begin, end = self.time_range_offsets()
+        # A running span has a NaN stop, which isn't less than begin
+        return [row for row in range(len(store))
+                if not store.stop[row] < begin and
+                   (end is None or store.begin[row] <= end)]
+
+    def time_range_offsets(self):
+        begin, end = self.time_range
+        begin = begin-self.begin if begin is not None else 0.0
+        end = end-self.begin if end is not None else None
+        return begin, end
+
+    def window(self):
+        rows = self.visible_rows()
+        if self.height is None:
+            return 0, rows
+        offset = self.offset
+        if offset is None or offset > len(rows):
+            offset = max(0, len(rows)-self.height)
+        return offset, rows[offset:offset+self.height]
+
+    def __rich__(self):
+        size = self.timeline.size
+        start = 0.0
+        header = f'Span {size*1000:0.3f} ms'
+        if self.time_range is not None:
+            start, end = self.time_range_offsets()
+            if end is not None:
+                size = end
+            header = f'Span {start*1000:0.3f} - {size*1000:0.3f} ms'
+        table = get_table(span_header=Text(header))
+        offset, rows = self.window()
+        above = offset+self.collapsed
+        if above:
+            table.add_row(f'... {above} spans above', '', '', '')
+        store = self.store
+        for row in rows:
+            stop = store.stop[row]
+            end = size if isnan(stop) else min(stop, size)
+            tid = store.span_tid(row)
+            bar = Bar(begin=store.begin[row]-start, end=end-start,
+                      size=max(size-start, 0.0), color=self.tids_color[tid])
+            table.add_row(store.span_text(row), tid, store.duration_text(row),
+                          bar)
+        below = len(self.visible_rows())-offset-len(rows)
+        if below:
+            table.add_row(f'... {below} spans below', '', '', '')
+        if self.status is not None:
+            table.caption = self.status
+        return table
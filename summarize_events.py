@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
 
 import argparse
-from datetime import datetime
 import sys
 
+import numpy
 import pandas
 
+from trace_cache import read_trace, trace_files
+from trace_schema import open_trace, read_schema
+from trace_time import decode_timestamps, to_datetime64
+
+
+CHUNK_SIZE = 1000000
+COLUMNS = ['EVENT TYPE', 'TIMESTAMP', 'DURATION', 'TRANSACTION ID',
+           'DATASTORE', 'MESSAGE']
+# Lock events later than this before the latest one read so far are held
+# back to the next chunk, to sort events written slightly out of order.
+SORT_LAG = pandas.Timedelta(seconds=10)
+
 
 def parseArgs(args):
     parser = argparse.ArgumentParser()
@@ -17,144 +29,340 @@ def parseArgs(args):
             help='Handle as NSO 5.x compatible progress trace.')
     parser.add_argument('--old', action='store_true', default=False,
             help='Use event \'apply transaction\' as lock event.')
+    parser.add_argument('--stream', action='store_true', default=False,
+            help='Read the trace in chunks with bounded memory.')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+            help='Number of rows per chunk when streaming.')
     return parser.parse_args(args)
 
 
-def sum_duration_between_locks_5(htl_events):
-    # Collect duration between locks and calculate statistics
-    bt_ts = []
-    bt_dur = []
-    start = None
-    end = None
-    overlap_cnt = 0
-    overlap_tids = []
-    overlap_start = None
-    overlag_stop = None
-    for i, ev in htl_events.sort_values('TIMESTAMP').iterrows():
-        ts = ev['TIMESTAMP']
-        tid = ev['TRANSACTION ID']
-        if ev['EVENT TYPE'] == 'stop':
-            start = ts
-            overlap_tids.append(tid)
-            if len(overlap_tids) == 1:
-                if end:
-                    bt_ts.append(ts)
-                    bt_dur.append((ts-end).total_seconds())
-                    end = None
-            else:
-                print("Overlapping events, count as 0 sec gap.", overlap_tids)
-        elif ev['EVENT TYPE'] == 'info' and start is not None:
-            if tid in overlap_tids:
-                overlap_tids.remove(tid)
-                if len(overlap_tids) == 0:
-                    end = ts
-            htl_events.at[i, 'DURATION'] = (ts-start).total_seconds()
-        p_ts = ts
-        p_tid = ev['TRANSACTION ID']
-    return pandas.DataFrame(index=bt_ts, data={'DURATION': bt_dur})
-
-
-def sum_duration_between_locks_6(htl_events):
-    # Collect duration between locks and calculate statistics
-    bt_ts = []
-    bt_dur = []
-    end = None
-    overlap_cnt = 0
-    overlap_tids = []
-    overlap_start = None
-    overlag_stop = None
-    for _, ev in htl_events.sort_values('TIMESTAMP').iterrows():
-        ts = ev['TIMESTAMP']
-        tid = ev['TRANSACTION ID']
-        if ev['EVENT TYPE'] == 'start':
-            overlap_tids.append(tid)
-            if len(overlap_tids) == 1:
-                if end:
-                    bt_ts.append(ts)
-                    bt_dur.append((ts-end).total_seconds())
-                    end = None
+def lock_sweep(events, acquire, release):
+    '''Return the number of locks held after each of the events, sorted by
+    timestamp, and the change of it by each event. A release only counts if
+    the transaction holds a lock, i.e. the number of locks held by each
+    transaction is a running sum of +1/-1 that is kept from going below 0.
+    '''
+    step = numpy.where(acquire, 1, numpy.where(release, -1, 0))
+    tids = events['TRANSACTION ID'].to_numpy()
+    steps = pandas.Series(step)
+    total = steps.groupby(tids, sort=False, dropna=False).cumsum()
+    held = total - total.groupby(tids, sort=False,
+                                 dropna=False).cummin().clip(upper=0)
+    change = held - held.groupby(tids, sort=False,
+                                 dropna=False).shift(fill_value=0)
+    change = change.to_numpy()
+    return numpy.cumsum(change), change
+
+
+def print_overlapping(events, count, change, first=0):
+    # Replay only the periods the lock is held that contain overlapping
+    # acquires, to list the transactions holding the lock. Acquires before
+    # first are carried over from a previous chunk and already printed.
+    overlapping = numpy.flatnonzero((change == 1) & (count > 1))
+    overlapping = overlapping[overlapping >= first]
+    if not len(overlapping):
+        return
+    tids = events['TRANSACTION ID'].tolist()
+    free = numpy.flatnonzero(count == 0)
+    end = -1
+    for i in overlapping:
+        if i <= end:
+            continue
+        n = numpy.searchsorted(free, i)
+        begin = free[n-1]+1 if n else 0
+        end = free[n] if n < len(free) else len(tids)-1
+        overlap_tids = []
+        for j in range(begin, end+1):
+            if change[j] == 1:
+                overlap_tids.append(tids[j])
+                if len(overlap_tids) > 1 and j >= first:
+                    print("Overlapping events, count as 0 sec gap.",
+                          overlap_tids)
+            elif change[j] == -1:
+                overlap_tids.remove(tids[j])
+
+
+class LockGaps():
+    '''Duration between locks, from the time the last lock is released until
+    the next lock is acquired, of lock events added in one or more chunks
+    sorted by timestamp. Only the transactions holding the lock and the time
+    it was last released are kept between chunks.
+    '''
+    def __init__(self):
+        self.held = []
+        self.end = None
+        self.acquired = None
+
+    def add(self, events, acquire, release):
+        if not len(events):
+            return pandas.DataFrame(index=events['TIMESTAMP'].to_numpy(),
+                                    data={'DURATION': []})
+        n = len(self.held)
+        if n:
+            # Acquire the lock again for the transactions holding it
+            held = pandas.DataFrame({
+                'TIMESTAMP': events['TIMESTAMP'].iloc[:1].repeat(n).to_numpy(),
+                'TRANSACTION ID': self.held})
+            events = pandas.concat([held, events[held.columns]],
+                                   ignore_index=True)
+            acquire = numpy.concatenate([numpy.ones(n, bool), acquire])
+            release = numpy.concatenate([numpy.zeros(n, bool), release])
+        count, change = lock_sweep(events, acquire, release)
+        print_overlapping(events, count, change, first=n)
+        ts = events['TIMESTAMP'].to_numpy()
+        starts = ts[numpy.flatnonzero((change == 1) & (count == 1))]
+        ends = ts[numpy.flatnonzero((change == -1) & (count == 0))]
+        if n or self.end is None:
+            starts = starts[1:]
+        else:
+            ends = numpy.concatenate([[self.end], ends])
+        self.carry(events, ts, count, change, ends)
+        ends = ends[:len(starts)]
+        bt_dur = (starts-ends) / numpy.timedelta64(1, 's')
+        return pandas.DataFrame(index=starts, data={'DURATION': bt_dur})
+
+    def carry(self, events, ts, count, change, ends):
+        if not len(count):
+            return
+        if count[-1] == 0:
+            self.held = []
+            if len(ends):
+                self.end = ends[-1]
+            return
+        free = numpy.flatnonzero(count == 0)
+        begin = free[-1]+1 if len(free) else 0
+        tids = events['TRANSACTION ID'].iloc[begin:].tolist()
+        self.held = []
+        for tid, c in zip(tids, change[begin:]):
+            if c == 1:
+                self.held.append(tid)
+            elif c == -1:
+                self.held.remove(tid)
+        self.end = None
+
+
+def sum_duration_between_locks_5(htl_events, gaps=None):
+    if gaps is None:
+        gaps = LockGaps()
+    events = htl_events.sort_values('TIMESTAMP')
+    acquire = (events['EVENT TYPE'] == 'stop').to_numpy()
+    release = (events['EVENT TYPE'] == 'info').to_numpy()
+    # The duration of a release is the time since the latest acquire
+    acquired = events['TIMESTAMP'].where(acquire).ffill()
+    if gaps.acquired is not None:
+        acquired = acquired.fillna(gaps.acquired)
+    if len(acquired) and pandas.notna(acquired.iloc[-1]):
+        gaps.acquired = acquired.iloc[-1]
+    held = release & acquired.notna().to_numpy()
+    htl_events.loc[events.index[held], 'DURATION'] = \
+        (events['TIMESTAMP']-acquired)[held].dt.total_seconds()
+    return gaps.add(events, acquire, release)
+
+
+def sum_duration_between_locks_6(htl_events, gaps=None):
+    if gaps is None:
+        gaps = LockGaps()
+    events = htl_events.sort_values('TIMESTAMP')
+    acquire = (events['EVENT TYPE'] == 'start').to_numpy()
+    release = (events['EVENT TYPE'] == 'stop').to_numpy()
+    return gaps.add(events, acquire, release)
+
+
+class GapStats():
+    '''Sum, mean, standard deviation, min and max of durations added in one
+    or more chunks.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.m2 = 0.0
+        self.min = float('NaN')
+        self.max = float('NaN')
+
+    def add(self, durations):
+        durations = durations.dropna()
+        if not len(durations):
+            return
+        count = len(durations)
+        total = durations.sum()
+        m2 = ((durations-total/count)**2).sum()
+        if self.count:
+            delta = total/count - self.sum/self.count
+            m2 += self.m2 + delta**2*self.count*count/(self.count+count)
+            self.min = min(self.min, durations.min())
+            self.max = max(self.max, durations.max())
+        else:
+            self.min = durations.min()
+            self.max = durations.max()
+        self.count += count
+        self.sum += total
+        self.m2 = m2
+
+    @property
+    def mean(self):
+        return self.sum/self.count if self.count else float('NaN')
+
+    @property
+    def std(self):
+        if self.count < 2:
+            return float('NaN')
+        return numpy.sqrt(self.m2/(self.count-1))
+
+
+class LockSummary():
+    '''Time inside and between locks of the running datastore, of a trace
+    added in one or more chunks in file order. Lock events are sorted by
+    timestamp within SORT_LAG of the latest lock event of the chunks added
+    so far, later events are held back until the next chunk.
+    '''
+    def __init__(self, args):
+        self.event = args.event
+        self.nso5 = args.nso5 and not args.old
+        if args.nso5:
+            if args.old:
+                self.lock_et = 'start'
+                self.lock_event = 'applying transaction'
             else:
-                print("Overlapping events, count as 0 sec gap.", overlap_tids)
-        elif ev['EVENT TYPE'] == 'stop':
-            if tid in overlap_tids:
-                overlap_tids.remove(tid)
-                if len(overlap_tids) == 0:
-                    end = ts
-        p_ts = ts
-        p_tid = ev['TRANSACTION ID']
+                self.lock_et = 'stop'
+                self.lock_event = 'grabbing transaction lock'
+        else:
+            self.lock_et = 'start'
+            self.lock_event = 'holding transaction lock'
+        self.gaps = LockGaps()
+        self.bt_locks = GapStats()
+        self.pending = None
+        self.htl_sum = 0.0
+        self.htl_cnt = 0
+        self.first_lock = pandas.NaT
+        self.t_cnt = 0
+        self.first_ts = pandas.NaT
+        self.last_ts = pandas.NaT
 
-    return pandas.DataFrame(index=bt_ts, data={'DURATION': bt_dur})
+    def messages(self):
+        if self.nso5:
+            return [self.event, 'grabbing transaction lock',
+                    'releasing transaction lock']
+        return [self.event, self.lock_event]
 
+    def event_types(self):
+        if self.nso5:
+            return ['start', 'stop', 'info']
+        return ['start', 'stop']
 
-def main(args):
-    print("=====", args.file, "=====")
-    progress_trace = pandas.read_csv(args.file,
-                             low_memory=False,
-                             converters={'TIMESTAMP': datetime.fromisoformat})
+    def add(self, progress_trace, final=False):
+        d = progress_trace[progress_trace['DATASTORE'] == 'running']
 
-    have_trace_id = 'TRACE ID' in progress_trace.keys()
+        if self.nso5:
+            htl_events = d[
+                ((d['EVENT TYPE'] == "stop") &
+                 (d['MESSAGE'] == "grabbing transaction lock")) |
+                ((d['EVENT TYPE'] == "info") &
+                 (d['MESSAGE'] == "releasing transaction lock"))
+                 ]
+        else:
+            htl_events = d[d['MESSAGE'] == self.lock_event]
+
+        htl_starts = htl_events[htl_events['EVENT TYPE'] == self.lock_et]
+        self.htl_cnt += htl_starts['MESSAGE'].count()
+        if pandas.isna(self.first_lock) and len(htl_starts):
+            self.first_lock = htl_starts.iloc[0]['TIMESTAMP']
+
+        t_events = d[d['MESSAGE'] == self.event]
+        t_starts = t_events[t_events['EVENT TYPE'] == 'start']
+        t_stops = t_events[t_events['EVENT TYPE'] == 'stop']
+        self.t_cnt += t_starts['EVENT TYPE'].count()
+        if pandas.isna(self.first_ts) and len(t_starts):
+            self.first_ts = t_starts.iloc[0]['TIMESTAMP']
+        if len(t_stops):
+            self.last_ts = t_stops.iloc[-1]['TIMESTAMP']
 
-    if args.nso5:
-        if args.old:
-            lock_et = 'start'
-            lock_event = 'applying transaction'
+        if self.pending is not None:
+            htl_events = pandas.concat([self.pending, htl_events],
+                                       ignore_index=True)
+            self.pending = None
+        if not final and len(htl_events):
+            later = (htl_events['TIMESTAMP'] >
+                     htl_events['TIMESTAMP'].max()-SORT_LAG)
+            self.pending = htl_events[later]
+            htl_events = htl_events[~later]
+        self.add_locks(htl_events)
+
+    def add_locks(self, htl_events):
+        if self.nso5:
+            bt_locks = sum_duration_between_locks_5(htl_events, self.gaps)
+            self.htl_sum += \
+                htl_events[htl_events['EVENT TYPE'] == 'info']['DURATION'].sum()
         else:
-            lock_et = 'stop'
-            lock_event = 'grabbing transaction lock'
-    else:
-        lock_et = 'start'
-        lock_event = 'holding transaction lock'
-
-    d = progress_trace[progress_trace['DATASTORE'] == 'running']
-
-    if args.nso5 and not args.old:
-        htl_events = d[
-            ((d['EVENT TYPE'] == "stop") &
-             (d['MESSAGE'] == "grabbing transaction lock")) |
-            ((d['EVENT TYPE'] == "info") &
-             (d['MESSAGE'] == "releasing transaction lock"))
-             ]
-        bt_locks = sum_duration_between_locks_5(htl_events)
-        htl_sum = htl_events[htl_events['EVENT TYPE'] == 'info']['DURATION'].sum()
-    else:
-        htl_events = d[d['MESSAGE'] == lock_event]
-        bt_locks = sum_duration_between_locks_6(htl_events)
-        htl_sum = htl_events[htl_events['EVENT TYPE'] == 'stop']['DURATION'].sum()
-
-    bt_locks_sum = bt_locks["DURATION"].sum()
-    bt_locks_std = bt_locks["DURATION"].std()
-    bt_locks_mean = bt_locks["DURATION"].mean()
-    bt_locks_min = bt_locks["DURATION"].min()
-    bt_locks_max = bt_locks["DURATION"].max()
-
-    t_events = d[d['MESSAGE'] == args.event]
-    t_cnt = t_events[t_events['EVENT TYPE'] == 'start']['EVENT TYPE'].count()
-    first_ts = t_events[t_events['EVENT TYPE'] == 'start'].iloc[0]['TIMESTAMP']
-    last_ts = t_events[t_events['EVENT TYPE'] == 'stop'].iloc[-1]['TIMESTAMP']
-    delta = (last_ts-first_ts).total_seconds()
-    htl_starts = htl_events[htl_events['EVENT TYPE'] == lock_et]
-    htl_cnt = htl_starts['MESSAGE'].count()
-    if len(htl_starts):
-        first_lock = htl_starts.iloc[0]['TIMESTAMP']
-        delta_lock = (first_lock-first_ts).total_seconds()
+            bt_locks = sum_duration_between_locks_6(htl_events, self.gaps)
+            self.htl_sum += \
+                htl_events[htl_events['EVENT TYPE'] == 'stop']['DURATION'].sum()
+        self.bt_locks.add(bt_locks['DURATION'])
+
+    def finish(self):
+        if self.pending is not None:
+            self.add_locks(self.pending)
+            self.pending = None
+
+    def print(self):
+        delta = (self.last_ts-self.first_ts).total_seconds()
+        delta_lock = (self.first_lock-self.first_ts).total_seconds()
+        htl_sum = self.htl_sum
+        bt_locks = self.bt_locks
+
+        print()
+        print(f"Number of actions:              {self.t_cnt}")
+        print(f"Total time:                     {delta:.1f} s")
+        print(f"Total number of locks:          {self.htl_cnt}")
+        print(f"Total time inside locks:        {htl_sum:.1f} s")
+        print(f"Percent spent within lock:      "+
+              f"{(htl_sum/delta)*100:.0f} %")
+        print()
+        print(f"Time to first lock:             {delta_lock:.6f} s")
+        print()
+        print(f"Total time between locks:       {bt_locks.sum:.6f} s")
+        print(f"Mean time between locks:        {bt_locks.mean:.6f} s")
+        print(f"Stddev time between locks:      {bt_locks.std:.3f}")
+        print(f"Min time between locks:         {bt_locks.min:.6f} s")
+        print(f"Max time between locks:         {bt_locks.max:.6f} s")
+
+
+def read_chunks(filename, messages, event_types, chunk_size):
+    '''Generator reading a trace in chunks of rows, only keeping the rows of
+    the running datastore with the given messages and event types, and the
+    columns needed for the summary.
+    '''
+    schema = read_schema(filename)
+    with open_trace(filename) as f, pandas.read_csv(
+            f, names=schema.names, header=0 if schema.has_header else None,
+            usecols=COLUMNS, dtype=str, keep_default_na=False,
+            chunksize=chunk_size) as reader:
+        for chunk in reader:
+            chunk = chunk[(chunk['DATASTORE'] == 'running') &
+                          chunk['MESSAGE'].isin(messages) &
+                          chunk['EVENT TYPE'].isin(event_types)]
+            chunk = chunk.assign(
+                TIMESTAMP=to_datetime64(decode_timestamps(
+                    chunk['TIMESTAMP'].to_numpy())),
+                DURATION=pandas.to_numeric(chunk['DURATION'],
+                                           errors='coerce'))
+            chunk['TRANSACTION ID'] = pandas.to_numeric(
+                chunk['TRANSACTION ID'], errors='coerce')
+            yield chunk
+
+
+def main(args):
+    print("=====", args.file, "=====")
+    summary = LockSummary(args)
+    if args.stream:
+        if len(trace_files(args.file)) > 1:
+            sys.exit("Streaming reads a single progress trace file")
+        for chunk in read_chunks(args.file, summary.messages(),
+                                 summary.event_types(), args.chunk_size):
+            summary.add(chunk)
+        summary.finish()
     else:
-        delta_lock = float('NaN')
-
-    print()
-    print(f"Number of actions:              {t_cnt}")
-    print(f"Total time:                     {delta:.1f} s")
-    print(f"Total number of locks:          {htl_cnt}")
-    print(f"Total time inside locks:        {htl_sum:.1f} s")
-    print(f"Percent spent within lock:      "+
-          f"{(htl_sum/delta)*100:.0f} %")
-    print()
-    print(f"Time to first lock:             {delta_lock:.6f} s")
-    print()
-    print(f"Total time between locks:       {bt_locks_sum:.6f} s")
-    print(f"Mean time between locks:        {bt_locks_mean:.6f} s")
-    print(f"Stddev time between locks:      {bt_locks_std:.3f}")
-    print(f"Min time between locks:         {bt_locks_min:.6f} s")
-    print(f"Max time between locks:         {bt_locks_max:.6f} s")
+        summary.add(read_trace(args.file), final=True)
+    summary.print()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,380 @@
+"""
+Columnar cache of parsed progress trace csv files.
+
+The first time a trace is read it is parsed once into a typed Parquet file
+next to it (<file>.cache.parquet) with timestamps stored as int64
+microseconds and the low cardinality columns dictionary encoded. Later runs
+of any of the tools read the Parquet file instead of the csv as long as the
+size and modification time of the csv file are unchanged.
+
+Set PTRACE_NO_CACHE=1 in the environment to always parse the csv file.
+
+A trace may also be given as a directory or a glob pattern of trace files,
+e.g. one per NSO node and rotated files. The files are parsed in parallel
+and merged by timestamp, with the file of each row in a SOURCE column.
+
+Traces can be read for a range of time. The cache is stored in row groups
+with timestamp statistics, so only the row groups in the range are read.
+When there is no cache, a sparse index of the byte offset and timestamp of
+the first row of every block of the csv file (<file>.time.parquet) is
+used to parse only the part of the file in the range, without building the
+cache. The index also has the number of the row at each offset, counted
+from the newlines before it, so rows read for a range keep the ROW number
+of the row in the file. Rows are written roughly in timestamp order, a
+margin of a block on each side of the range covers rows slightly out of
+order.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import errno
+import glob
+import io
+import os
+
+import polars as pl
+
+from trace_schema import compression, read_schema
+
+
+CACHE_SUFFIX = '.cache.parquet'
+CACHE_KEY = 'ptrace-cache-key'
+CACHE_ROW_GROUP_SIZE = 100000
+TIME_INDEX_SUFFIX = '.time.parquet'
+BLOCK_SIZE = 1 << 20
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S%.f'
+# Format of the timestamps written by NSO
+TRACE_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S%.6f'
+CATEGORICAL_COLUMNS = ['EVENT TYPE', 'DATASTORE', 'MESSAGE']
+INTEGER_COLUMNS = ['SESSION ID', 'TRANSACTION ID']
+FLOAT_COLUMNS = ['DURATION']
+SOURCE_COLUMN = 'SOURCE'
+# Number of a row in its trace file, from 0 for the first row after the
+# header, read only when asked for
+ROW_COLUMN = 'ROW'
+# Files derived from traces, skipped in directories and glob patterns
+DERIVED_SUFFIXES = ('.parquet', '.tmp')
+
+
+def cache_file(filename):
+    return filename + CACHE_SUFFIX
+
+
+def cache_key(filename):
+    st = os.stat(filename)
+    return f'{st.st_size}-{st.st_mtime_ns}'
+
+
+def typed_columns(columns):
+    exprs = []
+    for c in columns:
+        col = pl.col(c)
+        if c == 'TIMESTAMP':
+            col = col.str.to_datetime(TIMESTAMP_FORMAT, time_unit='us',
+                                      strict=False)
+        elif c in FLOAT_COLUMNS:
+            col = col.cast(pl.Float64, strict=False)
+        elif c in INTEGER_COLUMNS:
+            col = col.cast(pl.Int64, strict=False)
+        elif c in CATEGORICAL_COLUMNS:
+            col = col.cast(pl.Categorical)
+        exprs.append(col)
+    return exprs
+
+
+def text_columns(df):
+    '''Return a DataFrame with the timestamps and categorical columns as
+    strings, formatted as in the trace, for printing.
+    '''
+    return df.with_columns(
+        [pl.col(c).dt.strftime(TRACE_TIMESTAMP_FORMAT)
+         for c, t in df.schema.items() if isinstance(t, pl.Datetime)] +
+        [pl.col(c).cast(pl.String) for c, t in df.schema.items()
+         if isinstance(t, (pl.Categorical, pl.Enum))])
+
+
+def scan_csv_typed(filename, rows=False):
+    schema = read_schema(filename)
+    progress_trace = pl.scan_csv(filename, has_header=schema.has_header,
+                                 new_columns=schema.names,
+                                 infer_schema=False,
+                                 row_index_name=ROW_COLUMN if rows else None)
+    return progress_trace.select(([ROW_COLUMN] if rows else []) +
+                                 typed_columns(schema.names))
+
+
+def is_cache_valid(filename, cache=None):
+    if cache is None:
+        cache = cache_file(filename)
+    if not os.path.exists(cache):
+        return False
+    try:
+        metadata = pl.read_parquet_metadata(cache)
+    except Exception:
+        return False
+    return metadata.get(CACHE_KEY) == cache_key(filename)
+
+
+def write_cache(filename, cache, write):
+    '''Write a Parquet file derived from a trace with write(path, metadata),
+    replacing cache once it is complete.
+    '''
+    tmp = f'{cache}.{os.getpid()}.tmp'
+    try:
+        write(tmp, {CACHE_KEY: cache_key(filename)})
+        os.replace(tmp, cache)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return cache
+
+
+def build_cache(filename):
+    return write_cache(filename, cache_file(filename),
+                       lambda path, metadata: scan_csv_typed(filename
+                           ).sink_parquet(path, metadata=metadata,
+                                          row_group_size=CACHE_ROW_GROUP_SIZE))
+
+
+def use_cache():
+    return os.environ.get('PTRACE_NO_CACHE', '') in ('', '0')
+
+
+def cached_file(filename):
+    '''Return the up to date cache file of a trace, or None if the cache
+    is disabled or can not be written.
+    '''
+    if not use_cache():
+        return None
+    if is_cache_valid(filename):
+        return cache_file(filename)
+    try:
+        return build_cache(filename)
+    except OSError:
+        return None
+
+
+def trace_files(path):
+    '''Return the trace files of a file, a directory or a glob pattern.
+    '''
+    if os.path.isfile(path):
+        return [path]
+    if os.path.isdir(path):
+        names = [os.path.join(path, name) for name in os.listdir(path)]
+    else:
+        names = glob.glob(path)
+    files = sorted(name for name in names if os.path.isfile(name) and
+                   not name.endswith(DERIVED_SUFFIXES))
+    if not files:
+        raise FileNotFoundError(errno.ENOENT, 'No progress trace files', path)
+    return files
+
+
+def time_index_file(filename):
+    return filename + TIME_INDEX_SUFFIX
+
+
+def parse_timestamp(line):
+    try:
+        return datetime.fromisoformat(line.split(b',', 2)[1].decode())
+    except (IndexError, ValueError):
+        return None
+
+
+def count_rows(filename, offsets, header):
+    '''Return the number of the row at each of the sorted offsets of a
+    trace csv file, counting the newlines before it.
+    '''
+    rows = []
+    newlines = 0
+    position = 0
+    with open(filename, 'rb') as f:
+        for offset in offsets:
+            while position < offset:
+                data = f.read(min(BLOCK_SIZE, offset-position))
+                newlines += data.count(b'\n')
+                position += len(data)
+            rows.append(newlines-header)
+    return rows
+
+
+def build_time_index(filename):
+    '''Return a DataFrame of the OFFSET, ROW and TIMESTAMP of the first row
+    starting in each block of a trace csv file.
+    '''
+    offsets = []
+    timestamps = []
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        for block in range(0, size, BLOCK_SIZE):
+            f.seek(block)
+            if block:
+                # Skip the rest of the row in the previous block
+                f.readline()
+            while f.tell() < min(block+BLOCK_SIZE, size):
+                offset = f.tell()
+                ts = parse_timestamp(f.readline())
+                if ts is not None:
+                    offsets.append(offset)
+                    timestamps.append(ts)
+                    break
+    header = 1 if read_schema(filename).has_header else 0
+    return pl.DataFrame([pl.Series('OFFSET', offsets, dtype=pl.Int64),
+                         pl.Series(ROW_COLUMN,
+                                   count_rows(filename, offsets, header),
+                                   dtype=pl.Int64),
+                         pl.Series('TIMESTAMP', timestamps,
+                                   dtype=pl.Datetime('us'))])
+
+
+def load_time_index(filename):
+    path = time_index_file(filename)
+    if use_cache() and is_cache_valid(filename, path):
+        return pl.read_parquet(path)
+    index = build_time_index(filename)
+    if use_cache():
+        try:
+            write_cache(filename, path, lambda tmp, metadata:
+                        index.write_parquet(tmp, metadata=metadata))
+        except OSError:
+            pass
+    return index
+
+
+def byte_range(index, begin, end, size):
+    '''Return the start and stop byte offsets of the blocks of a trace
+    that may have rows between begin and end, and the row at the start.
+    '''
+    if not len(index):
+        return 0, 0, 0
+    offsets = index['OFFSET']
+    ts = index['TIMESTAMP']
+    start, stop, row = offsets[0], size, index[ROW_COLUMN][0]
+    if begin is not None:
+        # The first block beginning after begin, less the block before it
+        # and a margin block
+        i = ts.cum_max().search_sorted(begin)
+        start = offsets[max(i-2, 0)]
+        row = index[ROW_COLUMN][max(i-2, 0)]
+    if end is not None:
+        latest = ts.cum_min(reverse=True)
+        i = latest.search_sorted(end, side='right')
+        if i+1 < len(offsets):
+            stop = offsets[i+1]
+    return start, max(start, stop), row
+
+
+def in_range(begin, end):
+    ts = pl.col('TIMESTAMP')
+    if begin is None:
+        return ts <= end
+    if end is None:
+        return ts >= begin
+    return ts.is_between(begin, end)
+
+
+def read_range(filename, begin, end, rows=False):
+    '''Return a LazyFrame of the rows of a trace csv file between begin and
+    end, parsing only the part of the file in the range, and of it only the
+    columns selected from the LazyFrame. The ROW number of each row in the
+    file is added if rows is True.
+    '''
+    schema = read_schema(filename)
+    start, stop, row = byte_range(load_time_index(filename), begin, end,
+                                  os.path.getsize(filename))
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = f.read(stop-start)
+    if data:
+        progress_trace = pl.scan_csv(
+            io.BytesIO(data), has_header=False, new_columns=schema.names,
+            infer_schema=False, row_index_name=ROW_COLUMN if rows else None,
+            row_index_offset=row)
+    else:
+        names = ([ROW_COLUMN] if rows else []) + schema.names
+        progress_trace = pl.LazyFrame(
+            schema={name: pl.UInt32 if name == ROW_COLUMN else pl.String
+                    for name in names})
+    return progress_trace.select(([ROW_COLUMN] if rows else []) +
+                                 typed_columns(schema.names)).filter(
+        in_range(begin, end))
+
+
+def scan_file(filename, begin=None, end=None, rows=False):
+    '''Return a LazyFrame of a trace file, with the ROW number of each row
+    in the file if rows is True.
+    '''
+    if begin is not None or end is not None:
+        if compression(filename) is None and not (use_cache() and
+                                                  is_cache_valid(filename)):
+            return read_range(filename, begin, end, rows)
+        return scan_file(filename, rows=rows).filter(in_range(begin, end))
+    cache = cached_file(filename)
+    if cache is None:
+        return scan_csv_typed(filename, rows)
+    return pl.scan_parquet(cache,
+                           row_index_name=ROW_COLUMN if rows else None)
+
+
+def parse_time(t):
+    if isinstance(t, str):
+        return datetime.fromisoformat(t) if t else None
+    return t
+
+
+def select_columns(progress_trace, columns):
+    '''Select the columns of a trace that are in columns, in the order of
+    the trace, and the SOURCE column of traces of several files.
+    '''
+    names = progress_trace.collect_schema().names()
+    return progress_trace.select([c for c in names
+                                  if c in columns or c == SOURCE_COLUMN])
+
+
+def require_columns(progress_trace, columns):
+    '''Exit with an error if a trace doesn't have all of the columns.'''
+    names = progress_trace.collect_schema().names()
+    missing = [c for c in columns if c not in names]
+    if missing:
+        raise SystemExit("The trace doesn't have the columns "+
+                         ', '.join(missing))
+
+
+def scan_trace(path, begin=None, end=None, columns=None, rows=False):
+    '''Return a polars LazyFrame of a progress trace with typed columns,
+    optionally only the rows from begin to end, given as datetimes or ISO
+    format strings, and only the given columns that the trace has. Only
+    the selected columns are read from the trace. The ROW number of each
+    row in its file is added if rows is True or ROW is in columns.
+    '''
+    begin, end = parse_time(begin), parse_time(end)
+    rows = rows or (columns is not None and ROW_COLUMN in columns)
+    files = trace_files(path)
+    if len(files) == 1:
+        progress_trace = scan_file(files[0], begin, end, rows)
+    else:
+        workers = min(len(files), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            traces = list(pool.map(lambda f: scan_file(f, begin, end, rows),
+                                   files))
+        traces = [trace.with_columns(pl.lit(name).alias(SOURCE_COLUMN))
+                  for trace, name in zip(traces, files)]
+        progress_trace = pl.concat(traces, how='diagonal_relaxed').sort(
+            'TIMESTAMP', nulls_last=True, maintain_order=True)
+    if columns is not None:
+        progress_trace = select_columns(progress_trace, columns)
+    return progress_trace
+
+
+def read_trace(filename, columns=None, begin=None, end=None):
+    '''Return a pandas DataFrame of a progress trace with typed columns.
+    '''
+    progress_trace = scan_trace(filename, begin, end, columns)
+    if columns is not None:
+        progress_trace = progress_trace.select(columns)
+    df = progress_trace.collect().to_pandas()
+    # Order categories lexically, so group by sorts like for plain strings
+    for c in df.select_dtypes('category'):
+        df[c] = df[c].cat.set_categories(sorted(df[c].cat.categories))
+    return df
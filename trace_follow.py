@@ -0,0 +1,262 @@
+"""
+Event driven following of a progress trace file as NSO writes it.
+
+The Tailer wakes up on inotify events for the file (on Linux, polling the
+file otherwise), reads new data in bulk chunks and yields it in batches of
+complete lines. When the file is rotated, the rest of the old file is read
+before continuing from the beginning of the new file, and when it is
+truncated reading continues from the beginning.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import queue
+import struct
+import threading
+
+
+CHUNK_SIZE = 1 << 20
+# Number of batches read ahead by prefetch
+PREFETCH = 4
+POLL_INTERVAL = 0.1
+# Check the file even without inotify events, e.g. for file systems that
+# don't report all changes.
+CHECK_INTERVAL = 1.0
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE)
+
+inotify_event = struct.Struct('iIII')
+
+
+class Inotify():
+    '''Watch a directory with inotify, waking up in the asyncio loop when
+    any of the given names in it change.
+    '''
+    def __init__(self, directory, names):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                  WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch {directory} failed')
+        self.names = set(os.fsencode(n) for n in names)
+        self.changed = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.fd, self.read)
+
+    def read(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        i = 0
+        while i < len(data):
+            _, _, _, length = inotify_event.unpack_from(data, i)
+            i += inotify_event.size
+            name = data[i:i+length].rstrip(b'\0')
+            i += length
+            if name in self.names:
+                self.changed.set()
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.changed.clear()
+
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+
+class Tailer():
+    '''Follow a file from its end, yielding batches of new lines.
+
+    If the first line of the file starts with header, it is yielded as the
+    first batch before skipping to the end.
+    '''
+    def __init__(self, filename, header=None, chunk_size=CHUNK_SIZE,
+                 poll_interval=POLL_INTERVAL):
+        self.filename = filename
+        self.header = header
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.file = None
+        self.buffer = b''
+        self.inotify = None
+
+    def open(self):
+        self.file = open(self.filename, 'rb')
+        self.buffer = b''
+
+    def read_lines(self):
+        while True:
+            data = self.file.read(self.chunk_size)
+            if not data:
+                return []
+            data = self.buffer + data
+            end = data.rfind(b'\n') + 1
+            self.buffer = data[end:]
+            if end:
+                return decode_lines(data[:end])
+
+    def reopen_if_replaced(self):
+        '''Reopen the file if it has been rotated or truncated, return True
+        if there may be new data to read.
+        '''
+        try:
+            st = os.stat(self.filename)
+        except FileNotFoundError:
+            return False
+        if st.st_ino != os.fstat(self.file.fileno()).st_ino:
+            self.file.close()
+            self.open()
+            return True
+        if st.st_size < self.file.tell():
+            self.file.seek(0)
+            self.buffer = b''
+            return True
+        return False
+
+    async def wait(self):
+        if self.inotify is not None:
+            await self.inotify.wait(CHECK_INTERVAL)
+        else:
+            await asyncio.sleep(self.poll_interval)
+
+    async def batches(self):
+        self.open()
+        if self.header is not None:
+            line = self.file.readline().decode('utf-8', 'replace')
+            if line.startswith(self.header):
+                yield [line]
+        self.file.seek(0, os.SEEK_END)
+        try:
+            path = os.path.abspath(self.filename)
+            self.inotify = Inotify(os.path.dirname(path),
+                                   [os.path.basename(path)])
+        except (OSError, AttributeError):
+            self.inotify = None
+        try:
+            while True:
+                lines = self.read_lines()
+                if lines:
+                    yield lines
+                elif not self.reopen_if_replaced():
+                    await self.wait()
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+            self.file.close()
+
+
+def follow(filename, header=None):
+    '''generator function that yields batches of new lines in a file
+    '''
+    loop = asyncio.new_event_loop()
+    batches = Tailer(filename, header).batches()
+
+    async def next_batch():
+        return await batches.__anext__()
+
+    task = None
+    try:
+        while True:
+            task = loop.create_task(next_batch())
+            yield loop.run_until_complete(task)
+    finally:
+        # Stop a wait interrupted by e.g. KeyboardInterrupt.
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                loop.run_until_complete(task)
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+        loop.run_until_complete(batches.aclose())
+        loop.close()
+
+
+def read_batches(thefile, size=CHUNK_SIZE):
+    '''generator function that yields batches of lines in a file
+    '''
+    while True:
+        lines = thefile.readlines(size)
+        if not lines:
+            return
+        yield lines
+
+
+def read_chunks(thefile, size=CHUNK_SIZE):
+    '''generator function that yields chunks of bytes of a file
+    '''
+    while True:
+        data = thefile.read(size)
+        if not data:
+            return
+        yield data
+
+
+def decode_lines(data):
+    '''Return the lines of bytes ending with a newline, split only on
+    newlines like readline, so that other line breaks in a MESSAGE stay in
+    its row, and with \r\n line endings read as \n.
+    '''
+    lines = data.decode('utf-8', 'replace').split('\n')[:-1]
+    return [line.removesuffix('\r') + '\n' for line in lines]
+
+
+def split_lines(chunks):
+    '''generator function that yields batches of complete lines of chunks
+    of bytes
+    '''
+    buffer = b''
+    for data in chunks:
+        data = buffer + data
+        end = data.rfind(b'\n') + 1
+        buffer = data[end:]
+        if end:
+            yield decode_lines(data[:end])
+    if buffer:
+        yield [buffer.decode('utf-8', 'replace').removesuffix('\r')]
+
+
+def prefetch(batches, depth=PREFETCH):
+    '''generator function that reads batches ahead in a thread, e.g.
+    chunks of a compressed trace decompressed while the previous chunks are
+    handled
+    '''
+    done = object()
+    ahead = queue.Queue(depth)
+
+    def read():
+        try:
+            for batch in batches:
+                ahead.put(batch)
+        except Exception as e:
+            ahead.put(e)
+        ahead.put(done)
+
+    threading.Thread(target=read, daemon=True).start()
+    while True:
+        batch = ahead.get()
+        if batch is done:
+            return
+        if isinstance(batch, Exception):
+            raise batch
+        yield batch
@@ -0,0 +1,185 @@
+"""
+Replay of a progress trace in the viewer at a chosen speed, with pause and
+seeking.
+
+The events are decoded and applied to the view once when the trace is
+loaded, taking a checkpoint of the state of the view every
+CHECKPOINT_EVENTS events. Seeking to a timestamp restores the latest
+checkpoint before it and applies only the events from the checkpoint on,
+so a seek costs at most CHECKPOINT_EVENTS events regardless of how far into
+the trace it goes. While replaying, the events up to the trace time of a
+clock running at the replay speed are applied each frame, instead of
+sleeping between each pair of events.
+
+In a terminal the replay is controlled with keys: space pauses and
+resumes, + and - double and halve the speed, > and < seek SEEK_STEP
+seconds forward and back, and q stops the replay.
+"""
+
+from array import array
+from bisect import bisect_right
+import os
+import queue
+import sys
+import threading
+import time
+
+
+CHECKPOINT_EVENTS = 50000
+SEEK_STEP = 60.0
+# Longest sleep between frames, to handle keys while waiting for events
+MAX_SLEEP = 0.1
+
+
+class Clock():
+    '''Trace time running at a speed relative to wall clock time.'''
+    def __init__(self, ts=0.0, speed=1.0):
+        self.speed = speed
+        self.paused = False
+        self.set(ts)
+
+    def set(self, ts):
+        self.ts = ts
+        self.wall = time.monotonic()
+
+    def now(self):
+        if self.paused:
+            return self.ts
+        return self.ts+(time.monotonic()-self.wall)*self.speed
+
+    def set_speed(self, speed):
+        self.set(self.now())
+        self.speed = speed
+
+    def pause(self, paused):
+        self.set(self.now())
+        self.paused = paused
+
+
+class Replay():
+    '''Events of a trace replayed into a SpanView.
+
+    Events are added with add() while loading, which applies them to the
+    view and takes the checkpoints. run() then replays them from the start,
+    or from the timestamp seeked to.
+    '''
+    def __init__(self, view, speed=1.0, interval=CHECKPOINT_EVENTS):
+        self.view = view
+        self.events = []
+        # Latest timestamp up to each event, events out of order are
+        # replayed right away
+        self.times = array('d')
+        self.interval = interval
+        self.checkpoints = [view.checkpoint()]
+        self.position = 0
+        self.clock = Clock(speed=speed)
+        self.commands = queue.Queue()
+
+    def add(self, event):
+        ts = event[1]
+        if self.times:
+            ts = max(ts, self.times[-1])
+        if len(self.events) % self.interval == 0 and self.events:
+            self.checkpoints.append(self.view.checkpoint())
+        self.events.append(event)
+        self.times.append(ts)
+        self.view.event(*event)
+        self.position = len(self.events)
+
+    def seek(self, ts):
+        '''Restore the view to the state of all events up to a timestamp.'''
+        position = bisect_right(self.times, ts)
+        checkpoint = min(position // self.interval, len(self.checkpoints)-1)
+        if position < self.position or \
+           checkpoint*self.interval > self.position:
+            self.view.restore(self.checkpoints[checkpoint])
+            self.position = checkpoint*self.interval
+        self.apply(position)
+        self.clock.set(ts)
+
+    def apply(self, position):
+        view, events = self.view, self.events
+        for i in range(self.position, position):
+            view.event(*events[i])
+        self.position = position
+
+    def start_time(self):
+        return self.times[0] if self.times else 0.0
+
+    def handle(self, key):
+        clock = self.clock
+        if key == ' ':
+            clock.pause(not clock.paused)
+        elif key == '+':
+            clock.set_speed(clock.speed*2)
+        elif key == '-':
+            clock.set_speed(clock.speed/2)
+        elif key in '><':
+            step = SEEK_STEP if key == '>' else -SEEK_STEP
+            self.seek(max(clock.now()+step, self.start_time()))
+        elif key == 'q':
+            return False
+        return True
+
+    def status(self):
+        clock = self.clock
+        if clock.paused:
+            state = 'paused'
+        elif self.position == len(self.events):
+            state = 'ended'
+        else:
+            state = 'playing'
+        end = self.times[-1] if self.times else 0.0
+        position = max(min(clock.now(), end)-self.start_time(), 0.0)
+        return f'Replay {state} at {position:0.3f} s, speed x{clock.speed:g}'
+
+    def run(self, refresh):
+        '''Replay the events from the current position, calling refresh()
+        to show each frame, until the end of the trace or q is pressed.
+        '''
+        view, times = self.view, self.times
+        self.clock.set(self.clock.ts)
+        while True:
+            while not self.commands.empty():
+                if not self.handle(self.commands.get()):
+                    return
+            now = self.clock.now()
+            self.apply(bisect_right(times, now, lo=self.position))
+            view.status = self.status()
+            if view.frame_due():
+                refresh()
+            if self.position == len(times) and not self.clock.paused:
+                break
+            delay = MAX_SLEEP
+            if not self.clock.paused and self.position < len(times):
+                delay = min(delay, (times[self.position]-now) /
+                            self.clock.speed)
+            time.sleep(max(delay, 0.0))
+        view.status = self.status()
+        refresh()
+
+
+def read_keys(commands):
+    '''Put the keys pressed in the terminal in a queue, from a daemon
+    thread, with the terminal in cbreak mode until the program exits.
+    '''
+    if not sys.stdin.isatty():
+        return
+    try:
+        import termios
+        import tty
+    except ImportError:
+        return
+    import atexit
+    fd = sys.stdin.fileno()
+    attributes = termios.tcgetattr(fd)
+    atexit.register(termios.tcsetattr, fd, termios.TCSADRAIN, attributes)
+    tty.setcbreak(fd)
+
+    def read():
+        while True:
+            key = os.read(fd, 1).decode(errors='replace')
+            if not key:
+                return
+            commands.put(key)
+    threading.Thread(target=read, daemon=True).start()
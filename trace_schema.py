@@ -0,0 +1,167 @@
+"""
+Column layouts of progress trace csv files.
+
+The header of a trace is resolved once into a Schema holding the index of
+each column, instead of deciding the NSO version from the number of columns
+of every row. Traces without a header are resolved from the number of
+columns of the first row.
+
+Traces compressed with gzip or zstd are decompressed while read.
+"""
+
+import csv
+import io
+from operator import itemgetter
+import os
+
+
+NSO_5_COLUMNS = [
+    'EVENT TYPE', 'TIMESTAMP', 'DURATION', 'SESSION ID', 'TRANSACTION ID',
+    'DATASTORE', 'CONTEXT', 'TRACE ID', 'SUBSYSTEM', 'PHASE', 'SERVICE',
+    'SERVICE PHASE', 'COMMIT QUEUE ID', 'NODE', 'DEVICE', 'DEVICE PHASE',
+    'PACKAGE', 'MESSAGE', 'ANNOTATION']
+
+NSO_6_0_COLUMNS = [
+    'EVENT TYPE', 'TIMESTAMP', 'DURATION', 'TRACE ID', 'SPAN ID',
+    'PARENT SPAN ID', 'SESSION ID', 'TRANSACTION ID', 'DATASTORE', 'CONTEXT',
+    'SUBSYSTEM', 'PHASE', 'SERVICE', 'SERVICE PHASE', 'COMMIT QUEUE ID',
+    'NODE', 'DEVICE', 'DEVICE PHASE', 'PACKAGE', 'MESSAGE', 'ANNOTATION']
+
+NSO_6_1_COLUMNS = [
+    'EVENT TYPE', 'TIMESTAMP', 'DURATION', 'TRACE ID', 'SPAN ID',
+    'PARENT SPAN ID', 'SESSION ID', 'TRANSACTION ID', 'DATASTORE', 'CONTEXT',
+    'SUBSYSTEM', 'MESSAGE', 'ANNOTATION', 'ATTRIBUTE NAME', 'ATTRIBUTE VALUE',
+    'LINK TRACE ID', 'LINK SPAN ID']
+
+# Layouts of traces without a header, by number of columns.
+LAYOUTS = {
+    17: NSO_6_1_COLUMNS,
+    18: [c for c in NSO_5_COLUMNS if c != 'TRACE ID'],
+    19: NSO_5_COLUMNS,
+    21: NSO_6_0_COLUMNS,
+}
+
+HEADER_START = 'EVENT TYPE'
+
+COMPRESSION = {'.gz': 'gzip', '.zst': 'zstd', '.zstd': 'zstd'}
+READ_BUFFER_SIZE = 1 << 20
+
+# Number of columns, ending with MESSAGE, that together with the
+# transaction id identify a span.
+KEY_COLUMNS = 7
+
+
+class Schema():
+    def __init__(self, names, has_header=True):
+        self.names = list(names)
+        self.has_header = has_header
+        self.columns = len(self.names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        message = self.index['MESSAGE']
+        self.key = slice(max(message+1-KEY_COLUMNS, 0), message+1)
+        self.fields = itemgetter(*[self.index[c] for c in [
+            'EVENT TYPE', 'TIMESTAMP', 'DURATION', 'TRANSACTION ID',
+            'DATASTORE', 'MESSAGE']])
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def decode(self, row):
+        '''Return (event type, timestamp, duration, transaction id,
+        datastore, message, span key) of a row parsed by csv.
+        '''
+        tag, ts, duration, tid, datastore, message = self.fields(row)
+        key = '-'.join([tid]+row[self.key]).replace('"', '')
+        return tag, ts, duration, tid, datastore, message, key
+
+    def decode_line(self, line):
+        '''Decode a line of a trace, or return None if it doesn't match the
+        layout. Lines are split on comma and only fall back to the csv module
+        when a quoted column contains a comma.
+        '''
+        row = line.rstrip('\r\n').split(',')
+        if len(row) != self.columns:
+            row = next(csv.reader([line]), [])
+            if len(row) != self.columns:
+                return None
+            return self.decode(row)
+        tag, ts, duration, tid, datastore, message = self.fields(row)
+        if message[:1] == '"':
+            message = message[1:-1].replace('""', '"')
+        key = '-'.join([tid]+row[self.key]).replace('"', '')
+        return tag, ts, duration, tid, datastore, message, key
+
+
+def resolve(row):
+    '''Return the Schema given the first row of a trace.
+    '''
+    if row and row[0] == HEADER_START:
+        return Schema(row)
+    if len(row) in LAYOUTS:
+        return Schema(LAYOUTS[len(row)], has_header=False)
+    raise ValueError("Unsupported number of columns in progress trace "+
+                     f"{len(row)}")
+
+
+def compression(filename):
+    return COMPRESSION.get(os.path.splitext(filename)[1])
+
+
+def open_binary(filename):
+    '''Open a trace file for reading bytes, decompressing gzip and zstd
+    compressed files. pyarrow decompresses without holding the GIL.
+    '''
+    codec = compression(filename)
+    if codec is None:
+        return open(filename, 'rb')
+    import pyarrow
+    return pyarrow.input_stream(filename, compression=codec,
+                                buffer_size=READ_BUFFER_SIZE)
+
+
+def open_trace(filename, newline=''):
+    '''Open a trace file for reading text, decompressing gzip and zstd
+    compressed files.
+    '''
+    if compression(filename) is None:
+        return open(filename, 'r', newline=newline)
+    return io.TextIOWrapper(open_binary(filename), encoding='utf-8',
+                            newline=newline)
+
+
+def read_schema(filename):
+    with open_trace(filename) as f:
+        return resolve(next(csv.reader(f), []))
+
+
+class Decoder():
+    '''Decode the lines of a trace, possibly read in several batches,
+    resolving the column layout from the first line. Rows with another
+    number of columns than the layout are passed to errors, if given, and
+    skipped, as are repeated headers, e.g. from a rotated file.
+    '''
+    def __init__(self, errors=None):
+        self.schema = None
+        self.errors = errors
+
+    def rows(self, lines):
+        schema = self.schema
+        for line in lines:
+            if schema is None:
+                schema = self.schema = resolve(next(csv.reader([line]), []))
+                if schema.has_header:
+                    continue
+            row = schema.decode_line(line)
+            if row is None:
+                if self.errors is not None:
+                    self.errors(next(csv.reader([line]), []))
+                continue
+            if row[0] == HEADER_START:
+                continue
+            yield row
+
+
+def decode_rows(lines, errors=None):
+    '''Generator decoding the lines of a trace.
+    '''
+    return Decoder(errors).rows(lines)
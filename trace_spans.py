@@ -0,0 +1,123 @@
+"""
+Spans of a whole progress trace computed at once with polars, for the batch
+mode of the viewer.
+
+The events are read with trace_cache, and the spans are found with the same
+rules as span_view.SpanView applies event by event. A stop ends the latest
+span started with the same key, and a start ends a running span of the same
+key. A matched stop of 'grabbing transaction lock' starts a 'holding
+transaction lock' span of the transaction, ended by the next 'releasing
+transaction lock' of the transaction. The starts and stops are matched with
+as-of joins on the row of each event, by key.
+"""
+
+import polars as pl
+
+from trace_cache import scan_trace
+from trace_schema import read_schema
+
+
+GRAB_LOCK = 'grabbing transaction lock'
+RELEASE_LOCK = 'releasing transaction lock'
+HOLD_LOCK = 'holding transaction lock'
+
+
+def as_string(name):
+    return pl.col(name).cast(pl.String).fill_null('')
+
+
+def scan_events(filename, operational=False, events=None, tids=None):
+    '''Return a LazyFrame of the EVENT TYPE, TS in seconds, DURATION,
+    TRANSACTION ID, MESSAGE and span KEY of the events shown by the viewer,
+    in the order of the trace.
+    '''
+    schema = read_schema(filename)
+    key = schema.names[schema.key]
+    columns = ['EVENT TYPE', 'TIMESTAMP', 'DURATION', 'TRANSACTION ID',
+               'DATASTORE', 'MESSAGE'] + key
+    pt = scan_trace(filename, columns=columns).filter(
+        pl.col('TIMESTAMP').is_not_null())
+    if not operational:
+        pt = pt.filter(as_string('DATASTORE') != 'operational')
+    if events is not None:
+        pt = pt.filter(pl.col('MESSAGE').cast(pl.String).is_in(events))
+    if tids:
+        pt = pt.filter(as_string('TRANSACTION ID').is_in(tids))
+    return pt.select(
+        as_string('EVENT TYPE').alias('EVENT TYPE'),
+        (pl.col('TIMESTAMP').dt.epoch('us')/1e6).alias('TS'),
+        pl.col('DURATION').fill_null(0.0),
+        as_string('TRANSACTION ID').alias('TRANSACTION ID'),
+        as_string('MESSAGE').alias('MESSAGE'),
+        pl.concat_str([as_string(c) for c in ['TRANSACTION ID'] + key],
+                      separator='-').str.replace_all(
+                          '"', '', literal=True).alias('KEY'))
+
+
+def match(stops, starts):
+    '''Add the SPAN ended by each stop, the latest of the starts with the
+    same KEY before it.
+    '''
+    return stops.join_asof(
+        starts.select(pl.col('ORDER').alias('START ORDER'), 'KEY', 'SPAN'),
+        left_on='ORDER', right_on='START ORDER', by='KEY',
+        strategy='backward', check_sortedness=False)
+
+
+def spans(events):
+    '''Return the spans of the events, in the order they are started, as
+    MESSAGE, TRANSACTION ID, BEGIN and STOP offsets from the first event,
+    null while running, and the DURATIONS of the stops ending them.
+    '''
+    # Events are ordered by ORDER, an event started by another event comes
+    # right after it.
+    events = events.with_row_index('ORDER').with_columns(
+        pl.col('ORDER').cast(pl.Int64)*2,
+        (pl.col('TS')-pl.col('TS').first()).alias('OFFSET'))
+    starts = events.filter(pl.col('EVENT TYPE') == 'start').with_row_index(
+        'SPAN')
+    stops = events.filter(pl.col('EVENT TYPE') == 'stop')
+
+    # Transaction lock spans, held from a matched stop of grabbing the lock
+    # until the next release of it in the same transaction
+    hold_key = pl.col('TRANSACTION ID') + f'-{HOLD_LOCK}'
+    grabs = match(stops.filter(pl.col('MESSAGE') == GRAB_LOCK),
+                  starts).filter(pl.col('SPAN').is_not_null()).select(
+        pl.col('ORDER')+1, 'TS', 'OFFSET', 'TRANSACTION ID',
+        pl.lit(HOLD_LOCK).alias('MESSAGE'), hold_key.alias('KEY'))
+    releases = events.filter((pl.col('EVENT TYPE') == 'info') &
+                             (pl.col('MESSAGE') == RELEASE_LOCK)).select(
+        'ORDER', 'TS', 'OFFSET', 'TRANSACTION ID', 'MESSAGE',
+        hold_key.alias('KEY'))
+    locks = pl.concat([grabs, releases]).sort('ORDER')
+    grabbed = (pl.col('MESSAGE').shift(1) == HOLD_LOCK).over('KEY')
+    releases = locks.with_columns(
+        (pl.col('TS')-pl.col('TS').shift(1).over('KEY')).alias('DURATION')
+    ).filter((pl.col('MESSAGE') == RELEASE_LOCK) & grabbed.fill_null(False))
+
+    starts = pl.concat([starts.select('ORDER', 'OFFSET', 'TRANSACTION ID',
+                                      'MESSAGE', 'KEY'),
+                        grabs.select('ORDER', 'OFFSET', 'TRANSACTION ID',
+                                     'MESSAGE', 'KEY')]).sort(
+        'ORDER').with_row_index('SPAN')
+    stops = pl.concat([stops.select('ORDER', 'OFFSET', 'DURATION', 'KEY'),
+                       releases.select('ORDER', 'OFFSET', 'DURATION', 'KEY')]
+                      ).sort('ORDER')
+    ended = match(stops, starts).filter(pl.col('SPAN').is_not_null()).sort(
+        'ORDER').group_by('SPAN').agg(pl.col('OFFSET').last().alias('STOP'),
+                                      pl.col('DURATION').alias('DURATIONS'))
+    # A running span is ended by the next start of the same key
+    return starts.with_columns(
+        pl.col('OFFSET').shift(-1).over('KEY').alias('NEXT')).join(
+        ended, on='SPAN', how='left').sort('SPAN').select(
+        'MESSAGE', 'TRANSACTION ID', pl.col('OFFSET').alias('BEGIN'),
+        pl.coalesce('STOP', 'NEXT').alias('STOP'), 'DURATIONS')
+
+
+def size(events):
+    '''Return the offset of the last event from the first, the size of the
+    timeline of the viewer after all events.
+    '''
+    if events.is_empty():
+        return 0.0
+    return events['TS'][-1]-events['TS'][0]
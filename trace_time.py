@@ -0,0 +1,105 @@
+"""
+Decoding of progress trace timestamps.
+
+NSO writes timestamps in a fixed format, YYYY-MM-DDTHH:MM:SS.ffffff, so a
+whole column of them is decoded at once by taking the digits at fixed
+positions of the strings as arrays, without creating a datetime per
+timestamp. Timestamps are returned as int64 microseconds since the epoch,
+taking the timestamps as UTC. Values in another ISO format are decoded one
+by one, and values that aren't timestamps, e.g. empty, become NAT.
+"""
+
+from datetime import datetime, timezone
+
+import numpy
+
+
+NAT = numpy.iinfo(numpy.int64).min
+TIMESTAMP_LENGTH = 26
+# Positions of the separators, and of the digits of the year, month, day,
+# hour, minute, second and microseconds in a timestamp.
+SEPARATORS = {4: '-', 7: '-', 10: 'T', 13: ':', 16: ':', 19: '.'}
+FIELDS = [(0, 4), (5, 7), (8, 10), (11, 13), (14, 16), (17, 19), (20, 26)]
+DAYS_IN_MONTH = numpy.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+CHUNK_SIZE = 1 << 18
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def days_from_civil(year, month, day):
+    '''Return the days since 1970-01-01 of dates of the proleptic Gregorian
+    calendar, for arrays of years, months and days.
+    '''
+    year = year - (month <= 2)
+    era = year // 400
+    yoe = year - era*400
+    doy = (153*((month+9) % 12)+2)//5 + day-1
+    doe = yoe*365 + yoe//4 - yoe//100 + doy
+    return era*146097 + doe - 719468
+
+
+def decode_timestamp(value):
+    '''Return the microseconds since the epoch of a timestamp in any ISO
+    format, or NAT.
+    '''
+    try:
+        t = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return NAT
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return (t-EPOCH) // (t.resolution)
+
+
+def decode_chunk(values):
+    # One code point per column, a longer string has a code point in the
+    # last column.
+    chars = values.astype(f'U{TIMESTAMP_LENGTH+1}').view(numpy.uint32)
+    chars = chars.reshape(len(values), TIMESTAMP_LENGTH+1)
+    valid = chars[:, TIMESTAMP_LENGTH] == 0
+    for i, sep in SEPARATORS.items():
+        valid &= chars[:, i] == ord(sep)
+    fields = []
+    for begin, end in FIELDS:
+        field = numpy.zeros(len(values), dtype=numpy.int64)
+        for i in range(begin, end):
+            # Code points below '0' wrap around to large digits
+            digit = chars[:, i] - numpy.uint32(ord('0'))
+            valid &= digit <= 9
+            field *= 10
+            field += digit
+        fields.append(field)
+    year, month, day, hour, minute, second, micro = fields
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    valid &= (month >= 1) & (month <= 12) & (day >= 1)
+    valid &= day <= DAYS_IN_MONTH[numpy.clip(month, 1, 12)-1] + (
+        (month == 2) & leap)
+    valid &= (hour < 24) & (minute < 60) & (second < 60)
+    seconds = ((days_from_civil(year, month, day)*24 + hour)*60 +
+               minute)*60 + second
+    us = numpy.where(valid, seconds*1000000 + micro, NAT)
+    for i in numpy.flatnonzero(~valid):
+        us[i] = decode_timestamp(values[i])
+    return us
+
+
+def decode_timestamps(values):
+    '''Return an int64 array of the microseconds since the epoch of a
+    sequence of timestamp strings, with NAT for values that aren't
+    timestamps.
+    '''
+    values = numpy.asarray(values)
+    if values.dtype.kind not in 'UO':
+        values = values.astype(str)
+    us = numpy.empty(len(values), dtype=numpy.int64)
+    for start in range(0, len(values), CHUNK_SIZE):
+        us[start:start+CHUNK_SIZE] = decode_chunk(
+            values[start:start+CHUNK_SIZE])
+    return us
+
+
+def to_datetime64(us):
+    '''Return microseconds since the epoch as numpy datetime64, with NAT
+    as NaT.
+    '''
+    return numpy.asarray(us, dtype=numpy.int64).view('datetime64[us]')